@@ -0,0 +1,153 @@
+import math
+import logging
+from statistics import NormalDist
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cell = (model, task, technique); group = (model, task), the cells competing for a ranking
+Cell = Tuple[str, str, str]
+
+
+def confidence_interval(values: List[float], z: float) -> Tuple[float, float]:
+    """Mean and normal-approximation half-width of a [0, 1] metric.
+
+    One pseudo-observation at 0 and one at 1 go into the variance, so a
+    handful of identical scores does not look certain.
+    """
+    if not values:
+        return 0.0, math.inf
+    n = len(values)
+    mean = sum(values) / n
+    padded = values + [0.0, 1.0]
+    padded_mean = sum(padded) / len(padded)
+    variance = sum((value - padded_mean) ** 2 for value in padded) / (len(padded) - 1)
+    return mean, z * math.sqrt(variance / n)
+
+
+class SuccessiveHalving:
+    """Allocates items to (model, task, technique) cells in rounds.
+
+    Every active cell in a (model, task) group is evaluated on the same
+    leading items of the task; the target doubles each round. After a round
+    a cell stops when its confidence interval lies wholly below the group
+    leader's ("dominated") or is narrower than `precision` ("converged").
+    Then only the best 1/eta of the group's remaining cells, by mean, go on
+    ("halved" for the rest). Cells still active at the full sample count
+    end as "complete".
+    """
+
+    def __init__(self, metric: str = "f1_score", initial: int = 4, eta: float = 2.0,
+                 precision: float = 0.05, confidence: float = 0.95):
+        self.metric = metric
+        self.initial = initial
+        self.eta = eta
+        self.precision = precision
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.round = 0
+        self.cells = {}
+        self._groups = {}
+        self._limits = {}
+
+    def start(self, groups: Dict[Hashable, List[Cell]], max_samples: Dict[Hashable, int]):
+        """Register each group's cells and the number of items its task has."""
+        self._groups = {group: list(cells) for group, cells in groups.items()}
+        self._limits = dict(max_samples)
+        self.cells = {
+            cell: {"values": [], "samples": 0, "status": "active", "stopped_round": None}
+            for cells in groups.values() for cell in cells
+        }
+        self.round = 0
+
+    def targets(self) -> Dict[Cell, int]:
+        """Items each active cell should have after this round; empty once allocation is finished."""
+        targets = {}
+        for group, cells in self._groups.items():
+            target = min(self._limits[group], self.initial * 2 ** self.round)
+            for cell in cells:
+                state = self.cells[cell]
+                if state["status"] == "active" and state["samples"] < target:
+                    targets[cell] = target
+        return targets
+
+    def record(self, cell: Cell, samples: int, metrics: List[Optional[Dict[str, float]]]):
+        """Add a round's item metrics for a cell; failed items (None) count as sampled but not scored."""
+        state = self.cells[cell]
+        state["samples"] = samples
+        state["values"].extend(m[self.metric] for m in metrics if m is not None)
+
+    def _stop(self, cell: Cell, status: str):
+        self.cells[cell]["status"] = status
+        self.cells[cell]["stopped_round"] = self.round
+
+    def advance(self):
+        """Apply the stopping rules to the round just recorded and move to the next round."""
+        for group, cells in self._groups.items():
+            active = [cell for cell in cells if self.cells[cell]["status"] == "active"]
+            if not active:
+                continue
+            if all(self.cells[cell]["samples"] >= self._limits[group] for cell in active):
+                for cell in active:
+                    self._stop(cell, "complete")
+                continue
+
+            intervals = {cell: confidence_interval(self.cells[cell]["values"], self.z) for cell in cells}
+            best_lower = max(mean - half for mean, half in (intervals[cell] for cell in active))
+            for cell in active:
+                mean, half = intervals[cell]
+                if mean + half < best_lower:
+                    self._stop(cell, "dominated")
+                elif half <= self.precision:
+                    self._stop(cell, "converged")
+
+            contested = sorted((cell for cell in active if self.cells[cell]["status"] == "active"),
+                               key=lambda cell: intervals[cell][0], reverse=True)
+            keep = max(1, math.ceil(len(contested) / self.eta))
+            for cell in contested[keep:]:
+                self._stop(cell, "halved")
+        self.round += 1
+
+    def report(self) -> Dict[str, Any]:
+        """Per-cell sample count, mean, interval half-width and stopping reason."""
+        cells = []
+        for (model, task, technique), state in self.cells.items():
+            mean, half = confidence_interval(state["values"], self.z)
+            cells.append({
+                "model": model, "task": task, "technique": technique,
+                "samples": state["samples"], "scored": len(state["values"]),
+                self.metric: round(mean, 4), "ci_half_width": round(half, 4) if half != math.inf else None,
+                "status": state["status"], "stopped_round": state["stopped_round"]
+            })
+        return {
+            "metric": self.metric,
+            "rounds": self.round,
+            "samples_used": sum(state["samples"] for state in self.cells.values()),
+            "samples_full": sum(self._limits[group] * len(cells) for group, cells in self._groups.items()),
+            "cells": cells
+        }
+
+
+def add_adaptive_arguments(parser):
+    """Add the adaptive (successive halving) sweep flags to an argparse parser."""
+    group = parser.add_argument_group("adaptive sampling")
+    group.add_argument("--adaptive", action="store_true",
+                       help="Allocate samples in rounds, dropping techniques that are clearly behind or already precise")
+    group.add_argument("--adaptive-initial", type=int, default=4,
+                       help="Items per cell in the first round; doubles every round (default: 4)")
+    group.add_argument("--adaptive-eta", type=float, default=2.0,
+                       help="Keep the best 1/eta of each group's contested techniques per round; 1 disables halving (default: 2)")
+    group.add_argument("--adaptive-precision", type=float, default=0.05,
+                       help="Stop a cell once its confidence interval half-width is this narrow (default: 0.05)")
+    group.add_argument("--adaptive-confidence", type=float, default=0.95,
+                       help="Confidence level of the intervals (default: 0.95)")
+    group.add_argument("--adaptive-metric", default="f1_score",
+                       choices=["f1_score", "bleu_score", "rouge1", "rouge2", "rougeL"],
+                       help="Metric the techniques are ranked by (default: f1_score)")
+    return group
+
+
+def halving_from_args(args) -> Optional[SuccessiveHalving]:
+    if not args.adaptive:
+        return None
+    return SuccessiveHalving(args.adaptive_metric, initial=args.adaptive_initial, eta=args.adaptive_eta,
+                             precision=args.adaptive_precision, confidence=args.adaptive_confidence)
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_DIR = os.path.join("evaluation_results", "batches")
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Provider limit on requests per batch file
+MAX_BATCH_REQUESTS = 50000
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_line(custom_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """One line of a batch input file: a chat.completions request tagged with `custom_id`."""
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def _job_name(custom_ids: List[str]) -> str:
+    # Same requests -> same name, so a rerun finds the jobs an earlier run submitted
+    digest = hashlib.sha256("\n".join(sorted(custom_ids)).encode("utf-8")).hexdigest()
+    return f"batch-{digest[:16]}"
+
+
+class BatchRunner:
+    """Runs chat requests through the provider's asynchronous batch API.
+
+    Requests are written as JSONL batch files (split at the provider's
+    per-file limit), uploaded and submitted, then polled until every job
+    reaches a terminal state. Submitted job ids are saved under `batch_dir`,
+    keyed by the set of requests, so an interrupted run reattaches to its jobs
+    instead of paying for them twice. Works with any client exposing the
+    OpenAI `files` and `batches` resources, including one pointed at the
+    mock server's stand-in endpoints.
+    """
+
+    def __init__(self, client, batch_dir: str = DEFAULT_BATCH_DIR, poll_interval: float = 30.0,
+                 completion_window: str = "24h", max_requests: int = MAX_BATCH_REQUESTS):
+        self.client = client
+        self.batch_dir = batch_dir
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_requests = max_requests
+
+    def _state_path(self, name: str) -> str:
+        return os.path.join(self.batch_dir, f"{name}.json")
+
+    def _load_state(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._state_path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self, name: str, state: Dict[str, Any]):
+        path = self._state_path(name)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def write(self, lines: List[Dict[str, Any]], path: str) -> str:
+        """Write batch lines as a JSONL input file."""
+        with open(path, "w") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return path
+
+    def submit(self, path: str, metadata: Optional[Dict[str, str]] = None) -> str:
+        """Upload a batch input file, start a job for it and return the job id."""
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=self.completion_window, metadata=metadata)
+        logger.info(f"Submitted batch {batch.id} ({path})")
+        return batch.id
+
+    def wait(self, batch_ids: List[str]) -> Dict[str, Any]:
+        """Poll until every job is in a terminal state; return the final job objects."""
+        finished = {}
+        while True:
+            for batch_id in batch_ids:
+                if batch_id in finished:
+                    continue
+                batch = self.client.batches.retrieve(batch_id)
+                counts = batch.request_counts
+                if counts is not None:
+                    logger.info(f"Batch {batch_id}: {batch.status} "
+                                f"({counts.completed + counts.failed}/{counts.total} requests done)")
+                if batch.status in TERMINAL_STATUSES:
+                    finished[batch_id] = batch
+            if len(finished) == len(batch_ids):
+                return finished
+            time.sleep(self.poll_interval)
+
+    def _read_file(self, file_id: Optional[str]) -> List[Dict[str, Any]]:
+        if not file_id:
+            return []
+        content = self.client.files.content(file_id).text
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def results(self, batch) -> Dict[str, Dict[str, Any]]:
+        """custom_id -> completion body, or {"error": message} for a request that failed."""
+        results = {}
+        for line in self._read_file(batch.output_file_id) + self._read_file(batch.error_file_id):
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code") != 200:
+                error = line.get("error") or (response.get("body") or {}).get("error") or {}
+                message = error.get("message") if isinstance(error, dict) else str(error)
+                results[line["custom_id"]] = {"error": f"HTTP {response.get('status_code')}: {message}"}
+            else:
+                results[line["custom_id"]] = response["body"]
+        if batch.status != "completed":
+            logger.warning(f"Batch {batch.id} ended as {batch.status}; {len(results)} results returned")
+        return results
+
+    def run(self, requests: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Run (custom_id, body) requests to completion and return their results by custom_id.
+
+        Requests missing from the job outputs (e.g. the job expired first)
+        come back as errors.
+        """
+        if not requests:
+            return {}
+        os.makedirs(self.batch_dir, exist_ok=True)
+        name = _job_name([custom_id for custom_id, _ in requests])
+        state = self._load_state(name)
+        if state:
+            logger.info(f"Reattaching to batch jobs {state['batch_ids']} from {self._state_path(name)}")
+        else:
+            state = {"batch_ids": [], "requests": len(requests)}
+            for start in range(0, len(requests), self.max_requests):
+                chunk = requests[start:start + self.max_requests]
+                path = self.write([batch_line(custom_id, body) for custom_id, body in chunk],
+                                  os.path.join(self.batch_dir, f"{name}-{start // self.max_requests}.jsonl"))
+                state["batch_ids"].append(self.submit(path, {"job": name}))
+                # Saved after every submission so a crash never orphans a paid-for job
+                self._save_state(name, state)
+
+        results = {}
+        for batch in self.wait(state["batch_ids"]).values():
+            results.update(self.results(batch))
+        for custom_id, _ in requests:
+            results.setdefault(custom_id, {"error": "no result in batch output"})
+
+        failed = sum(1 for result in results.values() if "error" in result)
+        logger.info(f"Batch job {name}: {len(results) - failed} succeeded, {failed} failed")
+        os.remove(self._state_path(name))
+        return results
+
+
+def add_batch_arguments(parser):
+    """Add the batch execution flags to an argparse parser."""
+    group = parser.add_argument_group("batch execution")
+    group.add_argument("--batch", action="store_true",
+                       help="Run the sweep through the provider batch API instead of synchronous calls")
+    group.add_argument("--batch-dir", default=DEFAULT_BATCH_DIR, metavar="DIR",
+                       help=f"Batch input files and submitted job ids (default: {DEFAULT_BATCH_DIR})")
+    group.add_argument("--batch-poll-interval", type=float, default=30.0,
+                       help="Seconds between batch status checks (default: 30)")
+    return group
+
+
+def batch_runner_from_args(args, client) -> Optional[BatchRunner]:
+    if not args.batch:
+        return None
+    return BatchRunner(client, batch_dir=args.batch_dir, poll_interval=args.batch_poll_interval)
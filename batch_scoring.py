@@ -0,0 +1,200 @@
+import re
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from nltk.stem import porter
+
+logger = logging.getLogger(__name__)
+
+METRIC_NAMES = ["f1_score", "bleu_score", "rouge1", "rouge2", "rougeL"]
+
+# Same tokenization rules as rouge_score.tokenize
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+_VALID_TOKEN = re.compile(r"^[a-z0-9]+$")
+
+# nltk's method1 smoothing epsilon
+_BLEU_EPSILON = 0.1
+
+
+class _Analysis:
+    """Token-id arrays and n-gram counts computed once per unique string."""
+    __slots__ = ("words", "word_set", "stems", "ngrams")
+
+    def __init__(self, words: np.ndarray, stems: np.ndarray):
+        self.words = words
+        self.word_set = np.unique(words)
+        self.stems = stems
+        self.ngrams = {}
+
+
+def _ngram_counts(ids: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the unique n-grams of an id array (as void rows) and their counts."""
+    if len(ids) < n:
+        return np.empty(0, dtype=np.dtype((np.void, ids.dtype.itemsize * n))), np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(ids, n)
+    rows = np.ascontiguousarray(windows).view(np.dtype((np.void, ids.dtype.itemsize * n))).ravel()
+    return np.unique(rows, return_counts=True)
+
+
+def _clipped_overlap(a: Tuple[np.ndarray, np.ndarray], b: Tuple[np.ndarray, np.ndarray]) -> int:
+    """Sum of min(count_a, count_b) over n-grams present in both."""
+    _, a_index, b_index = np.intersect1d(a[0], b[0], assume_unique=True, return_indices=True)
+    return int(np.minimum(a[1][a_index], b[1][b_index]).sum())
+
+
+def _lcs_length(a: np.ndarray, b: np.ndarray) -> int:
+    """Longest common subsequence length using a bit-parallel row update."""
+    if len(a) == 0 or len(b) == 0:
+        return 0
+    # One bitmask per token of `a` marking the positions where it occurs
+    masks = {}
+    for position, token in enumerate(a.tolist()):
+        masks[token] = masks.get(token, 0) | (1 << position)
+    full = (1 << len(a)) - 1
+    row = full
+    for token in b.tolist():
+        matches = row & masks.get(token, 0)
+        row = ((row + matches) | (row - matches)) & full
+    return len(a) - bin(row).count("1")
+
+
+def _f_measure(overlap: np.ndarray, reference_total: np.ndarray, prediction_total: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(prediction_total > 0, overlap / prediction_total, 0.0)
+        recall = np.where(reference_total > 0, overlap / reference_total, 0.0)
+        f = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return f
+
+
+class BatchScorer:
+    """Score many (reference, prediction) pairs at once.
+
+    Matches ModelEvaluator's metrics: set-overlap F1 and sentence BLEU with
+    method1 smoothing on whitespace tokens of the normalized text, and
+    ROUGE-1/2/L F-measure on rouge_score's stemmed tokens. Each unique string
+    is normalized, tokenized and stemmed once per scorer.
+    """
+
+    def __init__(self, normalize: Optional[Callable[[str], str]] = None,
+                 short_answer_weights: bool = True, use_stemmer: bool = True):
+        self.normalize = normalize or (lambda text: text)
+        self.short_answer_weights = short_answer_weights
+        self._stemmer = porter.PorterStemmer() if use_stemmer else None
+        self._vocab = {}
+        self._stem_cache = {}
+        self._analyses = {}
+
+    def _ids(self, tokens: List[str]) -> np.ndarray:
+        vocab = self._vocab
+        return np.fromiter((vocab.setdefault(t, len(vocab)) for t in tokens), dtype=np.int64, count=len(tokens))
+
+    def _stem(self, token: str) -> str:
+        stem = self._stem_cache.get(token)
+        if stem is None:
+            stem = self._stemmer.stem(token) if self._stemmer and len(token) > 3 else token
+            self._stem_cache[token] = stem
+        return stem
+
+    def analyze(self, text: str) -> _Analysis:
+        analysis = self._analyses.get(text)
+        if analysis is None:
+            normalized = self.normalize(text)
+            words = normalized.split()
+            rouge_tokens = [
+                self._stem(t) for t in _NON_ALPHANUMERIC.sub(" ", normalized.lower()).split()
+                if _VALID_TOKEN.match(t)
+            ]
+            analysis = _Analysis(self._ids(words), self._ids(rouge_tokens))
+            self._analyses[text] = analysis
+        return analysis
+
+    def _ngrams(self, analysis: _Analysis, source: str, n: int):
+        key = (source, n)
+        counts = analysis.ngrams.get(key)
+        if counts is None:
+            counts = _ngram_counts(getattr(analysis, source), n)
+            analysis.ngrams[key] = counts
+        return counts
+
+    def _bleu(self, reference: _Analysis, prediction: _Analysis) -> float:
+        candidate_length = len(prediction.words)
+        reference_length = len(reference.words)
+        if not reference_length or not candidate_length:
+            return 0.0
+        max_n = 1 if self.short_answer_weights and candidate_length < 4 else 4
+        log_precision = 0.0
+        for n in range(1, max_n + 1):
+            matches = _clipped_overlap(self._ngrams(reference, "words", n), self._ngrams(prediction, "words", n))
+            total = max(1, candidate_length - n + 1)
+            if matches == 0:
+                if n == 1:
+                    return 0.0
+                precision = _BLEU_EPSILON / total
+            else:
+                precision = matches / total
+            log_precision += np.log(precision) / max_n
+        if candidate_length > reference_length:
+            brevity_penalty = 1.0
+        else:
+            brevity_penalty = np.exp(1 - reference_length / candidate_length)
+        return float(brevity_penalty * np.exp(log_precision))
+
+    def score(self, references: Sequence[str], predictions: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return a dict of per-item score arrays keyed by metric name."""
+        if len(references) != len(predictions):
+            raise ValueError("references and predictions must have the same length")
+        size = len(references)
+        f1_overlap = np.zeros(size)
+        f1_reference = np.zeros(size)
+        f1_prediction = np.zeros(size)
+        bleu = np.zeros(size)
+        rouge_overlap = {name: np.zeros(size) for name in ("rouge1", "rouge2", "rougeL")}
+        rouge_reference = {name: np.zeros(size) for name in ("rouge1", "rouge2", "rougeL")}
+        rouge_prediction = {name: np.zeros(size) for name in ("rouge1", "rouge2", "rougeL")}
+
+        for i, (reference_text, prediction_text) in enumerate(zip(references, predictions)):
+            reference = self.analyze(reference_text)
+            prediction = self.analyze(prediction_text)
+
+            f1_overlap[i] = len(np.intersect1d(reference.word_set, prediction.word_set, assume_unique=True))
+            f1_reference[i] = len(reference.word_set)
+            f1_prediction[i] = len(prediction.word_set)
+
+            bleu[i] = self._bleu(reference, prediction)
+
+            for n, name in ((1, "rouge1"), (2, "rouge2")):
+                reference_counts = self._ngrams(reference, "stems", n)
+                prediction_counts = self._ngrams(prediction, "stems", n)
+                rouge_overlap[name][i] = _clipped_overlap(reference_counts, prediction_counts)
+                rouge_reference[name][i] = reference_counts[1].sum()
+                rouge_prediction[name][i] = prediction_counts[1].sum()
+            rouge_overlap["rougeL"][i] = _lcs_length(reference.stems, prediction.stems)
+            rouge_reference["rougeL"][i] = len(reference.stems)
+            rouge_prediction["rougeL"][i] = len(prediction.stems)
+
+        f1 = _f_measure(f1_overlap, f1_reference, f1_prediction)
+        # Two empty answers count as a perfect match, as in calculate_f1
+        f1[(f1_reference == 0) & (f1_prediction == 0)] = 1.0
+
+        scores = {"f1_score": f1, "bleu_score": bleu}
+        for name in ("rouge1", "rouge2", "rougeL"):
+            scores[name] = _f_measure(rouge_overlap[name], rouge_reference[name], rouge_prediction[name])
+        return scores
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+        """Score a list of (reference, prediction) pairs."""
+        references = [reference for reference, _ in pairs]
+        predictions = [prediction for _, prediction in pairs]
+        return self.score(references, predictions)
+
+    def score_responses(self, references: Sequence[str], responses: Sequence[str]) -> List[Optional[Dict[str, float]]]:
+        """Per-item metric dicts; failed ("ERROR:") or empty responses yield None."""
+        valid = [i for i, response in enumerate(responses)
+                 if response.strip() and not response.startswith("ERROR:")]
+        scores = self.score([references[i] for i in valid], [responses[i] for i in valid])
+
+        item_metrics = [None] * len(responses)
+        for row, i in enumerate(valid):
+            item_metrics[i] = {k: float(scores[k][row]) for k in METRIC_NAMES}
+        return item_metrics
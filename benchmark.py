@@ -1,24 +1,35 @@
 import os
 import json
+import asyncio
 import logging
+import time
+import argparse
 from datetime import datetime
-from typing import List, Dict, Any
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from openai import OpenAI
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
-import numpy as np
-from datasets import load_dataset
-from rouge_score import rouge_scorer
-from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-from sklearn.metrics import f1_score
 from tqdm import tqdm
-import nltk
 import re
-
-# Download required NLTK data
-nltk.download('punkt')
+from sweep_engine import AsyncSweepEngine, WorkUnit, DEFAULT_IN_FLIGHT_LIMITS, parse_in_flight_limits
+from response_cache import ResponseCache, CacheMiss, request_key, add_cache_arguments
+from dataset_provider import DatasetProvider, add_dataset_arguments, provider_from_args
+from work_plan import WorkPlan, PlannedRequest
+from scoring_pipeline import ScoringPipeline, add_scoring_arguments, pipeline_from_args
+from results_store import add_results_store_arguments, store_from_args
+from plotting import FigureRenderer, heatmap_figure, heatmap_panel, matrix, add_plot_arguments, renderer_from_args
+from checkpoint import CheckpointLog, add_checkpoint_arguments
+from mock_llm_server import add_mock_server_arguments, point_clients_at
+from self_consistency import SelfConsistencySampler, majority_vote, add_self_consistency_arguments, sampler_from_args
+from batch_backend import BatchRunner, add_batch_arguments, batch_runner_from_args
+from sharding import add_shard_arguments, load_shards, shard_label, shard_path, write_shard
+from profiling import PROFILER, span, timed, profile_run, add_profiling_arguments
+from event_log import EventLog, add_event_log_arguments
+from token_budget import TokenBudget, add_token_budget_arguments, budget_from_args
+from prompt_caching import PromptCaching, usage_counts, add_prompt_caching_arguments, prompt_caching_from_args
+from single_flight import SingleFlight
+from hedging import HedgingPolicy, add_hedging_arguments, hedging_from_args
+from adaptive import SuccessiveHalving, add_adaptive_arguments, halving_from_args
+from http_clients import ProviderClients, add_http_arguments, clients_from_args
+from rate_limiter import RateLimitScheduler, estimate_request_tokens, add_rate_limit_arguments, scheduler_from_args
 
 # Load environment variables
 load_dotenv()
@@ -30,25 +41,103 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Use correct model names for OpenAI API
+MODEL_MAPPING = {
+    "gpt-3.5-turbo": "gpt-3.5-turbo",
+    "gpt-4o-mini": "gpt-4o-mini",
+    "o1-mini": "gpt-3.5-turbo",  # Fallback to gpt-3.5-turbo
+    "o3-mini": "gpt-4"           # Fallback to gpt-4
+}
+
+METRIC_NAMES = ["f1_score", "bleu_score", "rouge1", "rouge2", "rougeL"]
+
+TASK_LABELS = {
+    "qa": "QA",
+    "reasoning": "Reasoning",
+    "summarization": "Summarization"
+}
+
+# Tasks with a short answer that self-consistency samples can vote on
+VOTED_TASKS = {"qa", "reasoning"}
+
+@timed("score.normalize")
+def normalize_answer(text: str) -> str:
+    """Less strict normalization for better matching."""
+    if not text:
+        return ""
+    
+    # Basic cleaning while preserving meaningful distinctions
+    text = text.lower().strip()
+    text = re.sub(r'\s+', ' ', text)  # normalize whitespace
+    text = re.sub(r'[^\w\s\'.,]', '', text)  # keep basic punctuation
+    
+    return text
+
+def aggregate_metrics(model: str, task_name: str, item_metrics: List[Optional[Dict[str, float]]]) -> Dict[str, float]:
+    """Average per-item metrics, counting failed items (None) as attempted only."""
+    successful_metrics = [m for m in item_metrics if m is not None]
+    successful = len(successful_metrics)
+    total = len(item_metrics)
+
+    if successful == 0:
+        logger.warning(f"No successful evaluations for {model} on {task_name} task (attempted {total})")
+        return {k: 0.0 for k in METRIC_NAMES}
+
+    final_metrics = {k: sum(m[k] for m in successful_metrics) / successful for k in METRIC_NAMES}
+    logger.info(f"\nFinal averaged metrics for {model} on {task_name} (successful: {successful}/{total}):")
+    for metric, value in final_metrics.items():
+        logger.info(f"  {metric}: {value:.4f}")
+
+    return final_metrics
+
+def group_results(models: List[str], tasks: List[str], techniques: List[str], units: List[WorkUnit],
+                  item_metrics: List[Optional[Dict[str, float]]]) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+    """Group per-item metrics into the model -> task -> technique -> metric shape."""
+    grouped = {}
+    for unit, metrics in zip(units, item_metrics):
+        grouped.setdefault((unit.model, unit.task, unit.technique), []).append(metrics)
+
+    all_results = {}
+    for model in models:
+        all_results[model] = {}
+        for task_name in tasks:
+            all_results[model][task_name] = {}
+            for technique in techniques:
+                all_results[model][task_name][technique] = aggregate_metrics(
+                    model, task_name, grouped.get((model, task_name, technique), [])
+                )
+    return all_results
+
 class PromptTemplates:
     @staticmethod
     def standard(context, question):
         return f"Context: {context}\n\nQuestion: {question}\n\nAnswer:"
 
+    FEW_SHOT_EXAMPLES = [
+        ("The cat sat on the mat.", "Where did the cat sit?", "The cat sat on the mat."),
+        ("John went to the store to buy milk.", "What did John buy?", "John bought milk.")
+    ]
+
     @staticmethod
     def few_shot(context, question):
-        examples = """Example 1:
-Context: The cat sat on the mat.
-Question: Where did the cat sit?
-Answer: The cat sat on the mat.
+        examples = "\n\n".join(
+            f"Example {number}:\nContext: {example_context}\nQuestion: {example_question}\nAnswer: {answer}"
+            for number, (example_context, example_question, answer) in enumerate(PromptTemplates.FEW_SHOT_EXAMPLES, 1)
+        )
+        return f"{examples}\n\nNow answer this:\n\nContext: {context}\n\nQuestion: {question}\n\nAnswer:"
 
-Example 2:
-Context: John went to the store to buy milk.
-Question: What did John buy?
-Answer: John bought milk.
+    @staticmethod
+    def few_shot_turns():
+        """The few-shot examples as user/assistant turns: the fixed prefix of the cacheable layout."""
+        turns = []
+        for example_context, example_question, answer in PromptTemplates.FEW_SHOT_EXAMPLES:
+            turns.append({"role": "user", "content": PromptTemplates.few_shot_item(example_context, example_question)})
+            turns.append({"role": "assistant", "content": answer})
+        return turns
 
-Now answer this:"""
-        return f"{examples}\n\nContext: {context}\n\nQuestion: {question}\n\nAnswer:"
+    @staticmethod
+    def few_shot_item(context, question):
+        return f"Context: {context}\n\nQuestion: {question}\n\nAnswer:"
 
     @staticmethod
     def chain_of_thought(context, question):
@@ -63,15 +152,12 @@ Your reasoning:"""
 
     @staticmethod
     def self_consistency(context, question):
-        return f"""Generate 3 different approaches to answer this question, then choose the most consistent one.
+        # One reasoning path per sample; answers across samples are majority-voted
+        return f"""Think through this question independently, then commit to an answer.
 Context: {context}
 Question: {question}
 
-Approach 1:
-Approach 2:
-Approach 3:
-
-Most consistent answer:"""
+Reason briefly, then end with a line of the form "Final answer: <answer>"."""
 
     @staticmethod
     def role_prompting(context, question):
@@ -95,10 +181,49 @@ Action: Formulate an answer
 Answer:"""
 
 class ModelEvaluator:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    def __init__(self, cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimitScheduler] = None,
+                 checkpoint: Optional[CheckpointLog] = None,
+                 datasets: Optional[DatasetProvider] = None,
+                 scoring: Optional[ScoringPipeline] = None,
+                 clients: Optional[ProviderClients] = None,
+                 voting: Optional[SelfConsistencySampler] = None,
+                 events: Optional[EventLog] = None,
+                 budget: Optional[TokenBudget] = None,
+                 prompt_caching: Optional[PromptCaching] = None,
+                 hedging: Optional[HedgingPolicy] = None,
+                 single_flight: Optional[SingleFlight] = None):
+        # Scoring imports are deferred until an evaluator is built
+        from rouge_score import rouge_scorer
+        from nltk.translate.bleu_score import SmoothingFunction
+        from batch_scoring import BatchScorer
+
+        # Shared, pooled SDK clients; SDK retries are disabled since the rate limiter owns retries
+        self.clients = clients or ProviderClients()
+        self.openai_client = self.clients.openai()
+        self.async_openai_client = self.clients.async_openai()
         self.rouge_scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
         self.smoothing = SmoothingFunction().method1
+        self.batch_scorer = BatchScorer(normalize=normalize_answer)
+        # Optional out-of-process scorer; without one, scoring runs inline
+        self.scoring = scoring
+        # Optional sampled self-consistency; without one, the technique is a single completion
+        self.voting = voting
+        # Latency/usage per work unit and the per-item rows for the results store
+        self.unit_records = {}
+        self.result_rows = []
+        # Structured per-item events; without one, nothing is logged per item
+        self.events = events or EventLog()
+        # Optional token accounting and context truncation; without one, contexts are sent whole
+        self.budget = budget
+        # Cached-token accounting; with caching enabled, few-shot prompts get a cacheable prefix
+        self.prompt_caching = prompt_caching or PromptCaching()
+        # Optional hedging of slow requests; disabled, every request is sent once
+        self.hedging = hedging or HedgingPolicy()
+        # Merges concurrent identical requests, keyed on the resolved model and payload
+        self.single_flight = single_flight or SingleFlight()
+        # Fingerprint of the last planned sweep; shared by all of its shards
+        self.sweep_id = None
         self.prompt_templates = PromptTemplates()
         self.tasks = {
             "qa": self.evaluate_qa,
@@ -116,51 +241,219 @@ class ModelEvaluator:
             raise ValueError("OpenAI API key not found in environment variables")
         
         self.current_technique = "standard"  # Add this line to track current technique
+        self.cache = cache or ResponseCache(mode="off")
+        self.rate_limiter = rate_limiter or RateLimitScheduler()
+        self.checkpoint = checkpoint or CheckpointLog()
+        self.datasets = datasets or DatasetProvider()
+
+    def resolve_model(self, model: str) -> str:
+        """Map a benchmark model label to the model name sent to the OpenAI API."""
+        return MODEL_MAPPING.get(model, model)
+
+    def _parse_completion(self, actual_model: str, response) -> str:
+        if response.choices:
+            result = response.choices[0].message.content.strip()
+            logger.debug("Response from %s (first 100 chars): %.100s", actual_model, result)
+            return result
+        logger.warning(f"No response choices from {actual_model}")
+        return ""
 
-    def get_model_response(self, model: str, messages: List[Dict[str, str]]) -> str:
+    def _record_usage(self, actual_model: str, record: Optional[Dict[str, Any]], response, started: float,
+                      queue_wait: float, shared: bool = False):
+        """Fill a caller's record with the request's latency and token usage, including cached prompt tokens.
+
+        A `shared` response came from another caller's identical request, so it is not counted again.
+        """
+        usage = getattr(response, "usage", None)
+        cached = usage_counts(usage) if shared else self.prompt_caching.record(actual_model, usage)
+        if record is None:
+            return
+        if shared:
+            record["coalesced"] = True
+        record.update({
+            "latency_seconds": time.perf_counter() - started - queue_wait,
+            "queue_wait_seconds": queue_wait,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            **cached
+        })
+
+    def get_model_response(self, model: str, messages: List[Dict[str, str]],
+                           record: Optional[Dict[str, Any]] = None) -> str:
+        """Return the model's reply; `record`, if given, receives latency and token counts."""
         try:
-            # Use correct model names for OpenAI API
-            model_mapping = {
-                "gpt-3.5-turbo": "gpt-3.5-turbo",
-                "gpt-4o-mini": "gpt-4o-mini",
-                "o1-mini": "gpt-3.5-turbo",  # Fallback to gpt-3.5-turbo
-                "o3-mini": "gpt-4"           # Fallback to gpt-4
-            }
+            actual_model = self.resolve_model(model)
+            logger.debug("Using model: %s", actual_model)
+
+            cache_key = request_key("openai", actual_model, messages, temperature=0, max_tokens=1000)
+            with span("cache.lookup"):
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                if record is not None:
+                    record["cached"] = True
+                return cached
             
-            actual_model = model_mapping.get(model, model)
-            logger.info(f"Using model: {actual_model}")
+            started = time.perf_counter()
+            estimated_tokens = estimate_request_tokens(messages, 1000)
+            # Rate limiting, Retry-After handling and jittered backoff; concurrent identical requests share one call.
+            # A hedge reserves its own slot from the same budget
+            (response, queue_wait), shared = self.single_flight.do(cache_key, lambda: self.rate_limiter.call(
+                "openai", actual_model,
+                lambda: self.hedging.call(actual_model, lambda: self.openai_client.chat.completions.create(
+                    model=actual_model,
+                    messages=messages,
+                    temperature=0,
+                    max_tokens=1000,
+                    **self.prompt_caching.openai_params(messages)
+                ), lambda: self.rate_limiter.acquire("openai", actual_model, estimated_tokens)),
+                estimated_tokens
+            ), actual_model)
+            if queue_wait > 0:
+                logger.debug(f"Waited {queue_wait:.2f}s in queue for {actual_model}")
+            PROFILER.add("request.queue_wait", queue_wait)
+            PROFILER.add("request.network", time.perf_counter() - started - queue_wait)
+            self._record_usage(actual_model, record, response, started, queue_wait, shared)
+            result = self._parse_completion(actual_model, response)
+            if result:
+                self.cache.put(cache_key, result)
+            return result
+                
+        except CacheMiss as e:
+            logger.warning(f"Replay mode: {str(e)} for {model}")
+            return f"ERROR: No cached response for {model}"
+        except Exception as e:
+            logger.error(f"Error getting response from {model}: {str(e)}", exc_info=True)
+            return f"ERROR: Failed to get response from {model}"
+
+    async def get_model_response_async(self, model: str, messages: List[Dict[str, str]],
+                                       record: Optional[Dict[str, Any]] = None) -> str:
+        """Async counterpart of get_model_response used by the concurrent sweep."""
+        try:
+            actual_model = self.resolve_model(model)
+
+            cache_key = request_key("openai", actual_model, messages, temperature=0, max_tokens=1000)
+            with span("cache.lookup"):
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                if record is not None:
+                    record["cached"] = True
+                return cached
             
-            # Add retry logic with backoff
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = self.openai_client.chat.completions.create(
-                        model=actual_model,
-                        messages=messages,
-                        temperature=0,
-                        max_tokens=1000
-                    )
-                    
-                    if response.choices:
-                        result = response.choices[0].message.content.strip()
-                        logger.info(f"Response from {actual_model} (first 100 chars): {result[:100]}...")
-                        return result
-                    else:
-                        logger.warning(f"No response choices from {actual_model}")
-                        return ""
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Retry {attempt+1}/{max_retries} after error: {str(e)}")
-                        import time
-                        time.sleep(2 * (attempt + 1))  # Exponential backoff
-                        continue
-                    else:
-                        raise
+            started = time.perf_counter()
+            estimated_tokens = estimate_request_tokens(messages, 1000)
+            # Concurrent identical requests (e.g. from aliased model labels) share one call.
+            # A hedge reserves its own slot from the same budget
+            (response, queue_wait), shared = await self.single_flight.do_async(cache_key, lambda: self.rate_limiter.call_async(
+                "openai", actual_model,
+                lambda: self.hedging.call_async(actual_model, lambda: self.async_openai_client.chat.completions.create(
+                    model=actual_model,
+                    messages=messages,
+                    temperature=0,
+                    max_tokens=1000,
+                    **self.prompt_caching.openai_params(messages)
+                ), lambda: self.rate_limiter.acquire_async("openai", actual_model, estimated_tokens)),
+                estimated_tokens
+            ), actual_model)
+            if queue_wait > 0:
+                logger.debug(f"Waited {queue_wait:.2f}s in queue for {actual_model}")
+            PROFILER.add("request.queue_wait", queue_wait)
+            PROFILER.add("request.network", time.perf_counter() - started - queue_wait)
+            self._record_usage(actual_model, record, response, started, queue_wait, shared)
+            result = self._parse_completion(actual_model, response)
+            if result:
+                self.cache.put(cache_key, result)
+            return result
                 
+        except CacheMiss as e:
+            logger.warning(f"Replay mode: {str(e)} for {model}")
+            return f"ERROR: No cached response for {model}"
         except Exception as e:
             logger.error(f"Error getting response from {model}: {str(e)}", exc_info=True)
             return f"ERROR: Failed to get response from {model}"
 
+    def uses_voting(self, unit: WorkUnit) -> bool:
+        return self.voting is not None and unit.technique == "self_consistency" and unit.task in VOTED_TASKS
+
+    def request_fan_out(self, request: PlannedRequest) -> Tuple[int, int]:
+        """(completions, requests sent) for a planned request; voted units draw k samples."""
+        if not self.uses_voting(request.unit):
+            return 1, 1
+        return self.voting.samples, 1 if self.voting.use_n else self.voting.samples
+
+    def get_voted_response(self, model: str, messages: List[Dict[str, str]], record: Dict[str, Any]) -> str:
+        """Majority-voted answer over self-consistency samples; `record` receives vote, latency and token stats."""
+        try:
+            with span("request.self_consistency"):
+                answer, votes = self.voting.sample(self.openai_client, self.rate_limiter, self.cache,
+                                                   self.resolve_model(model), messages)
+            record.update(votes)
+            return answer
+        except CacheMiss as e:
+            logger.warning(f"Replay mode: {str(e)} for {model}")
+            return f"ERROR: No cached response for {model}"
+        except Exception as e:
+            logger.error(f"Error sampling self-consistency votes from {model}: {str(e)}", exc_info=True)
+            return f"ERROR: Failed to get response from {model}"
+
+    async def get_voted_response_async(self, model: str, messages: List[Dict[str, str]], record: Dict[str, Any]) -> str:
+        try:
+            actual_model = self.resolve_model(model)
+            # Cache hits are served before coalescing, so only actual sampling is shared
+            with span("cache.lookup"):
+                cached = self.voting.lookup(self.cache, actual_model, messages)
+            if cached is not None:
+                answer, votes = cached
+                record.update(votes)
+                return answer
+            cache_key, _ = self.voting.batch_request(actual_model, messages)
+            with span("request.self_consistency"):
+                (answer, votes), shared = await self.single_flight.do_async(
+                    cache_key, lambda: self.voting.sample_async(self.async_openai_client, self.rate_limiter,
+                                                                self.cache, actual_model, messages,
+                                                                check_cache=False),
+                    actual_model
+                )
+            record.update(votes)
+            if shared:
+                record["coalesced"] = True
+            return answer
+        except CacheMiss as e:
+            logger.warning(f"Replay mode: {str(e)} for {model}")
+            return f"ERROR: No cached response for {model}"
+        except Exception as e:
+            logger.error(f"Error sampling self-consistency votes from {model}: {str(e)}", exc_info=True)
+            return f"ERROR: Failed to get response from {model}"
+
+    def get_unit_response(self, unit: WorkUnit, messages: List[Dict[str, str]]) -> str:
+        """Return a work unit's response from the checkpoint log, or request and log it."""
+        record = {}
+        response = self.checkpoint.get(unit)
+        if response is None and self.uses_voting(unit):
+            response = self.get_voted_response(unit.model, messages, record)
+            self.checkpoint.record(unit, response)
+        elif response is None:
+            response = self.get_model_response(unit.model, messages, record)
+            self.checkpoint.record(unit, response)
+        else:
+            record["resumed"] = True
+        self.unit_records[unit] = record
+        return response
+
+    async def get_unit_response_async(self, unit: WorkUnit, messages: List[Dict[str, str]]) -> str:
+        record = {}
+        response = self.checkpoint.get(unit)
+        if response is None and self.uses_voting(unit):
+            response = await self.get_voted_response_async(unit.model, messages, record)
+            self.checkpoint.record(unit, response)
+        elif response is None:
+            response = await self.get_model_response_async(unit.model, messages, record)
+            self.checkpoint.record(unit, response)
+        else:
+            record["resumed"] = True
+        self.unit_records[unit] = record
+        return response
+
+    @timed("score.f1")
     def calculate_f1(self, actual: str, predicted: str) -> float:
         """Calculate F1 score with word overlap."""
         actual_words = set(self.normalize_answer(actual).split())
@@ -178,6 +471,7 @@ class ModelEvaluator:
         
         return 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
 
+    @timed("score.bleu")
     def calculate_bleu(self, reference: str, candidate: str) -> float:
         """Calculate BLEU score with better handling of short answers."""
         reference_tokens = [self.normalize_answer(reference).split()]
@@ -186,246 +480,528 @@ class ModelEvaluator:
         if not reference_tokens[0] or not candidate_tokens:
             return 0.0
         
+        from nltk.translate.bleu_score import sentence_bleu
+
         # Use simpler weights for short answers
         weights = (1.0,) if len(candidate_tokens) < 4 else (0.25, 0.25, 0.25, 0.25)
         
         return sentence_bleu(reference_tokens, candidate_tokens, 
                            weights=weights,
-                           smoothing_function=SmoothingFunction().method1)
+                           smoothing_function=self.smoothing)
 
     def normalize_answer(self, text: str) -> str:
         """Less strict normalization for better matching."""
-        if not text:
-            return ""
-        
-        # Basic cleaning while preserving meaningful distinctions
-        text = text.lower().strip()
-        text = re.sub(r'\s+', ' ', text)  # normalize whitespace
-        text = re.sub(r'[^\w\s\'.,]', '', text)  # keep basic punctuation
-        
-        return text
+        return normalize_answer(text)
 
-    def evaluate_qa(self, model: str, num_samples: int = 50) -> Dict[str, float]:
-        """Evaluate question answering using SQuAD dataset."""
-        dataset = load_dataset("squad_v2", split="validation")
-        dataset = dataset.shuffle(seed=42).select(range(num_samples))
-        
-        metrics = {
-            "f1_score": 0,
-            "bleu_score": 0,
-            "rouge1": 0,
-            "rouge2": 0,
-            "rougeL": 0
-        }
-        total = 0
-        successful = 0
-        
-        for item in tqdm(dataset, desc=f"Evaluating {model} on QA"):
-            try:
-                # Skip items with no answers
-                if not item['answers']['text']:
-                    continue
-                    
-                context = item['context']
-                question = item['question']
-                
-                # Simplified prompt format
-                prompt = f"""Answer this question based on the context:
+    def get_task_items(self, task_name: str, num_samples: int) -> List[Dict[str, str]]:
+        """Load the sampled dataset rows for a task as prompt-ready items, contexts fitted to the token budget."""
+        items = self._load_task_items(task_name, num_samples)
+        if self.budget:
+            for item in items:
+                item["context"] = self.budget.fit(item["context"])
+        return items
+
+    def _load_task_items(self, task_name: str, num_samples: int) -> List[Dict[str, str]]:
+        if task_name == "qa":
+            dataset = self.datasets.sample("squad_v2", num_samples)
+            # Skip items with no answers
+            return [
+                {"context": item['context'], "question": item['question'], "reference": item['answers']['text'][0]}
+                for item in dataset if item['answers']['text']
+            ]
+        elif task_name == "reasoning":
+            dataset = self.datasets.sample("cosmos_qa", num_samples, trust_remote_code=True)
+            # Assuming answer0 is correct
+            return [
+                {"context": item['context'], "question": item['question'], "reference": item['answer0']}
+                for item in dataset
+            ]
+        elif task_name == "summarization":
+            dataset = self.datasets.sample("cnn_dailymail", num_samples, name="3.0.0", trust_remote_code=True)
+            return [
+                {"context": item['article'], "reference": item['highlights']}
+                for item in dataset
+            ]
+        raise ValueError(f"Unknown task: {task_name}")
+
+    def build_messages(self, task_name: str, item: Dict[str, str], technique: str = None) -> List[Dict[str, str]]:
+        """Build the chat messages for one task item."""
+        if task_name == "qa":
+            # Simplified prompt format
+            prompt = f"""Answer this question based on the context:
                 
-Context: {context}
+Context: {item['context']}
 
-Question: {question}
+Question: {item['question']}
 
 Your answer:"""
-                
-                response = self.get_model_response(model, [
-                    {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Give direct answers without explanations."},
-                    {"role": "user", "content": prompt}
-                ])
-                
-                # Check if response contains the error marker
-                if response.startswith("ERROR:"):
-                    logger.warning(f"API error for {model} on QA task: {response}")
-                    continue
-                
-                if not response.strip():
-                    logger.warning(f"Empty response from {model} for QA task")
-                    continue
+            return [
+                {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Give direct answers without explanations."},
+                {"role": "user", "content": prompt}
+            ]
+        elif task_name == "reasoning":
+            technique = technique or self.current_technique
+            if technique == "few_shot" and self.prompt_caching.enabled:
+                # Examples as fixed turns ahead of the item, so every item shares a cacheable prefix
+                return [
+                    {"role": "system", "content": "You are an assistant skilled in logical reasoning."},
+                    *self.prompt_templates.few_shot_turns(),
+                    {"role": "user", "content": self.prompt_templates.few_shot_item(item['context'], item['question'])}
+                ]
+            # Get prompt based on technique
+            template = getattr(self.prompt_templates, technique)
+            return [
+                {"role": "system", "content": "You are an assistant skilled in logical reasoning."},
+                {"role": "user", "content": template(item['context'], item['question'])}
+            ]
+        elif task_name == "summarization":
+            # Adapt prompt for summarization
+            return [
+                {"role": "system", "content": "You are an assistant skilled in text summarization."},
+                {"role": "user", "content": f"Summarize this text:\n\n{item['context']}"}
+            ]
+        raise ValueError(f"Unknown task: {task_name}")
 
-                # Get reference answer
-                actual = item['answers']['text'][0]
-                
-                # Print raw responses for debugging
-                logger.info(f"Question: {question}")
-                logger.info(f"Expected answer: {actual}")
-                logger.info(f"Model response: {response}")
-                
-                # Normalize responses
-                normalized_response = self.normalize_answer(response)
-                normalized_actual = self.normalize_answer(actual)
-                
-                logger.info(f"Normalized expected: '{normalized_actual}'")
-                logger.info(f"Normalized response: '{normalized_response}'")
-                
-                # Calculate metrics with normalized text
-                f1 = self.calculate_f1(normalized_actual, normalized_response)
-                bleu = self.calculate_bleu(normalized_actual, normalized_response)
-                rouge_scores = self.rouge_scorer.score(normalized_actual, normalized_response)
-                
-                # Update metrics
-                metrics["f1_score"] += f1
-                metrics["bleu_score"] += bleu
-                metrics["rouge1"] += rouge_scores['rouge1'].fmeasure
-                metrics["rouge2"] += rouge_scores['rouge2'].fmeasure
-                metrics["rougeL"] += rouge_scores['rougeL'].fmeasure
-                
-                successful += 1
-                
-                # Log metrics for each item
-                logger.info(f"Item metrics - F1: {f1:.4f}, BLEU: {bleu:.4f}, ROUGE-1: {rouge_scores['rouge1'].fmeasure:.4f}")
-                
-            except Exception as e:
-                logger.error(f"Error evaluating QA: {str(e)}", exc_info=True)
-                continue
-            
-            finally:
-                total += 1
-                
-                # Only process a few items for testing
-                if total >= num_samples:
-                    break
-        
-        if successful == 0:
-            logger.warning(f"No successful evaluations for {model} on QA task (attempted {total})")
-            return {k: 0.0 for k in metrics}
-        
-        # Calculate averages and log final scores
-        final_metrics = {k: v/successful for k, v in metrics.items()}
-        logger.info(f"\nFinal averaged metrics for {model} (successful: {successful}/{total}):")
-        for metric, value in final_metrics.items():
-            logger.info(f"  {metric}: {value:.4f}")
-            
-        return final_metrics
+    def score_response(self, task_name: str, model: str, item: Dict[str, str], response: str) -> Optional[Dict[str, float]]:
+        """Score one model response against the item reference, or None if the call failed."""
+        # Check if response contains the error marker
+        if response.startswith("ERROR:"):
+            if task_name == "qa":
+                logger.warning(f"API error for {model} on QA task: {response}")
+            return None
+
+        if not response.strip():
+            if task_name == "qa":
+                logger.warning(f"Empty response from {model} for QA task")
+            return None
+
+        actual = item['reference']
+
+        # Normalize responses
+        normalized_response = self.normalize_answer(response)
+        normalized_actual = self.normalize_answer(actual)
+
+        # Calculate metrics with normalized text
+        f1 = self.calculate_f1(normalized_actual, normalized_response)
+        bleu = self.calculate_bleu(normalized_actual, normalized_response)
+        with span("score.rouge"):
+            rouge_scores = self.rouge_scorer.score(normalized_actual, normalized_response)
 
-    def evaluate_reasoning(self, model: str, num_samples: int = 10) -> Dict[str, float]:
-        """Evaluate reasoning using CosmosQA dataset."""
-        dataset = load_dataset("cosmos_qa", split="validation", trust_remote_code=True)
-        dataset = dataset.shuffle(seed=42).select(range(num_samples))
-        
         metrics = {
-            "f1_score": 0,
-            "bleu_score": 0,
-            "rouge1": 0,
-            "rouge2": 0,
-            "rougeL": 0
+            "f1_score": f1,
+            "bleu_score": bleu,
+            "rouge1": rouge_scores['rouge1'].fmeasure,
+            "rouge2": rouge_scores['rouge2'].fmeasure,
+            "rougeL": rouge_scores['rougeL'].fmeasure
         }
-        total = 0
-        successful = 0
-        
-        for item in tqdm(dataset, desc=f"Evaluating {model} on Reasoning"):
+
+        return metrics
+
+    def score_responses(self, references: List[str], responses: List[str]) -> List[Optional[Dict[str, float]]]:
+        """Batch-score responses; failed or empty responses yield None."""
+        with span("score.batch"):
+            return self.batch_scorer.score_responses(references, responses)
+
+    def aggregate_metrics(self, model: str, task_name: str, item_metrics: List[Optional[Dict[str, float]]]) -> Dict[str, float]:
+        """Average per-item metrics, counting failed items (None) as attempted only."""
+        return aggregate_metrics(model, task_name, item_metrics)
+
+    def collect_rows(self, units: List[WorkUnit], references: List[str], responses: List[Optional[str]],
+                     item_metrics: List[Optional[Dict[str, float]]]):
+        """Keep one results-store row per work unit and log it to the event log (sampled; failures always)."""
+        for unit, reference, response, metrics in zip(units, references, responses, item_metrics):
+            row = {
+                "model": unit.model,
+                "resolved_model": self.resolve_model(unit.model),
+                "task": unit.task,
+                "technique": unit.technique,
+                "item_index": unit.item_index,
+                "reference": reference,
+                "response": response,
+                "error": metrics is None,
+                **(metrics or {}),
+                **self.unit_records.pop(unit, {})
+            }
+            self.result_rows.append(row)
+            if metrics is None or self.events.should_log(f"{unit.model}|{unit.task}|{unit.technique}|{unit.item_index}"):
+                self.events.emit("item", **row, normalized_reference=normalize_answer(reference),
+                                 normalized_response=normalize_answer(response or ""))
+
+    def evaluate_task(self, task_name: str, model: str, num_samples: int) -> Dict[str, float]:
+        """Evaluate one task sequentially with the current prompting technique."""
+        items = self.get_task_items(task_name, num_samples)
+        units = [WorkUnit(model, task_name, self.current_technique, index) for index in range(len(items))]
+        responses = [None] * len(items)
+        item_metrics = []
+
+        for unit, item in zip(units, tqdm(items, desc=f"Evaluating {model} on {TASK_LABELS[task_name]}")):
             try:
-                context = item['context']
-                question = item['question']
-                correct_answer = item['answer0']  # Assuming answer0 is correct
-                
-                # Get prompt based on technique
-                response = self.get_model_response(model, [
-                    {"role": "system", "content": "You are an assistant skilled in logical reasoning."},
-                    {"role": "user", "content": getattr(self.prompt_templates, self.current_technique)(context, question)}
-                ])
-                
-                if response.startswith("ERROR:") or not response.strip():
-                    continue
-                
-                # Calculate metrics
-                normalized_response = self.normalize_answer(response)
-                normalized_actual = self.normalize_answer(correct_answer)
-                
-                exact_match = int(normalized_response == normalized_actual)
-                f1 = self.calculate_f1(normalized_actual, normalized_response)
-                bleu = self.calculate_bleu(normalized_actual, normalized_response)
-                rouge_scores = self.rouge_scorer.score(normalized_actual, normalized_response)
-                
-                # Update metrics
-                metrics["f1_score"] += f1
-                metrics["bleu_score"] += bleu
-                metrics["rouge1"] += rouge_scores['rouge1'].fmeasure
-                metrics["rouge2"] += rouge_scores['rouge2'].fmeasure
-                metrics["rougeL"] += rouge_scores['rougeL'].fmeasure
-                
-                successful += 1
-                
+                response = responses[unit.item_index] = self.get_unit_response(unit, self.build_messages(task_name, item))
+                if self.scoring:
+                    # Hand off to the scorer processes and move on to the next request
+                    self.scoring.submit(unit, item['reference'], response)
+                else:
+                    item_metrics.append(self.score_response(task_name, model, item, response))
             except Exception as e:
-                logger.error(f"Error evaluating reasoning: {str(e)}", exc_info=True)
-                continue
-            finally:
-                total += 1
-                if total >= num_samples:
-                    break
-        
-        return {k: v/successful if successful > 0 else 0.0 for k, v in metrics.items()}
+                logger.error(f"Error evaluating {task_name}: {str(e)}", exc_info=True)
+                if not self.scoring:
+                    item_metrics.append(None)
+
+        if self.scoring:
+            with span("score.drain"):
+                scored = self.scoring.drain()
+            item_metrics = [scored.get(unit) for unit in units]
+
+        self.collect_rows(units, [item['reference'] for item in items], responses, item_metrics)
+        return self.aggregate_metrics(model, task_name, item_metrics)
+
+    def evaluate_qa(self, model: str, num_samples: int = 50) -> Dict[str, float]:
+        """Evaluate question answering using SQuAD dataset."""
+        return self.evaluate_task("qa", model, num_samples)
+
+    def evaluate_reasoning(self, model: str, num_samples: int = 10) -> Dict[str, float]:
+        """Evaluate reasoning using CosmosQA dataset."""
+        return self.evaluate_task("reasoning", model, num_samples)
 
     def evaluate_summarization(self, model: str, num_samples: int = 10) -> Dict[str, float]:
         """Evaluate summarization using CNN/DailyMail dataset."""
-        dataset = load_dataset("cnn_dailymail", "3.0.0", split="validation", trust_remote_code=True)
-        dataset = dataset.shuffle(seed=42).select(range(num_samples))
-        
-        metrics = {
-            "f1_score": 0,
-            "bleu_score": 0,
-            "rouge1": 0,
-            "rouge2": 0,
-            "rougeL": 0
+        return self.evaluate_task("summarization", model, num_samples)
+
+    def run_sweep(self, models: List[str], num_samples: int) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        """Run every model x task x technique one request at a time."""
+        all_results = {}
+        for model in models:
+            all_results[model] = {}
+            for task_name, task_func in self.tasks.items():
+                all_results[model][task_name] = {}
+                for technique in self.prompting_techniques:
+                    self.current_technique = technique  # Set current technique
+                    all_results[model][task_name][technique] = task_func(model, num_samples=num_samples)
+        return all_results
+
+    @timed("plan.build")
+    def build_plan(self, models: List[str], num_samples: int,
+                   shard: Optional[Tuple[int, int]] = None) -> Tuple[WorkPlan, Dict[str, List[Dict[str, str]]]]:
+        """Expand the sweep into a rendered work plan plus the task items it refers to.
+
+        With `shard` as a 0-based (index, count), only that shard's part of the plan is returned.
+        """
+        # Load each task's items once and share them across models and techniques
+        task_items = {task_name: self.get_task_items(task_name, num_samples) for task_name in self.tasks}
+
+        # Render each (task, technique, item) prompt once; every model shares it
+        renderings = {
+            (task_name, technique, index): self.build_messages(task_name, item, technique)
+            for task_name, items in task_items.items()
+            for technique in sorted(self.prompting_techniques)
+            for index, item in enumerate(items)
         }
-        total = 0
-        successful = 0
-        
-        for item in tqdm(dataset, desc=f"Evaluating {model} on Summarization"):
+
+        plan = WorkPlan.build((
+            (WorkUnit(model, task_name, technique, index), "openai", self.resolve_model(model),
+             renderings[(task_name, technique, index)], 1000)
+            for model in models
+            for task_name in self.tasks
+            for technique in sorted(self.prompting_techniques)
+            for index in range(len(task_items[task_name]))
+        ), token_counter=self.budget.counter.count_messages if self.budget else None)
+        self.sweep_id = plan.fingerprint()[:16]
+        if shard:
+            full_size = len(plan)
+            plan = plan.shard(*shard)
+            logger.info(f"Shard {shard[0] + 1}/{shard[1]} of sweep {self.sweep_id}: {len(plan)} of {full_size} work units")
+        return plan, task_items
+
+    def run_sweep_concurrent(self, models: List[str], plan: WorkPlan, task_items: Dict[str, List[Dict[str, str]]],
+                             in_flight_limits: Dict[str, int] = None) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        """Run a built plan (the whole sweep or one shard of it) as concurrent work units with per-provider in-flight limits."""
+        plan.log_summary()
+        units = plan.units()
+        item_metrics = asyncio.run(self.run_units(plan, task_items, units, in_flight_limits))
+        return self.aggregate_sweep(models, units, item_metrics)
+
+    async def run_units(self, plan: WorkPlan, task_items: Dict[str, List[Dict[str, str]]], units: List[WorkUnit],
+                  in_flight_limits: Dict[str, int] = None,
+                  desc: str = "Evaluating work units") -> List[Optional[Dict[str, float]]]:
+        """Request and score planned units concurrently, collecting their rows; returns per-item metrics.
+
+        A coroutine so several rounds can share one event loop, which the async clients are bound to.
+        """
+        def reference_of(unit: WorkUnit) -> str:
+            return task_items[unit.task][unit.item_index]['reference']
+
+        progress = tqdm(total=len(units), desc=desc)
+
+        async def run_unit(unit: WorkUnit) -> str:
             try:
-                context = item['article']
-                reference_summary = item['highlights']
-                
-                # Adapt prompt for summarization
-                response = self.get_model_response(model, [
-                    {"role": "system", "content": "You are an assistant skilled in text summarization."},
-                    {"role": "user", "content": f"Summarize this text:\n\n{context}"}
-                ])
-                
-                if response.startswith("ERROR:") or not response.strip():
-                    continue
-                
-                # Calculate metrics
-                normalized_response = self.normalize_answer(response)
-                normalized_actual = self.normalize_answer(reference_summary)
-                
-                exact_match = int(normalized_response == normalized_actual)
-                f1 = self.calculate_f1(normalized_actual, normalized_response)
-                bleu = self.calculate_bleu(normalized_actual, normalized_response)
-                rouge_scores = self.rouge_scorer.score(normalized_actual, normalized_response)
-                
-                # Update metrics
-                metrics["f1_score"] += f1
-                metrics["bleu_score"] += bleu
-                metrics["rouge1"] += rouge_scores['rouge1'].fmeasure
-                metrics["rouge2"] += rouge_scores['rouge2'].fmeasure
-                metrics["rougeL"] += rouge_scores['rougeL'].fmeasure
-                
-                successful += 1
-                
-            except Exception as e:
-                logger.error(f"Error evaluating summarization: {str(e)}", exc_info=True)
-                continue
+                response = await self.get_unit_response_async(unit, plan.get(unit).messages)
+                if self.scoring:
+                    # Scoring overlaps with the requests still in flight
+                    await self.scoring.submit_async(unit, reference_of(unit), response)
+                return response
             finally:
-                total += 1
-                if total >= num_samples:
-                    break
-        
-        return {k: v/successful if successful > 0 else 0.0 for k, v in metrics.items()}
+                progress.update()
+
+        # Units sending the same request (aliased models) go out back to back, so they overlap and coalesce
+        first_seen = {}
+        for unit in units:
+            first_seen.setdefault(plan.get(unit).request_hash, len(first_seen))
+        dispatch = sorted(units, key=lambda unit: first_seen[plan.get(unit).request_hash])
+        engine = AsyncSweepEngine(in_flight_limits)
+        by_unit = dict(zip(dispatch, await engine.run(dispatch, run_unit)))
+        responses = [by_unit[unit] for unit in units]
+        progress.close()
+
+        references = [reference_of(unit) for unit in units]
+        if self.scoring:
+            with span("score.drain"):
+                scored = self.scoring.drain()
+            item_metrics = [scored.get(unit) for unit in units]
+        else:
+            # Score every successful response in one batch once generation is done
+            item_metrics = self.score_responses(references, [response or "" for response in responses])
+        self.collect_rows(units, references, responses, item_metrics)
+        return item_metrics
+
+    def run_sweep_adaptive(self, models: List[str], plan: WorkPlan, task_items: Dict[str, List[Dict[str, str]]],
+                           halving: SuccessiveHalving,
+                           in_flight_limits: Dict[str, int] = None) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        """Run the sweep in successive-halving rounds instead of evaluating every cell on every item.
+
+        Each round sends only the units the allocator still wants, so the
+        techniques of a (model, task) pair share a prefix of the task's items
+        and aggregates stay comparable. Per-cell sample counts are left in
+        `halving.report()`.
+        """
+        plan.log_summary()
+        units, item_metrics = asyncio.run(self._run_rounds(plan, task_items, models, halving, in_flight_limits))
+        logger.info(f"Adaptive sweep sent {len(units)} of {len(plan)} work units in {halving.round} rounds")
+        return self.aggregate_sweep(models, units, item_metrics)
+
+    async def _run_rounds(self, plan: WorkPlan, task_items: Dict[str, List[Dict[str, str]]], models: List[str],
+                          halving: SuccessiveHalving, in_flight_limits: Dict[str, int] = None):
+        techniques = sorted(self.prompting_techniques)
+        halving.start(
+            {(model, task): [(model, task, technique) for technique in techniques]
+             for model in models for task in self.tasks},
+            {(model, task): len(task_items[task]) for model in models for task in self.tasks}
+        )
+
+        units, item_metrics = [], []
+        targets = halving.targets()
+        while targets:
+            round_units = {
+                cell: [WorkUnit(*cell, index) for index in range(halving.cells[cell]["samples"], target)]
+                for cell, target in targets.items()
+            }
+            batch = [unit for cell_units in round_units.values() for unit in cell_units]
+            metrics = dict(zip(batch, await self.run_units(plan, task_items, batch, in_flight_limits,
+                                                           desc=f"Adaptive round {halving.round + 1}")))
+            for cell, cell_units in round_units.items():
+                halving.record(cell, targets[cell], [metrics[unit] for unit in cell_units])
+            units.extend(batch)
+            item_metrics.extend(metrics[unit] for unit in batch)
+            halving.advance()
+            targets = halving.targets()
+        return units, item_metrics
+
+    def batch_request(self, request: PlannedRequest) -> Tuple[str, Dict[str, Any]]:
+        """Cache key (also the batch custom_id) and batch-API request body for a planned request."""
+        if self.uses_voting(request.unit):
+            return self.voting.batch_request(request.resolved_model, request.messages)
+        params = {"temperature": 0, "max_tokens": request.max_tokens}
+        return (request_key(request.provider, request.resolved_model, request.messages, **params),
+                {"model": request.resolved_model, "messages": request.messages, **params,
+                 **self.prompt_caching.body_params(request.messages)})
+
+    def batch_response(self, unit: WorkUnit, cache_key: str, result: Dict[str, Any]) -> str:
+        """Turn one batch result into the unit's response, caching and checkpointing it."""
+        record = self.unit_records[unit]
+        if "error" in result:
+            logger.error(f"Batch request failed for {unit}: {result['error']}")
+            return f"ERROR: Failed to get response from {unit.model}"
+        if self.uses_voting(unit):
+            response, votes = self.voting.from_batch(self.cache, cache_key, result)
+            record.update(votes)
+        else:
+            choices = result.get("choices") or []
+            response = (choices[0]["message"].get("content") or "").strip() if choices else ""
+            usage = result.get("usage") or {}
+            record.update({"prompt_tokens": usage.get("prompt_tokens"),
+                           "completion_tokens": usage.get("completion_tokens"),
+                           **self.prompt_caching.record(result.get("model", unit.model), usage)})
+            if response:
+                self.cache.put(cache_key, response)
+        self.checkpoint.record(unit, response)
+        return response
+
+    def run_sweep_batch(self, models: List[str], plan: WorkPlan, task_items: Dict[str, List[Dict[str, str]]],
+                        batch: BatchRunner) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        """Run a built plan as provider batch jobs, then score and aggregate it.
+
+        Units already in the checkpoint log or the response cache are not
+        resubmitted, and requests shared by several units (e.g. aliased
+        models) are sent once.
+        """
+        plan.log_summary()
+        units = plan.units()
+
+        responses = {}
+        pending = {}
+        bodies = {}
+        for request in plan:
+            unit = request.unit
+            record = self.unit_records[unit] = {}
+            response = self.checkpoint.get(unit)
+            if response is not None:
+                record["resumed"] = True
+                responses[unit] = response
+                continue
+            cache_key, body = self.batch_request(request)
+            try:
+                cached = self.cache.get(cache_key)
+            except CacheMiss as e:
+                logger.warning(f"Replay mode: {str(e)} for {unit.model}")
+                responses[unit] = f"ERROR: No cached response for {unit.model}"
+                continue
+            if cached is not None:
+                record["cached"] = True
+                responses[unit] = majority_vote(json.loads(cached))[0] if self.uses_voting(unit) else cached
+                continue
+            pending.setdefault(cache_key, []).append(unit)
+            bodies[cache_key] = body
+
+        logger.info(f"Batch sweep: {len(responses)} units resumed or cached, "
+                    f"{len(bodies)} requests to submit for {sum(map(len, pending.values()))} units")
+        with span("request.batch"):
+            results = batch.run(list(bodies.items()))
+        for cache_key, waiting in pending.items():
+            for unit in waiting:
+                responses[unit] = self.batch_response(unit, cache_key, results[cache_key])
+
+        references = [task_items[unit.task][unit.item_index]['reference'] for unit in units]
+        ordered = [responses[unit] for unit in units]
+        if self.scoring:
+            for unit, reference, response in zip(units, references, ordered):
+                self.scoring.submit(unit, reference, response)
+            with span("score.drain"):
+                scored = self.scoring.drain()
+            item_metrics = [scored.get(unit) for unit in units]
+        else:
+            item_metrics = self.score_responses(references, ordered)
+        self.collect_rows(units, references, ordered, item_metrics)
+        return self.aggregate_sweep(models, units, item_metrics)
+
+    def aggregate_sweep(self, models: List[str], units: List[WorkUnit],
+                        item_metrics: List[Optional[Dict[str, float]]]) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        """Group per-item metrics back into the model -> task -> technique shape."""
+        return group_results(models, list(self.tasks), list(self.prompting_techniques), units, item_metrics)
+
+def plot_results(all_results: Dict[str, Dict[str, Dict[str, Dict[str, float]]]], output_path: str, timestamp: str,
+                 renderer: Optional[FigureRenderer] = None):
+    """Render the model x task x technique heatmaps for a results dict."""
+    renderer = renderer or FigureRenderer()
+    models = list(all_results)
+    tasks = list(next(iter(all_results.values())))
+    techniques = list(next(iter(next(iter(all_results.values())).values())))
+    rows = [f"{model}-{task}" for model in models for task in tasks]
+    scores = {
+        metric: {
+            f"{model}-{task}": {technique: all_results[model][task][technique][metric] for technique in techniques}
+            for model in models
+            for task in tasks
+        }
+        for metric in ['f1_score', 'rouge1', 'rouge2', 'rougeL', 'bleu_score']
+    }
+
+    # One heatmap panel per metric, stacked in a single figure
+    panels = [
+        heatmap_panel(f'{metric} Performance', rows, techniques, matrix(data, rows, techniques))
+        for metric, data in scores.items()
+    ]
+    renderer.render([heatmap_figure(f"comprehensive_comparison_{timestamp}", panels, [15, 4*len(panels)])], output_path)
+
+def merge_shards(paths: List[str], output_path: str = "evaluation_results",
+                 renderer: Optional[FigureRenderer] = None) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+    """Combine the shard files of one sweep into its results JSON and figures."""
+    sweep = load_shards(paths)
+    logger.info(f"Merging {len(sweep['units'])} work units of sweep {sweep['sweep_id']}")
+    all_results = group_results(sweep["models"], sweep["tasks"], sweep["techniques"],
+                                sweep["units"], sweep["item_metrics"])
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(output_path, exist_ok=True)
+    with open(f"{output_path}/comprehensive_results_{timestamp}.json", "w") as f:
+        json.dump(all_results, f, indent=2)
+    plot_results(all_results, output_path, timestamp, renderer)
+    return all_results
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Evaluate OpenAI models across tasks and prompting techniques")
+    parser.add_argument("--num-samples", type=int, default=5,
+                        help="Number of dataset samples per task (default: 5)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Send one request at a time instead of running work units concurrently")
+    parser.add_argument("--plan-only", action="store_true",
+                        help="Build and print the work plan (counts, estimated tokens) without sending requests")
+    parser.add_argument("--max-in-flight", action="append", metavar="PROVIDER=N",
+                        help="In-flight request limit for a provider, e.g. openai=16 (repeatable)")
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_dataset_arguments(parser)
+    add_scoring_arguments(parser)
+    add_results_store_arguments(parser)
+    add_plot_arguments(parser)
+    add_http_arguments(parser)
+    add_self_consistency_arguments(parser)
+    add_batch_arguments(parser)
+    add_shard_arguments(parser)
+    add_profiling_arguments(parser)
+    add_event_log_arguments(parser)
+    add_token_budget_arguments(parser)
+    add_adaptive_arguments(parser)
+    add_prompt_caching_arguments(parser)
+    add_hedging_arguments(parser)
+    add_mock_server_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.shard and args.sequential:
+        parser.error("--shard needs the planned sweep; it cannot be combined with --sequential")
+    if args.adaptive and (args.shard or args.batch or args.sequential):
+        parser.error("--adaptive decides each round from the previous one; it cannot be combined with "
+                     "--shard, --batch or --sequential")
+    return args
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    with profile_run(args):
+        run_benchmark(args)
+
+def run_benchmark(args):
+    if args.mock_server:
+        point_clients_at(args.mock_server)
+
+    # The run id doubles as the timestamp in output file names
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_name = f"comprehensive_{timestamp}" + (f"_shard-{shard_label(*args.shard)}" if args.shard else "")
 
-def main():
     # Initialize evaluator
     try:
-        evaluator = ModelEvaluator()
+        evaluator = ModelEvaluator(
+            cache=ResponseCache.from_args(args),
+            rate_limiter=scheduler_from_args(args),
+            checkpoint=CheckpointLog.from_args(
+                args, f"comprehensive-shard-{shard_label(*args.shard)}.jsonl" if args.shard else "comprehensive.jsonl"
+            ),
+            datasets=provider_from_args(args),
+            scoring=pipeline_from_args(args, normalize_answer),
+            clients=clients_from_args(args),
+            voting=sampler_from_args(args),
+            events=EventLog.from_args(args, run_name),
+            budget=budget_from_args(args),
+            prompt_caching=prompt_caching_from_args(args),
+            hedging=hedging_from_args(args)
+        )
     except ValueError as e:
         logger.error(f"Failed to initialize evaluator: {str(e)}")
         return
@@ -438,51 +1014,84 @@ def main():
         "o3-mini"
     ]
     
+    # Pre-flight token count, spend and runtime estimate; the sweep runs this same plan
+    plan, task_items = evaluator.build_plan(models, args.num_samples, args.shard)
+    in_flight_limits = {} if args.sequential else {**DEFAULT_IN_FLIGHT_LIMITS, **parse_in_flight_limits(args.max_in_flight)}
+    estimate = evaluator.budget.estimate(plan, evaluator.rate_limiter, in_flight_limits,
+                                           evaluator.request_fan_out)
+    evaluator.budget.counter.save()
+    if args.plan_only:
+        print(json.dumps({**plan.summary(), "estimate": estimate}, indent=2))
+        return
+    logger.info(f"Pre-flight estimate: {json.dumps(estimate, indent=2)}")
+    if args.max_spend is not None and estimate["total"]["expected_cost_usd"] > args.max_spend:
+        logger.error(f"Estimated cost ${estimate['total']['expected_cost_usd']:.2f} exceeds --max-spend "
+                     f"${args.max_spend:.2f}; not starting the sweep")
+        return
+
     # Store results
-    all_results = {}
-    
-    for model in models:
-        all_results[model] = {}
-        for task_name, task_func in evaluator.tasks.items():
-            all_results[model][task_name] = {}
-            for technique in evaluator.prompting_techniques:
-                evaluator.current_technique = technique  # Set current technique
-                results = task_func(model, num_samples=5)  # Reduced samples for testing
-                all_results[model][task_name][technique] = results
+    if args.batch:
+        all_results = evaluator.run_sweep_batch(
+            models, plan, task_items, batch_runner_from_args(args, evaluator.openai_client)
+        )
+    elif args.sequential:
+        all_results = evaluator.run_sweep(models, args.num_samples)
+    elif args.adaptive:
+        halving = halving_from_args(args)
+        all_results = evaluator.run_sweep_adaptive(
+            models, plan, task_items, halving, parse_in_flight_limits(args.max_in_flight)
+        )
+    else:
+        all_results = evaluator.run_sweep_concurrent(
+            models, plan, task_items, parse_in_flight_limits(args.max_in_flight)
+        )
+    evaluator.checkpoint.close()
+    if evaluator.scoring:
+        evaluator.scoring.close()
+        logger.info(f"Scoring pipeline: {json.dumps(evaluator.scoring.stats(), indent=2)}")
+    logger.info(f"Connection pools: {json.dumps(evaluator.clients.stats(), indent=2)}")
+    evaluator.clients.close()
+    logger.info(f"Response cache: {evaluator.cache.stats()}")
+    logger.info(f"Coalesced requests: {json.dumps(evaluator.single_flight.stats(), indent=2)}")
+    logger.info(f"Prompt caching: {json.dumps(evaluator.prompt_caching.stats(), indent=2)}")
+    if evaluator.hedging.enabled:
+        logger.info(f"Hedged requests: {json.dumps(evaluator.hedging.stats(), indent=2)}")
+        evaluator.hedging.close()
+    logger.info(f"Rate limiter queue waits: {json.dumps(evaluator.rate_limiter.stats(), indent=2)}")
+    evaluator.events.close()
+    logger.info(f"Event log: {evaluator.events.stats()}")
+
+    store = store_from_args(args)
+    if store:
+        store.append([dict(row, run_id=timestamp) for row in evaluator.result_rows])
+
+    if args.shard:
+        # A shard's aggregates are partial; `cli.py merge` combines the shards' per-item metrics
+        rows = evaluator.result_rows
+        write_shard(
+            shard_path(args.shard_dir, evaluator.sweep_id, *args.shard), evaluator.sweep_id, *args.shard,
+            models, list(evaluator.tasks), sorted(evaluator.prompting_techniques),
+            [WorkUnit(row["model"], row["task"], row["technique"], row["item_index"]) for row in rows],
+            [None if row["error"] else {metric: row[metric] for metric in METRIC_NAMES} for row in rows]
+        )
+        return
 
     # Create multi-level heatmap
     if all_results:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = "evaluation_results"
         os.makedirs(output_path, exist_ok=True)
 
         # Save raw results
         with open(f"{output_path}/comprehensive_results_{timestamp}.json", "w") as f:
             json.dump(all_results, f, indent=2)
+        if args.adaptive:
+            allocation = halving.report()
+            with open(f"{output_path}/comprehensive_allocation_{timestamp}.json", "w") as f:
+                json.dump(allocation, f, indent=2)
+            logger.info(f"Adaptive allocation: {allocation['samples_used']} of {allocation['samples_full']} "
+                        f"samples; per-cell counts in {output_path}/comprehensive_allocation_{timestamp}.json")
 
-        # Create subplot for each metric
-        metrics = ['f1_score', 'rouge1', 'rouge2', 'rougeL', 'bleu_score']
-        fig, axes = plt.subplots(len(metrics), 1, figsize=(15, 4*len(metrics)))
-        
-        for idx, metric in enumerate(metrics):
-            data = {
-                (model, task, technique): all_results[model][task][technique][metric]
-                for model in models
-                for task in evaluator.tasks.keys()
-                for technique in evaluator.prompting_techniques
-            }
-            
-            df = pd.DataFrame.from_dict(data, orient='index')
-            df.index = pd.MultiIndex.from_tuples(df.index)
-            df = df.unstack()
-            
-            sns.heatmap(df, ax=axes[idx], annot=True, fmt='.3f', cmap='YlOrRd')
-            axes[idx].set_title(f'{metric} Performance')
-
-        plt.tight_layout()
-        plt.savefig(f"{output_path}/comprehensive_comparison_{timestamp}.png", 
-                   dpi=300, bbox_inches='tight')
-        plt.close()
+        plot_results(all_results, output_path, timestamp, renderer_from_args(args))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
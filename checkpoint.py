@@ -0,0 +1,114 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, Optional
+
+from sweep_engine import WorkUnit
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.path.join("evaluation_results", "checkpoints")
+
+
+class CheckpointLog:
+    """Append-only JSONL log of completed work units for crash-safe resume.
+
+    Each line records the response for one (model, task, technique, item) unit
+    and is flushed to disk before the unit counts as done. Error responses are
+    not recorded so a resumed run retries them. Metrics are recomputed from the
+    logged responses, which keeps the log valid across scoring changes.
+    """
+
+    def __init__(self, path: Optional[str] = None, resume: bool = False):
+        self.path = path
+        self.resumed = 0
+        self._done = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._mode = None
+
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if resume and os.path.exists(path):
+            self._done = self._load(path)
+            self.resumed = len(self._done)
+            logger.info(f"Resuming from {path}: {self.resumed} work units already completed")
+        self._mode = "a" if resume else "w"
+
+    def _open(self):
+        # Opened on the first write so runs that send nothing leave an old log intact
+        self._file = open(self.path, self._mode, encoding="utf-8")
+        if self._mode == "a" and self._file.tell() > 0 and not self._ends_with_newline(self.path):
+            # Terminate a torn last line so new records start on their own line
+            self._file.write("\n")
+        self._mode = "a"
+
+    @staticmethod
+    def _load(path: str) -> Dict[WorkUnit, str]:
+        done = {}
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                    done[WorkUnit(**record["unit"])] = record["response"]
+                except (ValueError, KeyError, TypeError):
+                    # A crash can leave a partial last line; skip anything unreadable
+                    logger.warning(f"Skipping unreadable checkpoint line {line_number} in {path}")
+        return done
+
+    @staticmethod
+    def _ends_with_newline(path: str) -> bool:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def get(self, unit: WorkUnit) -> Optional[str]:
+        """Return the logged response for a completed unit, or None."""
+        return self._done.get(unit)
+
+    def record(self, unit: WorkUnit, response: str):
+        """Durably log a unit's response; error responses are skipped."""
+        if not self.enabled or response.startswith("ERROR:"):
+            return
+        line = json.dumps({
+            "unit": {
+                "model": unit.model,
+                "task": unit.task,
+                "technique": unit.technique,
+                "item_index": unit.item_index
+            },
+            "response": response
+        }, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._done[unit] = response
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def from_args(cls, args, default_name: str) -> "CheckpointLog":
+        path = args.checkpoint or os.path.join(CHECKPOINT_DIR, default_name)
+        return cls(path, resume=args.resume)
+
+
+def add_checkpoint_arguments(parser):
+    """Add the shared checkpoint/resume flags to an argparse parser."""
+    group = parser.add_argument_group("checkpointing")
+    group.add_argument("--checkpoint", metavar="PATH",
+                       help=f"JSONL log of completed work units (default: under {CHECKPOINT_DIR})")
+    group.add_argument("--resume", action="store_true",
+                       help="Skip work units already recorded in the checkpoint log")
+    return group
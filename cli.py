@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+import time
+import json
+import argparse
+import builtins
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from plotting import add_plot_arguments, renderer_from_args
+
+# Subcommand -> module whose main(argv) it runs; imported only when selected
+RUNNERS = {
+    "comprehensive": "benchmark",
+    "simple": "simple_benchmark",
+    "compare": "compare_benchmark",
+    "load-test": "load_test",
+    "mock-server": "mock_llm_server",
+    "self-check": "self_check"
+}
+
+# Results file prefix -> module whose plot_results renders it
+PLOTTERS = {
+    "comprehensive": "benchmark",
+    "simple": "simple_benchmark",
+    "comparison": "compare_benchmark"
+}
+
+RESULTS_FILE_PATTERN = re.compile(r"^(comprehensive|simple|comparison)_results_(\d{8}_\d{6})\.json$")
+
+
+class ImportProfiler:
+    """Times the first import of every module by wrapping builtins.__import__.
+
+    Times are inclusive, so a package's entry also covers the submodules and
+    dependencies it imports while loading.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.timings.setdefault(name, time.perf_counter() - start)
+
+    def start(self):
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def stop(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def report(self, limit: int = 20) -> List[Dict[str, float]]:
+        slowest = sorted(self.timings.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"module": name, "seconds": round(seconds, 4)} for name, seconds in slowest]
+
+
+def plot_results_file(results_file: str, kind: Optional[str] = None, output_path: Optional[str] = None,
+                      renderer=None):
+    """Re-render the figures for a saved results JSON without running any evaluation."""
+    match = RESULTS_FILE_PATTERN.match(os.path.basename(results_file))
+    kind = kind or (match.group(1) if match else None)
+    if kind not in PLOTTERS:
+        raise ValueError(f"Cannot tell the results kind of {results_file}; pass --kind")
+    timestamp = match.group(2) if match else datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = output_path or os.path.dirname(results_file) or "."
+
+    with open(results_file) as f:
+        all_results = json.load(f)
+    module = __import__(PLOTTERS[kind])
+    module.plot_results(all_results, output_path, timestamp, renderer)
+
+
+def plot_store_run(store_path: str, run_id: Optional[str] = None, output_path: Optional[str] = None,
+                   renderer=None):
+    """Plot one run from the per-item results store (the latest run by default)."""
+    from results_store import ResultsStore
+    store = ResultsStore(store_path)
+    runs = store.runs()
+    if not runs:
+        raise ValueError(f"No runs in results store {store_path}")
+    run_id = run_id or runs[-1]
+    import benchmark
+    benchmark.plot_results(store.nested_results(run_id), output_path or store_path, run_id, renderer)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Unified entry point for the benchmark scripts",
+        # No prefix matching: the scripts' own flags (e.g. --profile) pass through unabbreviated
+        allow_abbrev=False,
+        epilog="Arguments after the subcommand are passed to that script, e.g. `cli.py comprehensive --help`."
+    )
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="Print the slowest module imports on exit")
+    parser.add_argument("--profile-limit", type=int, default=20,
+                        help="Number of modules listed by --profile-imports (default: 20)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, module in RUNNERS.items():
+        subparsers.add_parser(command, add_help=False, help=f"Run {module}.py")
+
+    plot = subparsers.add_parser("plot", help="Re-plot a saved results JSON or a results store run")
+    plot.add_argument("results_file", nargs="?")
+    plot.add_argument("--store", metavar="DIR", help="Plot from a per-item results store instead of a JSON file")
+    plot.add_argument("--run", help="Run id to plot from --store (default: latest)")
+    plot.add_argument("--kind", choices=sorted(PLOTTERS),
+                      help="Results kind (default: detected from the file name)")
+    plot.add_argument("--output-dir", help="Directory for figures (default: next to the results file)")
+    add_plot_arguments(plot)
+
+    merge = subparsers.add_parser("merge", help="Combine the shard results of a sharded comprehensive sweep")
+    merge.add_argument("shards", nargs="+", metavar="SHARD",
+                       help="Shard result files, or the sweep directory holding them")
+    merge.add_argument("--output-dir", default="evaluation_results",
+                       help="Directory for the merged results and figures (default: evaluation_results)")
+    add_plot_arguments(merge)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args, rest = build_parser().parse_known_args(argv)
+    profiler = ImportProfiler()
+    if args.profile_imports:
+        profiler.start()
+    try:
+        if args.command == "merge":
+            if rest:
+                build_parser().error(f"unrecognized arguments: {' '.join(rest)}")
+            import benchmark
+            benchmark.merge_shards(args.shards, args.output_dir, renderer_from_args(args))
+        elif args.command == "plot":
+            if rest:
+                build_parser().error(f"unrecognized arguments: {' '.join(rest)}")
+            renderer = renderer_from_args(args)
+            if args.store:
+                plot_store_run(args.store, args.run, args.output_dir, renderer)
+            elif args.results_file:
+                plot_results_file(args.results_file, args.kind, args.output_dir, renderer)
+            else:
+                build_parser().error("plot needs RESULTS_FILE or --store")
+        else:
+            __import__(RUNNERS[args.command]).main(rest)
+    finally:
+        profiler.stop()
+        if args.profile_imports:
+            print(json.dumps(profiler.report(args.profile_limit), indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,19 @@ import os
 import json
 import logging
 import time
+import argparse
 from datetime import datetime
-from typing import List, Dict, Any
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
-from openai import OpenAI
-from anthropic import Anthropic
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
-from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-from rouge_score import rouge_scorer
-import nltk
+from response_cache import ResponseCache, CacheMiss, request_key, add_cache_arguments
+from mock_llm_server import add_mock_server_arguments, point_clients_at
+from plotting import FigureRenderer, heatmap_figure, heatmap_panel, matrix, add_plot_arguments, renderer_from_args
+from http_clients import ProviderClients, add_http_arguments, clients_from_args
+from prompt_caching import PromptCaching, add_prompt_caching_arguments, prompt_caching_from_args
+from hedging import HedgingPolicy, add_hedging_arguments, hedging_from_args
+from rate_limiter import RateLimitScheduler, estimate_request_tokens, add_rate_limit_arguments, scheduler_from_args
 import re
 
-# Download required NLTK data
-nltk.download('punkt', quiet=True)
-
 # Load environment variables
 load_dotenv()
 
@@ -29,11 +25,75 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+LATENCY_PERCENTILES = [50, 95, 99]
+
+def stream_timings(request_start: float, token_times: List[float], output_tokens: int) -> Dict[str, Any]:
+    """Derive streaming latency metrics from the arrival time of each content chunk.
+
+    Inter-token latency is measured between consecutive content chunks, which
+    is one token for OpenAI and usually a few tokens for Anthropic.
+    """
+    if not token_times:
+        return {"ttft_seconds": None, "inter_token_latencies": [], "output_tokens_per_second": None}
+    decode_time = token_times[-1] - token_times[0]
+    return {
+        "ttft_seconds": token_times[0] - request_start,
+        "inter_token_latencies": [b - a for a, b in zip(token_times, token_times[1:])],
+        # Decode speed after the first token; single-chunk replies fall back to total time
+        "output_tokens_per_second": (
+            output_tokens / decode_time if decode_time > 0
+            else output_tokens / max(token_times[-1] - request_start, 1e-9)
+        )
+    }
+
+def summarize_latencies(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate per-request timings into p50/p95/p99 for each latency metric."""
+    import numpy as np
+
+    def percentiles(values):
+        values = [v for v in values if v is not None]
+        if not values:
+            return None
+        return {f"p{p}": float(np.percentile(values, p)) for p in LATENCY_PERCENTILES}
+
+    # Cached responses replay old timings, so leave them out
+    live = [r for r in records if not r.get("cached")]
+    summary = {
+        "requests": len(live),
+        "time_seconds": percentiles([r["time_seconds"] for r in live])
+    }
+    if any("ttft_seconds" in r for r in live):
+        summary["ttft_seconds"] = percentiles([r.get("ttft_seconds") for r in live])
+        summary["inter_token_latency_seconds"] = percentiles(
+            [gap for r in live for gap in r.get("inter_token_latencies", [])]
+        )
+        summary["output_tokens_per_second"] = percentiles([r.get("output_tokens_per_second") for r in live])
+    if any(r.get("cached_input_tokens") for r in live):
+        summary["cached_input_tokens"] = sum(r.get("cached_input_tokens", 0) for r in live)
+    return summary
+
 class ModelComparisonBenchmark:
-    def __init__(self):
-        # Initialize API clients
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        self.anthropic_client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+    def __init__(self, cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimitScheduler] = None, stream: bool = False,
+                 clients: Optional[ProviderClients] = None,
+                 prompt_caching: Optional[PromptCaching] = None,
+                 hedging: Optional[HedgingPolicy] = None):
+        # The scoring import is deferred until a benchmark is built
+        from rouge_score import rouge_scorer
+
+        # Shared, pooled API clients (SDK retries are disabled; the rate limiter owns retries)
+        self.clients = clients or ProviderClients()
+        self.openai_client = self.clients.openai()
+        self.anthropic_client = self.clients.anthropic()
+        self.cache = cache or ResponseCache(mode="off")
+        self.rate_limiter = rate_limiter or RateLimitScheduler()
+        self.stream = stream
+        # Cached-token accounting; with caching enabled, few-shot prompts get a cacheable prefix
+        self.prompt_caching = prompt_caching or PromptCaching()
+        # Optional hedging of slow non-streamed requests; disabled, every request is sent once
+        self.hedging = hedging or HedgingPolicy()
+        # Per-request timing records keyed by (model, technique)
+        self.latency_records = {}
         
         # Verify API keys
         if not os.getenv('OPENAI_API_KEY'):
@@ -72,21 +132,51 @@ class ModelComparisonBenchmark:
 
     def get_model_response(self, model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """Route to appropriate API based on model name."""
-        if model.startswith("claude"):
-            return self.get_anthropic_response(model, messages)
+        provider = "anthropic" if model.startswith("claude") else "openai"
+        cache_key = request_key(provider, model, messages, temperature=0, max_tokens=1024)
+        try:
+            cached = self.cache.get(cache_key)
+        except CacheMiss as e:
+            logger.warning(f"Replay mode: {str(e)} for {model}")
+            return {
+                "response": "ERROR: No cached response",
+                "time_seconds": 0,
+                "input_tokens": 0,
+                "output_tokens": 0
+            }
+        if cached is not None:
+            # Timings and token counts are those of the original call
+            return dict(cached, cached=True)
+
+        if provider == "anthropic":
+            result = self.get_anthropic_response(model, messages)
         else:
-            return self.get_openai_response(model, messages)
+            result = self.get_openai_response(model, messages)
+
+        if not result["response"].startswith("ERROR"):
+            self.cache.put(cache_key, result)
+        return result
 
     def get_openai_response(self, model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """Get response from OpenAI model with metrics."""
+        if self.stream:
+            return self.get_openai_stream_response(model, messages)
+
         start_time = time.time()
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,
-                max_tokens=1024
+            # A hedge reserves its own slot from the model's rate limit budget
+            estimated_tokens = estimate_request_tokens(messages, 1024)
+            response, queue_wait = self.rate_limiter.call(
+                "openai", model,
+                lambda: self.hedging.call(model, lambda: self.openai_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0,
+                    max_tokens=1024,
+                    **self.prompt_caching.openai_params(messages)
+                ), lambda: self.rate_limiter.acquire("openai", model, estimated_tokens)),
+                estimated_tokens
             )
             
             result = response.choices[0].message.content
@@ -95,13 +185,16 @@ class ModelComparisonBenchmark:
             input_tokens = response.usage.prompt_tokens
             output_tokens = response.usage.completion_tokens
             
-            elapsed_time = time.time() - start_time
+            # Exclude time spent waiting on the rate limiter from the latency
+            elapsed_time = time.time() - start_time - queue_wait
             
             return {
                 "response": result,
                 "time_seconds": elapsed_time,
+                "queue_wait_seconds": queue_wait,
                 "input_tokens": input_tokens,
-                "output_tokens": output_tokens
+                "output_tokens": output_tokens,
+                **self.prompt_caching.record(model, response.usage)
             }
                 
         except Exception as e:
@@ -113,16 +206,73 @@ class ModelComparisonBenchmark:
                 "output_tokens": 0
             }
 
+    def get_openai_stream_response(self, model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Stream a response from an OpenAI model, recording time-to-first-token and decode speed."""
+        timing = {}
+        start_time = time.time()
+
+        def open_stream():
+            timing["request_start"] = time.perf_counter()
+            return self.openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                max_tokens=1024,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.prompt_caching.openai_params(messages)
+            )
+
+        try:
+            stream, queue_wait = self.rate_limiter.call("openai", model, open_stream,
+                                                        estimate_request_tokens(messages, 1024))
+
+            chunks = []
+            token_times = []
+            input_tokens = output_tokens = 0
+            usage = None
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    token_times.append(time.perf_counter())
+                    chunks.append(chunk.choices[0].delta.content)
+                # The final chunk carries usage and no choices
+                if chunk.usage:
+                    usage = chunk.usage
+                    input_tokens = usage.prompt_tokens
+                    output_tokens = usage.completion_tokens
+
+            result = {
+                "response": "".join(chunks),
+                "time_seconds": time.time() - start_time - queue_wait,
+                "queue_wait_seconds": queue_wait,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                **self.prompt_caching.record(model, usage)
+            }
+            result.update(stream_timings(timing["request_start"], token_times, output_tokens))
+            return result
+
+        except Exception as e:
+            logger.error(f"Error streaming response from {model}: {str(e)}")
+            return {
+                "response": f"ERROR: {str(e)}",
+                "time_seconds": time.time() - start_time,
+                "input_tokens": 0,
+                "output_tokens": 0
+            }
+
     def get_anthropic_response(self, model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """Get response from Anthropic model with metrics."""
+        if self.stream:
+            return self.get_anthropic_stream_response(model, messages)
+
         start_time = time.time()
         
         try:
-            # Extract system message and user message
-            system_message = next((m["content"] for m in messages if m["role"] == "system"), "")
-            user_messages = [m for m in messages if m["role"] == "user"]
+            # System prompt plus the conversation; with caching, the prefix carries a cache breakpoint
+            system_message, turns = self.prompt_caching.anthropic_request(messages)
             
-            if not user_messages:
+            if not any(m["role"] == "user" for m in turns):
                 return {
                     "response": "ERROR: No user message provided",
                     "time_seconds": 0,
@@ -130,15 +280,17 @@ class ModelComparisonBenchmark:
                     "output_tokens": 0
                 }
                 
-            # For Claude, we need the last user message
-            user_message = user_messages[-1]["content"]
-            
-            response = self.anthropic_client.messages.create(
-                model=model,
-                system=system_message,
-                messages=[{"role": "user", "content": user_message}],
-                max_tokens=1024,
-                temperature=0
+            estimated_tokens = estimate_request_tokens(messages, 1024)
+            response, queue_wait = self.rate_limiter.call(
+                "anthropic", model,
+                lambda: self.hedging.call(model, lambda: self.anthropic_client.messages.create(
+                    model=model,
+                    system=system_message,
+                    messages=turns,
+                    max_tokens=1024,
+                    temperature=0
+                ), lambda: self.rate_limiter.acquire("anthropic", model, estimated_tokens)),
+                estimated_tokens
             )
             
             result = response.content[0].text
@@ -147,13 +299,16 @@ class ModelComparisonBenchmark:
             input_tokens = response.usage.input_tokens
             output_tokens = response.usage.output_tokens
             
-            elapsed_time = time.time() - start_time
+            # Exclude time spent waiting on the rate limiter from the latency
+            elapsed_time = time.time() - start_time - queue_wait
             
             return {
                 "response": result,
                 "time_seconds": elapsed_time,
+                "queue_wait_seconds": queue_wait,
                 "input_tokens": input_tokens,
-                "output_tokens": output_tokens
+                "output_tokens": output_tokens,
+                **self.prompt_caching.record(model, response.usage)
             }
                 
         except Exception as e:
@@ -165,6 +320,69 @@ class ModelComparisonBenchmark:
                 "output_tokens": 0
             }
 
+    def get_anthropic_stream_response(self, model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Stream a response from an Anthropic model, recording time-to-first-token and decode speed."""
+        timing = {}
+        start_time = time.time()
+
+        system_message, turns = self.prompt_caching.anthropic_request(messages)
+        if not any(m["role"] == "user" for m in turns):
+            return {
+                "response": "ERROR: No user message provided",
+                "time_seconds": 0,
+                "input_tokens": 0,
+                "output_tokens": 0
+            }
+
+        def open_stream():
+            timing["request_start"] = time.perf_counter()
+            return self.anthropic_client.messages.create(
+                model=model,
+                system=system_message,
+                messages=turns,
+                max_tokens=1024,
+                temperature=0,
+                stream=True
+            )
+
+        try:
+            stream, queue_wait = self.rate_limiter.call("anthropic", model, open_stream,
+                                                        estimate_request_tokens(messages, 1024))
+
+            chunks = []
+            token_times = []
+            input_tokens = output_tokens = 0
+            usage = None
+            for event in stream:
+                if event.type == "message_start":
+                    usage = event.message.usage
+                    input_tokens = usage.input_tokens
+                elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                    token_times.append(time.perf_counter())
+                    chunks.append(event.delta.text)
+                elif event.type == "message_delta":
+                    output_tokens = event.usage.output_tokens
+
+            result = {
+                "response": "".join(chunks),
+                "time_seconds": time.time() - start_time - queue_wait,
+                "queue_wait_seconds": queue_wait,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                **self.prompt_caching.record(model, usage)
+            }
+            result.update(stream_timings(timing["request_start"], token_times, output_tokens))
+            return result
+
+        except Exception as e:
+            logger.error(f"Error streaming response from {model}: {str(e)}")
+            return {
+                "response": f"ERROR: {str(e)}",
+                "time_seconds": time.time() - start_time,
+                "input_tokens": 0,
+                "output_tokens": 0
+            }
+
     def normalize_answer(self, text: str) -> str:
         """Normalize text for comparison."""
         if not text:
@@ -210,6 +428,8 @@ class ModelComparisonBenchmark:
             return 0.0
             
         # Use smoothing function to avoid zero scores
+        from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+
         smoothie = SmoothingFunction().method1
         return sentence_bleu([reference_tokens], prediction_tokens, smoothing_function=smoothie)
 
@@ -223,6 +443,16 @@ class ModelComparisonBenchmark:
                     {"role": "system", "content": "You are a helpful assistant that provides accurate, concise answers."},
                     {"role": "user", "content": question}
                 ]
+            elif technique == "few_shot" and self.prompt_caching.enabled:
+                # Examples as fixed turns ahead of the question, so every item shares a cacheable prefix
+                return [
+                    {"role": "system", "content": "You are a helpful assistant that provides accurate, concise answers."},
+                    {"role": "user", "content": "Q: What is the capital of Spain?\nA:"},
+                    {"role": "assistant", "content": "Madrid"},
+                    {"role": "user", "content": "Q: Who wrote Hamlet?\nA:"},
+                    {"role": "assistant", "content": "William Shakespeare"},
+                    {"role": "user", "content": f"Q: {question}\nA:"}
+                ]
             elif technique == "few_shot":
                 examples = "Example 1: Q: What is the capital of Spain? A: Madrid\n\n"
                 examples += "Example 2: Q: Who wrote Hamlet? A: William Shakespeare\n\n"
@@ -256,7 +486,7 @@ class ModelComparisonBenchmark:
             {"role": "user", "content": f"Task: {task_type}\n\nContent: {item.get('question', item.get('text', ''))}"}
         ]
 
-    def evaluate_task(self, model: str, task_type: str, technique: str) -> Dict[str, float]:
+    def evaluate_task(self, model: str, task_type: str, technique: str) -> Dict[str, Any]:
         """Evaluate model on a specific task with a specific technique."""
         metrics = {
             "f1_score": 0.0,
@@ -267,6 +497,7 @@ class ModelComparisonBenchmark:
         }
         
         successful = 0
+        timing_records = []
         
         for item in self.tasks[task_type]:
             try:
@@ -280,6 +511,8 @@ class ModelComparisonBenchmark:
                 if "ERROR" in prediction:
                     logger.warning(f"Error in model response: {prediction}")
                     continue
+
+                timing_records.append(response_data)
                 
                 # Get reference answer
                 reference = item.get("answer", item.get("summary", ""))
@@ -306,6 +539,10 @@ class ModelComparisonBenchmark:
         if successful > 0:
             for key in metrics:
                 metrics[key] /= successful
+
+        # Latency percentiles sit next to the quality metrics in the results
+        metrics["latency"] = summarize_latencies(timing_records)
+        self.latency_records.setdefault((model, technique), []).extend(timing_records)
         
         return metrics
 
@@ -323,9 +560,57 @@ class ModelComparisonBenchmark:
         
         return results
 
-def main():
+def plot_results(all_results: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]], output_path: str, timestamp: str,
+                 renderer: Optional[FigureRenderer] = None):
+    """Render one model x technique heatmap per metric for a results dict."""
+    renderer = renderer or FigureRenderer()
+    metrics = ["f1_score", "bleu_score", "rouge1", "rouge2", "rougeL"]
+    figures = []
+    
+    for metric in metrics:
+        # Prepare data for heatmap
+        scores = {}
+        for model, tasks in all_results.items():
+            for task_type, techniques in tasks.items():
+                for technique, metric_scores in techniques.items():
+                    if metric in metric_scores:
+                        scores.setdefault(f"{model}-{task_type}", {})[technique] = metric_scores[metric]
+        rows = sorted(scores)
+        columns = sorted({technique for row in scores.values() for technique in row})
+        
+        panel = heatmap_panel(f'{metric} Performance', rows, columns, matrix(scores, rows, columns), vmin=0, vmax=1)
+        figures.append(heatmap_figure(f"{metric}_comparison_{timestamp}", [panel], [12, 8]))
+
+    for path in renderer.render(figures, output_path)["rendered"]:
+        logger.info(f"Saved heatmap to: {path}")
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare OpenAI and Anthropic models across prompting techniques")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream completions and record time-to-first-token, inter-token latency and tokens/sec")
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_plot_arguments(parser)
+    add_http_arguments(parser)
+    add_prompt_caching_arguments(parser)
+    add_hedging_arguments(parser)
+    add_mock_server_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.mock_server:
+        point_clients_at(args.mock_server)
+
     # Initialize benchmark
-    benchmark = ModelComparisonBenchmark()
+    benchmark = ModelComparisonBenchmark(
+        cache=ResponseCache.from_args(args),
+        rate_limiter=scheduler_from_args(args),
+        stream=args.stream,
+        clients=clients_from_args(args),
+        prompt_caching=prompt_caching_from_args(args),
+        hedging=hedging_from_args(args)
+    )
     
     # Models to evaluate (reduced set)
     models = [
@@ -346,8 +631,22 @@ def main():
         except Exception as e:
             logger.error(f"Error evaluating {model}: {str(e)}")
             continue
+
+    logger.info(f"Connection pools: {json.dumps(benchmark.clients.stats(), indent=2)}")
+    benchmark.clients.close()
+    logger.info(f"Response cache: {benchmark.cache.stats()}")
+    logger.info(f"Prompt caching: {json.dumps(benchmark.prompt_caching.stats(), indent=2)}")
+    if benchmark.hedging.enabled:
+        logger.info(f"Hedged requests: {json.dumps(benchmark.hedging.stats(), indent=2)}")
+        benchmark.hedging.close()
+    logger.info(f"Rate limiter queue waits: {json.dumps(benchmark.rate_limiter.stats(), indent=2)}")
     
     if all_results:
+        # Latency percentiles pooled across tasks, saved next to each model's quality metrics
+        for (model, technique), records in benchmark.latency_records.items():
+            if model in all_results:
+                all_results[model].setdefault("latency", {})[technique] = summarize_latencies(records)
+
         # Save results
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = "evaluation_results"
@@ -359,41 +658,8 @@ def main():
             json.dump(all_results, f, indent=2)
         logger.info(f"Saved raw results to: {results_file}")
         
-        # Create heatmap visualizations for each metric
         metrics = ["f1_score", "bleu_score", "rouge1", "rouge2", "rougeL"]
-        
-        for metric in metrics:
-            plt.figure(figsize=(12, 8))
-            
-            # Prepare data for heatmap
-            rows = []
-            for model in models:
-                for task_type in benchmark.tasks:
-                    for technique in benchmark.prompting_techniques:
-                        try:
-                            score = all_results[model][task_type][technique][metric]
-                            rows.append({
-                                "model": f"{model}-{task_type}",
-                                "technique": f"{technique}",
-                                "score": score
-                            })
-                        except KeyError:
-                            continue
-            
-            # Create DataFrame
-            df = pd.DataFrame(rows)
-            pivot_df = df.pivot(index="model", columns="technique", values="score")
-            
-            # Create heatmap
-            ax = sns.heatmap(pivot_df, annot=True, cmap="YlOrRd", fmt=".3f", vmin=0, vmax=1)
-            plt.title(f'{metric} Performance')
-            plt.tight_layout()
-            
-            # Save heatmap
-            heatmap_file = f"{output_path}/{metric}_comparison_{timestamp}.png"
-            plt.savefig(heatmap_file, dpi=300, bbox_inches='tight')
-            plt.close()
-            logger.info(f"Saved {metric} heatmap to: {heatmap_file}")
+        plot_results(all_results, output_path, timestamp, renderer_from_args(args))
         
         # Print summary
         logger.info("\n=== Comparison Summary ===")
@@ -404,6 +670,11 @@ def main():
                 for task_type in benchmark.tasks:
                     avg_score = sum(all_results[model][task_type][t][metric] for t in benchmark.prompting_techniques) / len(benchmark.prompting_techniques)
                     logger.info(f"    {task_type}: {avg_score:.4f}")
+
+        logger.info("\n=== Latency Summary (model x technique) ===")
+        for model in models:
+            for technique, summary in all_results.get(model, {}).get("latency", {}).items():
+                logger.info(f"  {model} / {technique}: {json.dumps(summary)}")
     
     else:
         logger.error("No results were generated.")
@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from profiling import timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATASET_CACHE_DIR = os.path.join(".benchmark_cache", "datasets")
+
+# Rows buffered by streaming-mode shuffles
+STREAMING_SHUFFLE_BUFFER = 1000
+
+
+def seeded_sample_indices(length: int, num_samples: int, seed: int = 42) -> List[int]:
+    """Indices of the first `num_samples` rows of `dataset.shuffle(seed=seed)`.
+
+    Dataset.shuffle draws `np.random.default_rng(seed).permutation(len(dataset))`,
+    so taking a prefix of the same permutation selects exactly the same rows
+    without building a shuffled indices mapping over the whole split.
+    """
+    import numpy as np
+
+    permutation = np.random.default_rng(seed).permutation(length)
+    return [int(i) for i in permutation[:num_samples]]
+
+
+class DatasetProvider:
+    """Seeded dataset samples, memoized in-process and on disk.
+
+    A sample is identified by (path, name, split, seed, mode). Because samples
+    are prefixes of one seeded permutation, a cached sample of N rows also
+    serves any request for fewer rows. Streaming mode uses a buffered shuffle
+    over a streamed split, so it selects different rows than the default mode
+    and is cached separately.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_DATASET_CACHE_DIR,
+                 streaming: bool = False, seed: int = 42):
+        self.cache_dir = cache_dir
+        self.streaming = streaming
+        self.seed = seed
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path: str, name: Optional[str], split: str) -> str:
+        mode = "streaming" if self.streaming else "indexed"
+        return f"{path}/{name or 'default'}/{split}/seed{self.seed}/{mode}"
+
+    def _cache_file(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        cache_file = self._cache_file(key)
+        if not cache_file or not os.path.exists(cache_file):
+            return None
+        try:
+            with open(cache_file, encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry if entry.get("key") == key else None
+        except (OSError, ValueError):
+            logger.warning(f"Ignoring unreadable dataset cache file {cache_file}")
+            return None
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]):
+        cache_file = self._cache_file(key)
+        if not cache_file:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = f"{cache_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_file, cache_file)
+
+    @timed("dataset.load")
+    def _load_rows(self, path: str, name: Optional[str], split: str, num_samples: int,
+                   load_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        from datasets import load_dataset
+
+        args = (path, name) if name else (path,)
+        if self.streaming:
+            dataset = load_dataset(*args, split=split, streaming=True, **load_kwargs)
+            dataset = dataset.shuffle(seed=self.seed, buffer_size=STREAMING_SHUFFLE_BUFFER)
+            rows = list(dataset.take(num_samples))
+            return {"rows": rows, "exhausted": len(rows) < num_samples}
+
+        dataset = load_dataset(*args, split=split, **load_kwargs)
+        indices = seeded_sample_indices(len(dataset), num_samples, self.seed)
+        rows = dataset.select(indices).to_list()
+        return {"rows": rows, "exhausted": len(rows) < num_samples}
+
+    @timed("dataset.sample")
+    def sample(self, path: str, num_samples: int, name: Optional[str] = None,
+               split: str = "validation", **load_kwargs) -> List[Dict[str, Any]]:
+        """Return the first `num_samples` rows of the seeded shuffle of a split."""
+        key = self._key(path, name, split)
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is None or (len(entry["rows"]) < num_samples and not entry["exhausted"]):
+                disk_entry = self._read_disk(key)
+                if disk_entry and (len(disk_entry["rows"]) >= num_samples or disk_entry["exhausted"]):
+                    entry = disk_entry
+                else:
+                    logger.info(f"Loading {num_samples} samples from {key}")
+                    entry = self._load_rows(path, name, split, num_samples, load_kwargs)
+                    entry["key"] = key
+                    self._write_disk(key, entry)
+                self._memo[key] = entry
+        return entry["rows"][:num_samples]
+
+
+def add_dataset_arguments(parser):
+    """Add the dataset loading flags to an argparse parser."""
+    group = parser.add_argument_group("datasets")
+    group.add_argument("--dataset-cache-dir", default=DEFAULT_DATASET_CACHE_DIR,
+                       help=f"Directory for memoized dataset samples (default: {DEFAULT_DATASET_CACHE_DIR})")
+    group.add_argument("--streaming-datasets", action="store_true",
+                       help="Stream splits instead of downloading them (selects different rows)")
+    return group
+
+
+def provider_from_args(args) -> DatasetProvider:
+    return DatasetProvider(cache_dir=args.dataset_cache_dir, streaming=args.streaming_datasets)
@@ -0,0 +1,122 @@
+import os
+import json
+import queue
+import hashlib
+import logging
+import itertools
+import logging.handlers
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENT_DIR = os.path.join("evaluation_results", "events")
+
+# Libraries that log one INFO line per HTTP request
+REQUEST_LOGGERS = ["httpx", "httpx2", "openai", "anthropic"]
+
+_instances = itertools.count()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One compact JSON object per record: timestamp, event name and the record's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({"ts": round(record.created, 3), "event": record.msg, **getattr(record, "fields", {})},
+                          ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class EventLog:
+    """Structured per-item events written as JSONL by a background thread.
+
+    Callers hand records to a QueueHandler, so the evaluation loop never
+    formats or writes them; a QueueListener thread does both. Keyed events
+    are sampled deterministically by key, so a rerun logs the same items.
+    Without a path every method is a no-op.
+    """
+
+    def __init__(self, path: Optional[str] = None, sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.emitted = 0
+        self.sampled_out = 0
+        self._listener = None
+        self._logger = None
+        if path is None:
+            return
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        records = queue.SimpleQueue()
+        handler = logging.FileHandler(path, mode="a", encoding="utf-8", delay=True)
+        handler.setFormatter(JsonLinesFormatter())
+        self._listener = logging.handlers.QueueListener(records, handler)
+        self._listener.start()
+        # A private, non-propagating logger so events never reach the console
+        self._logger = logging.getLogger(f"{__name__}.{next(_instances)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(logging.handlers.QueueHandler(records))
+
+    @property
+    def enabled(self) -> bool:
+        return self._logger is not None
+
+    def should_log(self, key: str) -> bool:
+        """Whether the event for `key` is in the sample; check before building expensive fields."""
+        if self._logger is None:
+            return False
+        if self.sample_rate >= 1.0:
+            return True
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        if int.from_bytes(digest, "big") / 2 ** 64 < self.sample_rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+    def emit(self, event: str, **fields: Any):
+        """Queue one event record; sampling is the caller's `should_log` check."""
+        if self._logger is None:
+            return
+        self.emitted += 1
+        self._logger.info(event, extra={"fields": fields})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "emitted": self.emitted, "sampled_out": self.sampled_out}
+
+    def close(self):
+        """Flush queued events and stop the writer thread."""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+        self._logger.handlers.clear()
+        self._logger = None
+
+    @classmethod
+    def from_args(cls, args, run_name: str) -> "EventLog":
+        if not args.http_logs:
+            quiet_request_loggers()
+        if args.no_event_log:
+            return cls()
+        return cls(args.event_log or os.path.join(DEFAULT_EVENT_DIR, f"{run_name}.jsonl"), args.event_sample_rate)
+
+
+def quiet_request_loggers():
+    """Keep per-request INFO lines from the HTTP and SDK libraries off the console."""
+    for name in REQUEST_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def add_event_log_arguments(parser):
+    """Add the structured event log flags to an argparse parser."""
+    group = parser.add_argument_group("event log")
+    group.add_argument("--event-log", metavar="PATH",
+                       help=f"JSONL file of per-item events (default: a per-run file under {DEFAULT_EVENT_DIR})")
+    group.add_argument("--event-sample-rate", type=float, default=1.0,
+                       help="Fraction of items whose events are logged; failed items are always logged (default: 1.0)")
+    group.add_argument("--no-event-log", action="store_true",
+                       help="Do not write per-item events")
+    group.add_argument("--http-logs", action="store_true",
+                       help="Keep the HTTP libraries' per-request INFO lines on the console")
+    return group
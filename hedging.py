@@ -0,0 +1,205 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLatencies:
+    __slots__ = ("recent", "requests", "hedged", "hedges_won")
+
+    def __init__(self, window: int):
+        self.recent = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.hedges_won = 0
+
+
+class HedgingPolicy:
+    """Hedged requests: re-send a call that is slower than usual and take whichever copy returns first.
+
+    A request still outstanding after the `percentile`-th percentile of the
+    model's recent latencies gets one duplicate. Hedging starts once
+    `min_samples` latencies have been seen. Hedges are capped at `budget`
+    times the model's requests. A duplicate first waits on `acquire`, which
+    callers point at the rate limiter, so hedges draw on the same RPM/TPM
+    budget as every other request. A copy that fails does not end the race
+    while the other is still running. In the sync `call`, the losing copy
+    runs to completion in the background and its result is discarded; in
+    `call_async` it is cancelled. While disabled, both just run the call.
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 95.0, budget: float = 0.05,
+                 min_samples: int = 20, window: int = 200, max_workers: int = 32):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self._models = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge") if enabled else None
+
+    def _state(self, model: str) -> ModelLatencies:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = ModelLatencies(self.window)
+        return state
+
+    def _hedge_delay(self, state: ModelLatencies) -> Optional[float]:
+        if len(state.recent) < self.min_samples:
+            return None
+        ordered = sorted(state.recent)
+        return ordered[min(len(ordered) - 1, int(self.percentile / 100 * len(ordered)))]
+
+    def _start(self, model: str) -> Optional[float]:
+        """Count a request and return its hedge delay, or None if it will not be hedged."""
+        with self._lock:
+            state = self._state(model)
+            state.requests += 1
+            if state.hedged + 1 > self.budget * state.requests:
+                return None
+            return self._hedge_delay(state)
+
+    def _take_budget(self, model: str) -> bool:
+        with self._lock:
+            state = self._state(model)
+            if state.hedged + 1 > self.budget * state.requests:
+                return False
+            state.hedged += 1
+            return True
+
+    def _finish(self, model: str, latency: float, hedge_won: bool = False):
+        with self._lock:
+            state = self._state(model)
+            state.recent.append(latency)
+            if hedge_won:
+                state.hedges_won += 1
+
+    @staticmethod
+    def _hedged(fn: Callable[[], Any], acquire: Optional[Callable[[], Any]]):
+        if acquire is not None:
+            acquire()
+        return fn()
+
+    def call(self, model: str, fn: Callable[[], Any], acquire: Optional[Callable[[], Any]] = None) -> Any:
+        """Run `fn`, hedging it with a second call if it runs past the model's hedge delay.
+
+        `acquire()` runs before the duplicate is sent, e.g. to reserve it from the rate limiter.
+        Latency is recorded from the primary's start whichever copy wins, so hedge wins do not
+        pull the hedge delay below what the request actually took.
+        """
+        if not self.enabled:
+            return fn()
+        delay = self._start(model)
+        started = time.perf_counter()
+        if delay is None:
+            result = fn()
+            self._finish(model, time.perf_counter() - started)
+            return result
+
+        primary = self._pool.submit(fn)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget(model):
+            result = primary.result()
+            self._finish(model, time.perf_counter() - started)
+            return result
+
+        logger.debug(f"Hedging {model} request after {delay:.2f}s")
+        hedge = self._pool.submit(self._hedged, fn, acquire)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                self._finish(model, time.perf_counter() - started, hedge_won=future is hedge)
+                return result
+        raise error
+
+    async def call_async(self, model: str, fn: Callable[[], Awaitable[Any]],
+                         acquire: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """Async counterpart of `call`; `fn` returns a fresh awaitable per copy and the loser is cancelled."""
+        if not self.enabled:
+            return await fn()
+        delay = self._start(model)
+        started = time.perf_counter()
+        if delay is None:
+            result = await fn()
+            self._finish(model, time.perf_counter() - started)
+            return result
+
+        async def hedged():
+            if acquire is not None:
+                await acquire()
+            return await fn()
+
+        primary = asyncio.ensure_future(fn())
+        pending = {primary}
+        hedge = None
+        error = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and self._take_budget(model):
+                logger.debug(f"Hedging {model} request after {delay:.2f}s")
+                hedge = asyncio.ensure_future(hedged())
+                pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    self._finish(model, time.perf_counter() - started, hedge_won=task is hedge)
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-model requests, hedges sent and won, and the current hedge delay."""
+        stats = {}
+        with self._lock:
+            for model, state in self._models.items():
+                delay = self._hedge_delay(state)
+                stats[model] = {
+                    "requests": state.requests,
+                    "hedged": state.hedged,
+                    "hedges_won": state.hedges_won,
+                    "hedge_rate": round(state.hedged / state.requests, 4) if state.requests else 0.0,
+                    "hedge_delay_seconds": round(delay, 3) if delay is not None else None
+                }
+        return stats
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+def add_hedging_arguments(parser):
+    """Add the hedged-request flags to an argparse parser."""
+    group = parser.add_argument_group("hedging")
+    group.add_argument("--hedge", action="store_true",
+                       help="Send a duplicate of any request slower than the model's recent latency percentile "
+                            "and keep whichever copy returns first")
+    group.add_argument("--hedge-percentile", type=float, default=95.0,
+                       help="Latency percentile after which a request is hedged (default: 95)")
+    group.add_argument("--hedge-budget", type=float, default=0.05,
+                       help="Maximum hedges as a fraction of each model's requests (default: 0.05)")
+    group.add_argument("--hedge-min-samples", type=int, default=20,
+                       help="Latencies to observe for a model before hedging its requests (default: 20)")
+    return group
+
+
+def hedging_from_args(args) -> HedgingPolicy:
+    return HedgingPolicy(enabled=args.hedge, percentile=args.hedge_percentile, budget=args.hedge_budget,
+                         min_samples=args.hedge_min_samples)
@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import logging
+import threading
+import importlib.util
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_REQUEST_TIMEOUT = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+
+class PoolMetrics:
+    """Connection-pool counters for one provider, fed by httpx event hooks and httpcore traces.
+
+    A request counts as in flight from when it is sent until its response
+    headers arrive. `saturated` counts requests that started with every pooled
+    connection already busy, i.e. requests that had to queue for a connection.
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.total_acquire = 0.0
+        self.max_acquire = 0.0
+        self._lock = threading.Lock()
+
+    def request_started(self, request):
+        request.extensions["pool_started_at"] = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.max_connections:
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def request_finished(self, request):
+        # Called on response headers or on a failed transport step, whichever comes first
+        if request.extensions.pop("pool_started_at", None) is None:
+            return
+        with self._lock:
+            self.in_flight -= 1
+
+    def trace(self, request, event: str):
+        if event.endswith(".failed"):
+            self.request_finished(request)
+        elif event == "connection.connect_tcp.started":
+            with self._lock:
+                self.new_connections += 1
+        elif event == "connection.start_tls.started":
+            with self._lock:
+                self.tls_handshakes += 1
+        elif event.endswith("send_request_headers.started"):
+            # Time spent waiting for a pooled connection (plus connecting, if a new one was opened)
+            started_at = request.extensions.get("pool_started_at")
+            if started_at is None:
+                return
+            acquire = time.perf_counter() - started_at
+            with self._lock:
+                self.total_acquire += acquire
+                self.max_acquire = max(self.max_acquire, acquire)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "saturated_requests": self.saturated,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "connection_reuse_rate": round(1 - self.new_connections / self.requests, 3) if self.requests else None,
+                "mean_acquire_seconds": round(self.total_acquire / self.requests, 4) if self.requests else 0.0,
+                "max_acquire_seconds": round(self.max_acquire, 4)
+            }
+
+
+def _http_library(sdk):
+    # SDK releases differ in which httpx distribution they build on; use the one behind its default client
+    return sys.modules[sdk.DefaultHttpxClient.__mro__[1].__module__.split(".")[0]]
+
+
+class ProviderClients:
+    """Shared, lazily built OpenAI/Anthropic SDK clients with tuned connection pools.
+
+    One instance per process is meant to be passed to every evaluator, so all
+    of them reuse the same keep-alive connections instead of each paying its
+    own TLS handshakes. SDK retries are disabled; the rate limiter owns retries.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 http2: bool = False):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.http2 = http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            self.http2 = False
+        self.metrics = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _pool_metrics(self, name: str) -> PoolMetrics:
+        metrics = self.metrics.get(name)
+        if metrics is None:
+            metrics = self.metrics[name] = PoolMetrics(self.max_connections)
+        return metrics
+
+    def _http_client_kwargs(self, sdk, provider: str, is_async: bool) -> Dict[str, Any]:
+        http = _http_library(sdk)
+        # Sync and async clients have separate pools, so they are measured separately
+        metrics = self._pool_metrics(f"{provider}-async" if is_async else provider)
+
+        if is_async:
+            async def on_request(request):
+                async def trace(event, info):
+                    metrics.trace(request, event)
+                request.extensions["trace"] = trace
+                metrics.request_started(request)
+
+            async def on_response(response):
+                metrics.request_finished(response.request)
+        else:
+            def on_request(request):
+                request.extensions["trace"] = lambda event, info: metrics.trace(request, event)
+                metrics.request_started(request)
+
+            def on_response(response):
+                metrics.request_finished(response.request)
+
+        return {
+            "limits": http.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_keepalive,
+                                  keepalive_expiry=self.keepalive_expiry),
+            "timeout": http.Timeout(self.request_timeout, connect=self.connect_timeout),
+            "http2": self.http2,
+            "event_hooks": {"request": [on_request], "response": [on_response]}
+        }
+
+    def _client(self, provider: str, is_async: bool):
+        key = (provider, is_async)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+            if provider == "openai":
+                import openai as sdk
+                client_class, api_key = (sdk.AsyncOpenAI if is_async else sdk.OpenAI), os.getenv('OPENAI_API_KEY')
+            elif provider == "anthropic":
+                import anthropic as sdk
+                client_class, api_key = (sdk.AsyncAnthropic if is_async else sdk.Anthropic), os.getenv('ANTHROPIC_API_KEY')
+            else:
+                raise ValueError(f"Unknown provider: {provider}")
+            http_client_class = sdk.DefaultAsyncHttpxClient if is_async else sdk.DefaultHttpxClient
+            http_client = http_client_class(**self._http_client_kwargs(sdk, provider, is_async))
+            client = self._clients[key] = client_class(api_key=api_key, max_retries=0, http_client=http_client)
+            return client
+
+    def openai(self):
+        return self._client("openai", False)
+
+    def async_openai(self):
+        return self._client("openai", True)
+
+    def anthropic(self):
+        return self._client("anthropic", False)
+
+    def async_anthropic(self):
+        return self._client("anthropic", True)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Pool saturation and connection reuse per client ("openai", "openai-async", ...)."""
+        return {name: metrics.snapshot() for name, metrics in self.metrics.items()}
+
+    def close(self):
+        """Close the synchronous clients; async clients close with their event loop."""
+        with self._lock:
+            for (provider, is_async), client in list(self._clients.items()):
+                if not is_async:
+                    client.close()
+                    del self._clients[(provider, is_async)]
+
+
+def add_http_arguments(parser):
+    """Add the shared HTTP connection-pool flags to an argparse parser."""
+    group = parser.add_argument_group("http")
+    group.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                       help=f"Connection pool size per provider client (default: {DEFAULT_MAX_CONNECTIONS})")
+    group.add_argument("--max-keepalive", type=int, default=DEFAULT_MAX_KEEPALIVE,
+                       help=f"Idle keep-alive connections kept per client (default: {DEFAULT_MAX_KEEPALIVE})")
+    group.add_argument("--request-timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT,
+                       help=f"Per-request timeout in seconds (default: {DEFAULT_REQUEST_TIMEOUT:g})")
+    group.add_argument("--http2", action="store_true",
+                       help="Use HTTP/2 (needs the h2 package)")
+    return group
+
+
+def clients_from_args(args) -> ProviderClients:
+    return ProviderClients(max_connections=args.max_connections, max_keepalive=args.max_keepalive,
+                           request_timeout=args.request_timeout, http2=args.http2)
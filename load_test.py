@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from compare_benchmark import ModelComparisonBenchmark, LATENCY_PERCENTILES
+from http_clients import ProviderClients, add_http_arguments, clients_from_args
+from mock_llm_server import add_mock_server_arguments, point_clients_at
+from plotting import FigureRenderer, line_figure, add_plot_arguments, renderer_from_args
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# A stage is (offered requests per second, duration in seconds)
+Stage = Tuple[float, float]
+
+
+def parse_ramp(value: str) -> List[float]:
+    """Parse a `START:STOP:STEP` ramp of request rates (inclusive of STOP)."""
+    try:
+        start, stop, step = (float(part) for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected START:STOP:STEP, e.g. 1:10:1, got {value!r}")
+    if start <= 0 or step <= 0 or stop < start:
+        raise argparse.ArgumentTypeError(f"Ramp {value!r} needs 0 < START <= STOP and STEP > 0")
+    rates = []
+    rate = start
+    while rate <= stop + 1e-9:
+        rates.append(round(rate, 6))
+        rate += step
+    return rates
+
+
+def poisson_schedule(stages: List[Stage], rng: random.Random) -> List[Tuple[int, float]]:
+    """(stage index, send offset in seconds) for every arrival of a Poisson process over the stages."""
+    schedule = []
+    stage_start = 0.0
+    for index, (rate, duration) in enumerate(stages):
+        offset = stage_start + rng.expovariate(rate)
+        while offset < stage_start + duration:
+            schedule.append((index, offset))
+            offset += rng.expovariate(rate)
+        stage_start += duration
+    return schedule
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    import numpy as np
+
+    if not values:
+        return {f"p{p}": None for p in LATENCY_PERCENTILES}
+    return {f"p{p}": float(np.percentile(values, p)) for p in LATENCY_PERCENTILES}
+
+
+class LoadGenerator:
+    """Open-loop load: requests go out on a Poisson schedule whether or not earlier ones have returned.
+
+    Requests bypass the client-side rate limiter, since queuing them would
+    close the loop, and are not retried; 429s are recorded as throttles.
+    """
+
+    def __init__(self, clients: ProviderClients, max_tokens: int = 256):
+        self.clients = clients
+        self.max_tokens = max_tokens
+
+    async def _send(self, model: str, messages: List[Dict[str, str]]) -> int:
+        """Send one request and return its output token count."""
+        if model.startswith("claude"):
+            system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+            response = await self.clients.async_anthropic().messages.create(
+                model=model, system=system, messages=[m for m in messages if m["role"] != "system"],
+                max_tokens=self.max_tokens, temperature=0
+            )
+            return response.usage.output_tokens
+        response = await self.clients.async_openai().chat.completions.create(
+            model=model, messages=messages, max_tokens=self.max_tokens, temperature=0
+        )
+        return response.usage.completion_tokens if response.usage else 0
+
+    async def _request(self, model: str, messages: List[Dict[str, str]], stage: int, scheduled: float,
+                       origin: float) -> Dict[str, Any]:
+        started = time.perf_counter()
+        record = {"model": model, "stage": stage, "scheduled_seconds": round(scheduled, 4),
+                  "send_lag_seconds": started - origin - scheduled}
+        try:
+            record["output_tokens"] = await self._send(model, messages)
+            record["status"] = "ok"
+        except Exception as e:
+            status_code = getattr(e, "status_code", None)
+            record["status"] = "throttled" if status_code == 429 else "error"
+            record["error"] = f"{type(e).__name__}: {str(e)[:200]}"
+        finished = time.perf_counter()
+        record["latency_seconds"] = finished - started
+        record["completed_seconds"] = round(finished - origin, 4)
+        return record
+
+    async def run(self, model: str, prompts: List[List[Dict[str, str]]], stages: List[Stage],
+                  seed: int = 0) -> List[Dict[str, Any]]:
+        """Replay `prompts` round-robin against `model` at the stages' arrival rates."""
+        schedule = poisson_schedule(stages, random.Random(seed))
+        origin = time.perf_counter()
+        tasks = []
+        for number, (stage, offset) in enumerate(schedule):
+            delay = origin + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(
+                self._request(model, prompts[number % len(prompts)], stage, offset, origin)
+            ))
+        return list(await asyncio.gather(*tasks))
+
+
+def stage_curve(records: List[Dict[str, Any]], stages: List[Stage]) -> List[Dict[str, Any]]:
+    """Per stage: offered, sent and achieved throughput, latency percentiles, error and throttle rates.
+
+    Achieved throughput counts successful completions inside the stage's
+    time window, whichever stage sent them, so a backlog shows up as a
+    shortfall rather than being credited to the stage.
+    """
+    curve = []
+    stage_start = 0.0
+    for index, (rate, duration) in enumerate(stages):
+        stage_records = [r for r in records if r["stage"] == index]
+        ok = [r for r in stage_records if r["status"] == "ok"]
+        sent = len(stage_records)
+        completed = sum(r["status"] == "ok" and stage_start <= r["completed_seconds"] < stage_start + duration
+                        for r in records)
+        stage_start += duration
+        curve.append({
+            "offered_qps": rate,
+            "sent_qps": round(sent / duration, 4),
+            "achieved_qps": round(completed / duration, 4),
+            "latency_seconds": percentiles([r["latency_seconds"] for r in ok]),
+            "error_rate": round(sum(r["status"] == "error" for r in stage_records) / sent, 4) if sent else 0.0,
+            "throttle_rate": round(sum(r["status"] == "throttled" for r in stage_records) / sent, 4) if sent else 0.0,
+            "max_send_lag_seconds": round(max((r["send_lag_seconds"] for r in stage_records), default=0.0), 4)
+        })
+    return curve
+
+
+def saturation_point(curve: List[Dict[str, Any]], latency_factor: float = 2.0,
+                     max_error_rate: float = 0.05) -> Dict[str, Any]:
+    """The first stage where the model stops keeping up, and the highest rate it sustained before it.
+
+    A stage is saturated when its p99 latency exceeds `latency_factor` times
+    the first stage's, failures (errors plus throttles) exceed
+    `max_error_rate`, or it completes less than 90% of the rate actually sent.
+    """
+    baseline = curve[0]["latency_seconds"]["p99"] if curve else None
+    sustained = None
+    for point in curve:
+        p99 = point["latency_seconds"]["p99"]
+        reasons = []
+        if baseline is not None and (p99 is None or p99 > latency_factor * baseline):
+            reasons.append("latency")
+        if point["error_rate"] + point["throttle_rate"] > max_error_rate:
+            reasons.append("errors")
+        if point["achieved_qps"] < 0.9 * point["sent_qps"]:
+            reasons.append("throughput")
+        if reasons:
+            return {"saturated_at_qps": point["offered_qps"], "max_sustained_qps": sustained, "reasons": reasons}
+        sustained = point["offered_qps"]
+    return {"saturated_at_qps": None, "max_sustained_qps": sustained, "reasons": []}
+
+
+def plot_curves(curves: Dict[str, List[Dict[str, Any]]], output_path: str, timestamp: str,
+                renderer: Optional[FigureRenderer] = None):
+    """Render latency-vs-throughput curves (p50 and p99 per model)."""
+    renderer = renderer or FigureRenderer()
+    series = {}
+    for model, curve in curves.items():
+        for p in (50, 99):
+            points = [(point["achieved_qps"], point["latency_seconds"][f"p{p}"]) for point in curve
+                      if point["latency_seconds"][f"p{p}"] is not None]
+            series[f"{model} p{p}"] = [[x for x, _ in points], [y for _, y in points]]
+    figure = line_figure(f"load_test_latency_{timestamp}", "Latency vs throughput", series,
+                         "Achieved throughput (requests/s)", "Latency (s)", [10, 6])
+    for path in renderer.render([figure], output_path)["rendered"]:
+        logger.info(f"Saved latency curve to: {path}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay the comparison prompts as open-loop Poisson load "
+                                                 "and measure latency under sustained request rates")
+    parser.add_argument("--models", nargs="+", default=["gpt-3.5-turbo", "claude-3-haiku-20240307"],
+                        help="Models to load, one after another (default: the compare benchmark's models)")
+    rates = parser.add_mutually_exclusive_group()
+    rates.add_argument("--rate", type=float, default=2.0,
+                       help="Constant arrival rate in requests per second (default: 2)")
+    rates.add_argument("--ramp", type=parse_ramp, metavar="START:STOP:STEP",
+                       help="Step the arrival rate from START to STOP requests per second, e.g. 1:10:1")
+    parser.add_argument("--stage-duration", type=float, default=30.0,
+                        help="Seconds at each rate (default: 30)")
+    parser.add_argument("--max-tokens", type=int, default=256,
+                        help="Completion token limit per request (default: 256)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the arrival schedule (default: 0)")
+    parser.add_argument("--latency-factor", type=float, default=2.0,
+                        help="A rate saturates the model once p99 latency exceeds this multiple of the first "
+                             "rate's (default: 2)")
+    parser.add_argument("--max-error-rate", type=float, default=0.05,
+                        help="A rate saturates the model once errors plus throttles exceed this fraction "
+                             "(default: 0.05)")
+    add_http_arguments(parser)
+    add_plot_arguments(parser)
+    add_mock_server_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.mock_server:
+        point_clients_at(args.mock_server)
+
+    clients = clients_from_args(args)
+    try:
+        # The replayed prompts are the comparison benchmark's
+        benchmark = ModelComparisonBenchmark(clients=clients)
+    except ValueError as e:
+        logger.error(f"Failed to initialize benchmark: {str(e)}")
+        return
+    prompts = [
+        benchmark.get_prompt_with_technique(technique, task_type, item)
+        for task_type, items in benchmark.tasks.items()
+        for technique in benchmark.prompting_techniques
+        for item in items
+    ]
+    stages = [(rate, args.stage_duration) for rate in (args.ramp or [args.rate])]
+    generator = LoadGenerator(clients, max_tokens=args.max_tokens)
+
+    async def run_all():
+        # One event loop for every model, since the async clients are bound to it
+        results = {}
+        for model in args.models:
+            logger.info(f"Load testing {model}: {', '.join(f'{rate:g}' for rate, _ in stages)} req/s, "
+                        f"{args.stage_duration:g}s each")
+            results[model] = await generator.run(model, prompts, stages, args.seed)
+        return results
+
+    records = asyncio.run(run_all())
+    curves = {model: stage_curve(model_records, stages) for model, model_records in records.items()}
+    saturation = {model: saturation_point(curve, args.latency_factor, args.max_error_rate)
+                  for model, curve in curves.items()}
+    logger.info(f"Saturation points: {json.dumps(saturation, indent=2)}")
+    logger.info(f"Connection pools: {json.dumps(clients.stats(), indent=2)}")
+    clients.close()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = "evaluation_results"
+    os.makedirs(output_path, exist_ok=True)
+    results_file = f"{output_path}/load_test_{timestamp}.json"
+    with open(results_file, "w") as f:
+        json.dump({"stages": stages, "curves": curves, "saturation": saturation}, f, indent=2)
+    with open(f"{output_path}/load_test_{timestamp}_requests.jsonl", "w") as f:
+        for model_records in records.values():
+            for record in model_records:
+                f.write(json.dumps(record) + "\n")
+    logger.info(f"Saved load test results to: {results_file}")
+    plot_curves(curves, output_path, timestamp, renderer_from_args(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+import os
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import logging
+import argparse
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+
+class MockConfig:
+    """Behaviour of the mock server: latency, failure injection and reply size."""
+
+    def __init__(self, latency_dist: str = "fixed", latency_mean: float = 0.2, latency_stddev: float = 0.05,
+                 token_latency: float = 0.01, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 1.0, response_tokens: int = 20, seed: int = 42, batch_delay: float = 1.0):
+        self.latency_dist = latency_dist
+        self.latency_mean = latency_mean
+        self.latency_stddev = latency_stddev
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.response_tokens = response_tokens
+        self.seed = seed
+        self.batch_delay = batch_delay
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """Draw the time-to-first-token for one request."""
+        mean, stddev = self.latency_mean, self.latency_stddev
+        if self.latency_dist == "fixed":
+            return mean
+        if self.latency_dist == "uniform":
+            return rng.uniform(max(0.0, mean - stddev), mean + stddev)
+        if self.latency_dist == "normal":
+            return max(0.0, rng.gauss(mean, stddev))
+        if self.latency_dist == "exponential":
+            return rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        if self.latency_dist == "lognormal":
+            # Parameterized by the mean and stddev of the latency itself
+            if mean <= 0:
+                return 0.0
+            sigma2 = math.log(1 + (stddev / mean) ** 2)
+            mu = math.log(mean) - sigma2 / 2
+            return rng.lognormvariate(mu, sigma2 ** 0.5)
+        raise ValueError(f"Unknown latency distribution: {self.latency_dist}")
+
+
+class MockStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "completed": 0, "errors": 0, "throttled": 0, "streamed": 0, "batched": 0}
+
+    def incr(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+
+def _prompt_text(payload: Dict[str, Any]) -> str:
+    parts = []
+    system = payload.get("system")
+    if isinstance(system, str):
+        parts.append(system)
+    elif isinstance(system, list):
+        parts.extend(block.get("text", "") for block in system)
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(block.get("text", "") for block in content)
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def _cache_prefix(api: str, payload: Dict[str, Any]) -> Optional[str]:
+    """Prompt text a provider would serve from its prefix cache, or None.
+
+    OpenAI caches automatically: everything before the final user turn.
+    Anthropic caches up to the last block marked with cache_control.
+    """
+    if api == "openai":
+        messages = payload.get("messages", [])
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=0)
+        return _prompt_text({"messages": messages[:last_user]}) if last_user else None
+    blocks = []
+    system = payload.get("system")
+    if isinstance(system, list):
+        blocks.extend(system)
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        blocks.extend(content if isinstance(content, list) else [{"text": content}])
+    marked = [i for i, block in enumerate(blocks) if block.get("cache_control")]
+    if not marked:
+        return None
+    prefix = blocks[:marked[-1] + 1]
+    if isinstance(system, str) and system:
+        prefix = [{"text": system}] + prefix
+    return "\n".join(block.get("text", "") for block in prefix)
+
+
+def _reply_words(prompt: str, count: int, rng: random.Random) -> List[str]:
+    """Deterministic reply built from the prompt's own words."""
+    words = prompt.split() or ["mock"]
+    return [rng.choice(words) for _ in range(count)]
+
+
+def _openai_completion(model: str, prompt: str, replies: List[List[str]], cached_tokens: int = 0) -> Dict[str, Any]:
+    completion_tokens = sum(len(words) for words in replies)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": i, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}
+            for i, words in enumerate(replies)
+        ],
+        "usage": {
+            "prompt_tokens": _count_tokens(prompt),
+            "completion_tokens": completion_tokens,
+            "total_tokens": _count_tokens(prompt) + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+    }
+
+
+def _multipart_fields(content_type: str, body: bytes) -> Dict[str, bytes]:
+    """Field name -> raw value of a multipart/form-data body."""
+    from email.parser import BytesParser
+    from email.policy import HTTP
+
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _rng(self, body: bytes) -> random.Random:
+        return self.server.rng(body)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, data: Any, event: Optional[str] = None):
+        chunk = ""
+        if event:
+            chunk += f"event: {event}\n"
+        chunk += f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+        encoded = chunk.encode("utf-8")
+        self.wfile.write(f"{len(encoded):X}\r\n".encode("ascii") + encoded + b"\r\n")
+        self.wfile.flush()
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _send_not_found(self):
+        self._send_json(404, {"error": {"type": "not_found", "message": self.path}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        parts = path.strip("/").split("/")
+        if path in ("/stats", "/v1/stats"):
+            self._send_json(200, self.server.stats.snapshot())
+        elif parts[-2:-1] == ["batches"] and parts[-1] in self.server.batches:
+            self._send_json(200, self.server.batch(parts[-1]))
+        elif parts[-3:-2] == ["files"] and parts[-1] == "content" and parts[-2] in self.server.files:
+            content = self.server.files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._send_not_found()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/files"):
+            fields = _multipart_fields(self.headers.get("Content-Type", ""), body)
+            if "file" not in fields:
+                self._send_json(400, {"error": {"type": "invalid_request_error", "message": "Missing file"}})
+                return
+            purpose = (fields.get("purpose") or b"batch").decode("utf-8")
+            self._send_json(200, self.server.add_file(fields["file"], purpose))
+            return
+
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"type": "invalid_request_error", "message": "Invalid JSON"}})
+            return
+
+        if path.endswith("/batches"):
+            if payload.get("input_file_id") not in self.server.files:
+                self._send_json(400, {"error": {"type": "invalid_request_error", "message": "Unknown input_file_id"}})
+                return
+            self._send_json(200, self.server.create_batch(payload))
+            return
+        if path.endswith("/chat/completions"):
+            api = "openai"
+        elif path.endswith("/messages"):
+            api = "anthropic"
+        else:
+            self._send_json(404, {"error": {"type": "not_found", "message": self.path}})
+            return
+
+        config, stats = self.server.config, self.server.stats
+        stats.incr("requests")
+        rng = self._rng(body)
+        roll = rng.random()
+        if roll < config.throttle_rate:
+            stats.incr("throttled")
+            self._send_json(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "Mock rate limit"}},
+                            {"Retry-After": f"{config.retry_after:g}"})
+            return
+        if roll < config.throttle_rate + config.error_rate:
+            stats.incr("errors")
+            self._send_json(500, {"type": "error", "error": {"type": "api_error", "message": "Mock server error"}})
+            return
+
+        time.sleep(config.sample_latency(rng))
+
+        prompt = _prompt_text(payload)
+        max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or config.response_tokens
+        choices = max(1, int(payload.get("n", 1))) if api == "openai" else 1
+        replies = [_reply_words(prompt, min(config.response_tokens, max_tokens), rng) for _ in range(choices)]
+        model = payload.get("model", "mock")
+        # Simulated prefix cache: a prefix is written on first sight and read afterwards
+        prefix = _cache_prefix(api, payload)
+        prefix_tokens = _count_tokens(prefix) if prefix else 0
+        prefix_hit = prefix is not None and self.server.prefix_seen(model, prefix)
+        cache_usage = {"cache_read_input_tokens": prefix_tokens if prefix_hit else 0,
+                       "cache_creation_input_tokens": 0 if prefix_hit else prefix_tokens}
+
+        if payload.get("stream"):
+            stats.incr("streamed")
+            if api == "openai":
+                self._stream_openai(payload, model, prompt, replies, prefix_tokens if prefix_hit else 0)
+            else:
+                self._stream_anthropic(model, prompt, replies[0], cache_usage)
+        elif api == "openai":
+            self._send_json(200, _openai_completion(model, prompt, replies, prefix_tokens if prefix_hit else 0))
+        else:
+            self._send_json(200, {
+                "id": f"msg_{uuid.uuid4().hex[:24]}",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": " ".join(replies[0])}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": _count_tokens(prompt) - prefix_tokens, "output_tokens": len(replies[0]),
+                          **cache_usage}
+            })
+        stats.incr("completed")
+
+    def _stream_openai(self, payload: Dict[str, Any], model: str, prompt: str, replies: List[List[str]],
+                       cached_tokens: int = 0):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def chunk(choices, usage=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": choices, "usage": usage}
+
+        self._start_stream()
+        for position in range(max(len(words) for words in replies)):
+            if position:
+                time.sleep(self.server.config.token_latency)
+            for index, words in enumerate(replies):
+                if position < len(words):
+                    text = words[position] if position == 0 else " " + words[position]
+                    self._send_event(chunk([{"index": index, "delta": {"content": text}, "finish_reason": None}]))
+        for index in range(len(replies)):
+            self._send_event(chunk([{"index": index, "delta": {}, "finish_reason": "stop"}]))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            completion_tokens = sum(len(words) for words in replies)
+            self._send_event(chunk([], {
+                "prompt_tokens": _count_tokens(prompt),
+                "completion_tokens": completion_tokens,
+                "total_tokens": _count_tokens(prompt) + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }))
+        self._send_event("[DONE]")
+        self._end_stream()
+
+    def _stream_anthropic(self, model: str, prompt: str, words: List[str], cache_usage: Dict[str, int]):
+        self._start_stream()
+        self._send_event({"type": "message_start", "message": {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant", "model": model,
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": _count_tokens(prompt) - sum(cache_usage.values()), "output_tokens": 1,
+                      **cache_usage}
+        }}, "message_start")
+        self._send_event({"type": "content_block_start", "index": 0,
+                          "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        for position, word in enumerate(words):
+            if position:
+                time.sleep(self.server.config.token_latency)
+            text = word if position == 0 else " " + word
+            self._send_event({"type": "content_block_delta", "index": 0,
+                              "delta": {"type": "text_delta", "text": text}}, "content_block_delta")
+        self._send_event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        self._send_event({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                          "usage": {"output_tokens": len(words)}}, "message_delta")
+        self._send_event({"type": "message_stop"}, "message_stop")
+        self._end_stream()
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig):
+        super().__init__(address, MockLLMHandler)
+        self.config = config
+        self.stats = MockStats()
+        self.seen = {}
+        self.seen_lock = threading.Lock()
+        self.prefixes = set()
+        # Stand-in for the Files and Batches APIs; batches complete after config.batch_delay
+        self.files = {}
+        self.batches = {}
+        self.batch_lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on purpose, e.g. when a hedged duplicate wins the race
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            logger.debug(f"Client {client_address[0]}:{client_address[1]} disconnected")
+            return
+        super().handle_error(request, client_address)
+
+    def rng(self, body: bytes) -> random.Random:
+        # Seeded from the request body and how often it has been seen, so retries
+        # of the same request draw different (but reproducible) outcomes
+        digest = hashlib.sha256(body).hexdigest()
+        with self.seen_lock:
+            occurrence = self.seen[digest] = self.seen.get(digest, 0) + 1
+        return random.Random(f"{self.config.seed}:{digest}:{occurrence}")
+
+    def prefix_seen(self, model: str, prefix: str) -> bool:
+        """Whether a prompt prefix is already cached for a model; caches it if not."""
+        key = hashlib.sha256(f"{model}\n{prefix}".encode("utf-8")).hexdigest()
+        with self.seen_lock:
+            seen = key in self.prefixes
+            self.prefixes.add(key)
+        return seen
+
+    def add_file(self, content: bytes, purpose: str) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        record = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                  "filename": f"{file_id}.jsonl", "purpose": purpose, "status": "processed"}
+        self.files[file_id] = {**record, "content": content}
+        return record
+
+    def batch(self, batch_id: str) -> Dict[str, Any]:
+        with self.batch_lock:
+            return dict(self.batches[batch_id])
+
+    def create_batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        lines = [line for line in self.files[payload["input_file_id"]]["content"].splitlines() if line.strip()]
+        with self.batch_lock:
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": payload.get("endpoint", "/v1/chat/completions"),
+                "input_file_id": payload["input_file_id"], "completion_window": payload.get("completion_window", "24h"),
+                "status": "in_progress", "created_at": int(time.time()), "metadata": payload.get("metadata"),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": len(lines), "completed": 0, "failed": 0}
+            }
+        threading.Thread(target=self._run_batch, args=(batch_id, lines), daemon=True).start()
+        return self.batch(batch_id)
+
+    def _run_batch(self, batch_id: str, lines: List[bytes]):
+        """Answer every line of a batch after the configured delay; error_rate fails lines."""
+        time.sleep(self.config.batch_delay)
+        outputs, errors = [], []
+        for line in lines:
+            request = json.loads(line)
+            payload = request.get("body", {})
+            rng = self.rng(json.dumps(payload, sort_keys=True).encode("utf-8"))
+            self.stats.incr("batched")
+            result = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": request.get("custom_id"), "error": None}
+            if rng.random() < self.config.error_rate:
+                result["response"] = {"status_code": 500, "request_id": uuid.uuid4().hex,
+                                      "body": {"error": {"type": "api_error", "message": "Mock server error"}}}
+                errors.append(result)
+                continue
+            prompt = _prompt_text(payload)
+            max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or self.config.response_tokens
+            replies = [_reply_words(prompt, min(self.config.response_tokens, max_tokens), rng)
+                       for _ in range(max(1, int(payload.get("n", 1))))]
+            result["response"] = {"status_code": 200, "request_id": uuid.uuid4().hex,
+                                  "body": _openai_completion(payload.get("model", "mock"), prompt, replies)}
+            outputs.append(result)
+
+        def as_file(results):
+            if not results:
+                return None
+            return self.add_file("".join(json.dumps(r) + "\n" for r in results).encode("utf-8"), "batch_output")["id"]
+
+        with self.batch_lock:
+            self.batches[batch_id].update({
+                "status": "completed", "completed_at": int(time.time()),
+                "output_file_id": as_file(outputs), "error_file_id": as_file(errors),
+                "request_counts": {"total": len(lines), "completed": len(outputs), "failed": len(errors)}
+            })
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0) -> MockLLMServer:
+    """Start a mock server on a background thread; port 0 picks a free port."""
+    server = MockLLMServer((host, port), config or MockConfig())
+    thread = threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True)
+    thread.start()
+    logger.info(f"Mock LLM server listening on {server.url}")
+    return server
+
+
+def point_clients_at(url: str):
+    """Point the OpenAI and Anthropic SDKs at a mock server.
+
+    Must run before the clients are constructed. Placeholder API keys are set
+    when none are configured so the evaluators' key checks pass.
+    """
+    url = url.rstrip("/")
+    os.environ["OPENAI_BASE_URL"] = f"{url}/v1"
+    os.environ["ANTHROPIC_BASE_URL"] = url
+    os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+    logger.info(f"Using mock LLM server at {url}")
+
+
+def add_mock_server_arguments(parser):
+    """Add the --mock-server flag used by the benchmark scripts."""
+    parser.add_argument("--mock-server", metavar="URL",
+                        help="Send all requests to a local mock LLM server, e.g. http://127.0.0.1:8765")
+
+
+def add_mock_config_arguments(parser):
+    """Add the flags that configure a MockConfig."""
+    group = parser.add_argument_group("mock server behaviour")
+    group.add_argument("--latency-dist", default="fixed",
+                       choices=["fixed", "uniform", "normal", "lognormal", "exponential"])
+    group.add_argument("--latency-mean", type=float, default=0.2, help="Mean time to first token in seconds")
+    group.add_argument("--latency-stddev", type=float, default=0.05)
+    group.add_argument("--token-latency", type=float, default=0.01, help="Seconds between streamed tokens")
+    group.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    group.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    group.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    group.add_argument("--response-tokens", type=int, default=20)
+    group.add_argument("--seed", type=int, default=42)
+    group.add_argument("--batch-delay", type=float, default=1.0, help="Seconds before a submitted batch job completes")
+    return group
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        latency_dist=args.latency_dist,
+        latency_mean=args.latency_mean,
+        latency_stddev=args.latency_stddev,
+        token_latency=args.token_latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        response_tokens=args.response_tokens,
+        seed=args.seed,
+        batch_delay=args.batch_delay
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat.completions/files/batches and Anthropic messages APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_mock_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer((args.host, args.port), config_from_args(args))
+    logger.info(f"Mock LLM server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Served: {server.stats.snapshot()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from profiling import timed
+
+logger = logging.getLogger(__name__)
+
+PLOT_FORMATS = ["png", "svg", "json", "none"]
+
+# Bump when a renderer's output changes so old fingerprints stop matching
+RENDERER_VERSION = 1
+
+MANIFEST_NAME = ".figures.json"
+
+
+def heatmap_panel(title: str, rows: List[str], columns: List[str], values: List[List[Optional[float]]],
+                  cmap: str = "YlOrRd", vmin: Optional[float] = None, vmax: Optional[float] = None) -> Dict[str, Any]:
+    """Data for one annotated heatmap; missing cells are None."""
+    return {"title": title, "rows": rows, "columns": columns, "values": values,
+            "cmap": cmap, "vmin": vmin, "vmax": vmax}
+
+
+def heatmap_figure(name: str, panels: List[Dict[str, Any]], figsize: List[float]) -> Dict[str, Any]:
+    """A figure of one or more stacked heatmaps, saved as `name`.<format>."""
+    return {"name": name, "kind": "heatmaps", "panels": panels, "figsize": figsize}
+
+
+def bar_figure(name: str, title: str, labels: List[str], values: List[float], ylabel: str,
+               figsize: List[float], ylim: Optional[List[float]] = None) -> Dict[str, Any]:
+    """A labelled bar chart, saved as `name`.<format>."""
+    return {"name": name, "kind": "bars", "title": title, "labels": labels, "values": values,
+            "ylabel": ylabel, "ylim": ylim, "figsize": figsize}
+
+
+def line_figure(name: str, title: str, series: Dict[str, List[List[float]]], xlabel: str, ylabel: str,
+                figsize: List[float]) -> Dict[str, Any]:
+    """One line per series label, each given as [xs, ys], saved as `name`.<format>."""
+    return {"name": name, "kind": "lines", "title": title, "series": series,
+            "xlabel": xlabel, "ylabel": ylabel, "figsize": figsize}
+
+
+def matrix(data: Dict[Any, Dict[Any, float]], rows: List[Any], columns: List[Any]) -> List[List[Optional[float]]]:
+    """Nested-dict data as a row-major list of lists, None where a cell is missing."""
+    return [[data.get(row, {}).get(column) for column in columns] for row in rows]
+
+
+def fingerprint(figure: Dict[str, Any], output_format: str, dpi: int) -> str:
+    """Hash of everything that determines a figure's rendered output (its file name aside)."""
+    content = {key: value for key, value in figure.items() if key != "name"}
+    canonical = json.dumps([RENDERER_VERSION, output_format, dpi, content], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _render_heatmaps(figure: Dict[str, Any], plt, sns):
+    import pandas as pd
+
+    panels = figure["panels"]
+    fig, axes = plt.subplots(len(panels), 1, figsize=figure["figsize"], squeeze=False)
+    for ax, panel in zip(axes[:, 0], panels):
+        df = pd.DataFrame(panel["values"], index=panel["rows"], columns=panel["columns"], dtype=float)
+        sns.heatmap(df, ax=ax, annot=True, fmt=".3f", cmap=panel["cmap"], vmin=panel["vmin"], vmax=panel["vmax"])
+        ax.set_title(panel["title"])
+    return fig
+
+
+def _render_bars(figure: Dict[str, Any], plt, sns):
+    fig, ax = plt.subplots(figsize=figure["figsize"])
+    ax.bar(figure["labels"], figure["values"])
+    ax.set_title(figure["title"])
+    ax.set_ylabel(figure["ylabel"])
+    if figure["ylim"]:
+        ax.set_ylim(*figure["ylim"])
+    for i, value in enumerate(figure["values"]):
+        ax.text(i, value + 0.02, f"{value:.3f}", ha="center")
+    return fig
+
+
+def _render_lines(figure: Dict[str, Any], plt, sns):
+    fig, ax = plt.subplots(figsize=figure["figsize"])
+    for label, (xs, ys) in figure["series"].items():
+        ax.plot(xs, ys, marker="o", label=label)
+    ax.set_title(figure["title"])
+    ax.set_xlabel(figure["xlabel"])
+    ax.set_ylabel(figure["ylabel"])
+    ax.legend()
+    return fig
+
+
+_RENDERERS = {"heatmaps": _render_heatmaps, "bars": _render_bars, "lines": _render_lines}
+
+
+def render_figure(figure: Dict[str, Any], path: str, output_format: str, dpi: int) -> str:
+    """Render one figure to `path`; runs in a worker process."""
+    if output_format == "json":
+        # Chart data for the web view; no plotting libraries needed
+        with open(path, "w") as f:
+            json.dump(figure, f)
+        return path
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig = _RENDERERS[figure["kind"]](figure, plt, sns)
+    fig.tight_layout()
+    fig.savefig(path, format=output_format, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return path
+
+
+class FigureRenderer:
+    """Renders figure specs, skipping any whose data has not changed.
+
+    Each output directory keeps a manifest of fingerprint -> file. A figure
+    whose fingerprint is already there is skipped if it would overwrite that
+    file, or copied from it if only the file name (e.g. the run timestamp)
+    differs. Everything else renders in parallel worker processes.
+    """
+
+    def __init__(self, output_format: str = "png", dpi: int = 300, workers: Optional[int] = None):
+        if output_format not in PLOT_FORMATS:
+            raise ValueError(f"Unknown plot format: {output_format}")
+        self.output_format = output_format
+        self.dpi = dpi
+        self.workers = workers
+
+    @staticmethod
+    def _load_manifest(output_path: str) -> Dict[str, str]:
+        try:
+            with open(os.path.join(output_path, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_manifest(output_path: str, manifest: Dict[str, str]):
+        manifest_file = os.path.join(output_path, MANIFEST_NAME)
+        with open(f"{manifest_file}.tmp", "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(f"{manifest_file}.tmp", manifest_file)
+
+    @timed("plot.render")
+    def render(self, figures: List[Dict[str, Any]], output_path: str) -> Dict[str, List[str]]:
+        """Render figures into `output_path`; return the rendered, copied and skipped files."""
+        outcome = {"rendered": [], "copied": [], "skipped": []}
+        if self.output_format == "none" or not figures:
+            return outcome
+        os.makedirs(output_path, exist_ok=True)
+        manifest = self._load_manifest(output_path)
+
+        pending = []
+        for figure in figures:
+            path = os.path.join(output_path, f"{figure['name']}.{self.output_format}")
+            digest = fingerprint(figure, self.output_format, self.dpi)
+            previous = manifest.get(digest)
+            previous_path = os.path.join(output_path, previous) if previous else None
+            if previous_path and os.path.exists(previous_path):
+                if os.path.abspath(previous_path) == os.path.abspath(path):
+                    outcome["skipped"].append(path)
+                else:
+                    shutil.copyfile(previous_path, path)
+                    outcome["copied"].append(path)
+                continue
+            pending.append((figure, path, digest))
+
+        workers = min(self.workers or os.cpu_count() or 1, len(pending))
+        if workers > 1 and self.output_format != "json":
+            # Spawned workers avoid forking a process that may be running scorer threads
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(render_figure, figure, path, self.output_format, self.dpi)
+                           for figure, path, _ in pending]
+                for future in futures:
+                    future.result()
+        else:
+            for figure, path, _ in pending:
+                render_figure(figure, path, self.output_format, self.dpi)
+
+        for _, path, digest in pending:
+            manifest[digest] = os.path.basename(path)
+            outcome["rendered"].append(path)
+        self._save_manifest(output_path, manifest)
+        logger.info(f"Figures in {output_path}: {len(outcome['rendered'])} rendered, "
+                    f"{len(outcome['copied'])} copied, {len(outcome['skipped'])} unchanged")
+        return outcome
+
+
+def add_plot_arguments(parser):
+    """Add the figure rendering flags to an argparse parser."""
+    group = parser.add_argument_group("plotting")
+    group.add_argument("--plot-format", choices=PLOT_FORMATS, default="png",
+                       help="png (default), svg or json chart data for the web view; none skips plotting")
+    group.add_argument("--plot-dpi", type=int, default=300,
+                       help="Resolution of png figures (default: 300)")
+    group.add_argument("--plot-workers", type=int, default=None,
+                       help="Processes rendering figures in parallel (default: one per CPU; 1 renders inline)")
+    return group
+
+
+def renderer_from_args(args) -> FigureRenderer:
+    return FigureRenderer(args.plot_format, dpi=args.plot_dpi, workers=args.plot_workers)
@@ -0,0 +1,167 @@
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class _NullSpan:
+    """Reusable do-nothing context manager returned while profiling is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """Wall time and call counts per named stage of a run.
+
+    Stages are recorded with `span(name)` blocks, the `@timed(name)`
+    decorator, or `add(name, seconds)` for durations measured elsewhere
+    (e.g. rate-limiter queue waits). While disabled, `span` returns a shared
+    no-op context and `timed` functions make one extra call, so the hooks
+    can stay in hot paths. Times are inclusive and add up across threads and
+    coroutines, so concurrent stages can total more than the run's wall time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.events = None
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self, trace: bool = False):
+        """Start recording; with `trace`, also keep every span for a trace-event export."""
+        self.enabled = True
+        self.events = [] if trace else None
+        self._origin = time.perf_counter()
+
+    def disable(self):
+        self.enabled = False
+
+    def add(self, name: str, seconds: float, started: Optional[float] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.add(seconds)
+            if self.events is not None:
+                start = (started if started is not None else time.perf_counter() - seconds) - self._origin
+                self.events.append({"name": name, "ph": "X", "ts": start * 1e6, "dur": seconds * 1e6,
+                                    "pid": 0, "tid": threading.get_ident()})
+
+    @contextmanager
+    def _span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started, started)
+
+    def span(self, name: str):
+        """Time a block as one call of stage `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    def timed(self, name: str):
+        """Decorator timing every call of a function as stage `name`."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.add(name, time.perf_counter() - started, started)
+            return wrapper
+        return decorator
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-stage count and total/mean/max seconds, slowest total first."""
+        with self._lock:
+            stages = list(self.stages.items())
+        return [
+            {"stage": name, "count": stats.count, "total_seconds": round(stats.total, 4),
+             "mean_seconds": round(stats.total / stats.count, 6), "max_seconds": round(stats.max, 4)}
+            for name, stats in sorted(stages, key=lambda item: item[1].total, reverse=True)
+        ]
+
+    def write_trace(self, path: str):
+        """Write recorded spans as Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+        with self._lock:
+            events = list(self.events or [])
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        logger.info(f"Wrote {len(events)} trace events to {path}")
+
+
+# Process-wide profiler the instrumented modules report to
+PROFILER = Profiler()
+span = PROFILER.span
+timed = PROFILER.timed
+
+
+@contextmanager
+def profile_run(args):
+    """Profile the enclosed block as configured by `add_profiling_arguments` flags."""
+    if not (args.profile or args.profile_trace or args.cprofile):
+        yield
+        return
+    PROFILER.enable(trace=bool(args.profile_trace))
+    profile = None
+    if args.cprofile:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(args.cprofile)
+            logger.info(f"Wrote cProfile stats to {args.cprofile} (view with `python -m pstats` or snakeviz)")
+        PROFILER.disable()
+        logger.info(f"Stage profile: {json.dumps(PROFILER.summary(), indent=2)}")
+        if args.profile_trace:
+            PROFILER.write_trace(args.profile_trace)
+
+
+def add_profiling_arguments(parser):
+    """Add the run profiling flags to an argparse parser."""
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", action="store_true",
+                       help="Time each stage (requests, queueing, datasets, scoring, plotting) and log a summary")
+    group.add_argument("--profile-trace", metavar="PATH",
+                       help="Also write every span as Chrome trace-event JSON")
+    group.add_argument("--cprofile", metavar="PATH",
+                       help="Run under cProfile and dump pstats to PATH")
+    return group
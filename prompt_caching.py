@@ -0,0 +1,130 @@
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def split_prefix(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split chat messages into the stable prefix and the final user turn that varies per item."""
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index]["role"] == "user":
+            return messages[:index], messages[index:]
+    return messages, []
+
+
+def _text_blocks(content: Any) -> List[Dict[str, Any]]:
+    if isinstance(content, list):
+        return [dict(block) for block in content]
+    return [{"type": "text", "text": content}]
+
+
+def usage_counts(usage: Any) -> Dict[str, int]:
+    """Cached-token counts from an OpenAI or Anthropic usage object (or dict); zero when absent."""
+    def field(obj, name):
+        return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+    if usage is None:
+        return {"cached_input_tokens": 0, "cache_write_tokens": 0}
+    # OpenAI reports prefix-cache hits under prompt_tokens_details; Anthropic reports reads and writes
+    details = field(usage, "prompt_tokens_details")
+    cached = (field(details, "cached_tokens") if details is not None else None) or field(usage, "cache_read_input_tokens")
+    return {"cached_input_tokens": cached or 0,
+            "cache_write_tokens": field(usage, "cache_creation_input_tokens") or 0}
+
+
+class PromptCaching:
+    """Provider prompt-caching controls plus cached-token accounting per model.
+
+    With caching enabled, few-shot prompts are laid out as a fixed prefix
+    (system message and worked examples) followed by a single final user
+    turn, OpenAI requests carry a `prompt_cache_key` derived from that prefix
+    so they are routed to the same cache, and Anthropic requests mark the
+    end of the prefix with `cache_control`. Cached-token counts are recorded
+    either way, so runs with and without caching can be compared. Providers
+    only cache prefixes of about 1024 tokens or more; shorter ones are
+    billed normally.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def body_params(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Extra fields for a raw chat.completions request body (e.g. a batch line); empty while caching is off."""
+        if not self.enabled:
+            return {}
+        prefix, _ = split_prefix(messages)
+        if not prefix:
+            return {}
+        digest = hashlib.blake2b(json.dumps(prefix, sort_keys=True).encode("utf-8"), digest_size=12).hexdigest()
+        return {"prompt_cache_key": f"prefix-{digest}"}
+
+    def openai_params(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Extra chat.completions keyword arguments for a request; empty while caching is off.
+
+        Sent through `extra_body`, since SDK releases that predate `prompt_cache_key` reject it as a keyword.
+        """
+        params = self.body_params(messages)
+        return {"extra_body": params} if params else {}
+
+    def anthropic_request(self, messages: List[Dict[str, Any]]) -> Tuple[Any, List[Dict[str, Any]]]:
+        """System prompt and Messages-API turns for chat messages, with the prefix marked for caching."""
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        turns = [{"role": m["role"], "content": m["content"]} for m in messages if m["role"] != "system"]
+        if not self.enabled:
+            return system, turns
+
+        prefix_turns = len(split_prefix(turns)[0])
+        if prefix_turns:
+            # The breakpoint on the last example turn caches the system prompt and every example
+            marked = turns[prefix_turns - 1]
+            blocks = _text_blocks(marked["content"])
+            blocks[-1]["cache_control"] = CACHE_CONTROL
+            turns[prefix_turns - 1] = {"role": marked["role"], "content": blocks}
+        elif system:
+            system = [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+        return system, turns
+
+    def record(self, model: str, usage: Any) -> Dict[str, int]:
+        """Add one response's usage to the per-model totals and return its cached-token counts."""
+        counts = usage_counts(usage)
+        prompt_tokens = 0
+        if usage is not None:
+            get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+            # Anthropic's input_tokens excludes cache reads and writes; OpenAI's prompt_tokens includes them
+            prompt_tokens = get("prompt_tokens") or (
+                (get("input_tokens") or 0) + counts["cached_input_tokens"] + counts["cache_write_tokens"])
+        with self._lock:
+            totals = self._models.setdefault(model, {"requests": 0, "prompt_tokens": 0,
+                                                     "cached_input_tokens": 0, "cache_write_tokens": 0})
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_input_tokens"] += counts["cached_input_tokens"]
+            totals["cache_write_tokens"] += counts["cache_write_tokens"]
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-model prompt tokens, cache reads/writes and the share of prompt tokens served from cache."""
+        with self._lock:
+            models = {model: dict(totals) for model, totals in self._models.items()}
+        for totals in models.values():
+            totals["cached_fraction"] = (round(totals["cached_input_tokens"] / totals["prompt_tokens"], 4)
+                                         if totals["prompt_tokens"] else 0.0)
+        return {"enabled": self.enabled, "models": models}
+
+
+def add_prompt_caching_arguments(parser):
+    """Add the provider prompt-caching flag to an argparse parser."""
+    parser.add_argument("--prompt-caching", action="store_true",
+                        help="Send few-shot prompts as a fixed, cacheable prefix of examples plus a final item turn, "
+                             "and enable provider prompt caching for that prefix")
+
+
+def prompt_caching_from_args(args) -> PromptCaching:
+    return PromptCaching(enabled=args.prompt_caching)
@@ -0,0 +1,277 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Conservative per-model budgets used when no --rate-limit flag is given
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 200000},
+    "anthropic": {"rpm": 50, "tpm": 40000}
+}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate.
+
+    Callers reserve capacity up front and are told how long to wait, so the
+    bucket can be shared by threads and by asyncio tasks alike.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = float(per_minute)
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate_scale = 1.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        rate = self.per_minute * self.rate_scale / 60.0
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` tokens and return the seconds to wait before they are usable."""
+        self._refill(now)
+        # Never ask for more than a full bucket or the request could wait forever
+        amount = min(amount, self.capacity)
+        self.available -= amount
+        if self.available >= 0:
+            return 0.0
+        return -self.available / (self.per_minute * self.rate_scale / 60.0)
+
+
+class _ModelBudget:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.calls = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_backoff = 0.0
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read a Retry-After delay from an SDK error's HTTP response, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def status_code_of(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """Retry throttling, server errors and connection problems; fail fast on bad requests."""
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # Connection errors and timeouts carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "TimeoutError", "ConnectionError")
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Full-jitter exponential backoff for the given zero-based attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Rough token estimate (about 4 characters per token) plus the completion budget."""
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + max_tokens
+
+
+class RateLimitScheduler:
+    """Per-provider, per-model scheduler enforcing requests- and tokens-per-minute budgets."""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        # Keys are "provider" or "provider:model"; model-specific entries win
+        self.limits = {k: dict(v) for k, v in DEFAULT_LIMITS.items()}
+        for key, value in (limits or {}).items():
+            self.limits.setdefault(key, {}).update(value)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def limits_for(self, provider: str, model: str) -> Dict[str, float]:
+        """The rpm/tpm budget that applies to a model."""
+        limits = dict(self.limits.get(provider, {"rpm": 60, "tpm": 60000}))
+        limits.update(self.limits.get(f"{provider}:{model}", {}))
+        return limits
+
+    def _budget(self, provider: str, model: str) -> _ModelBudget:
+        key = (provider, model)
+        budget = self._budgets.get(key)
+        if budget is None:
+            limits = self.limits_for(provider, model)
+            budget = self._budgets[key] = _ModelBudget(limits["rpm"], limits["tpm"])
+        return budget
+
+    def reserve(self, provider: str, model: str, estimated_tokens: int = 0) -> float:
+        """Reserve one request and its tokens; return how long the caller must wait."""
+        with self._lock:
+            budget = self._budget(provider, model)
+            now = time.monotonic()
+            wait = max(
+                budget.requests.reserve(1, now),
+                budget.tokens.reserve(estimated_tokens, now),
+                budget.blocked_until - now
+            )
+            budget.calls += 1
+            budget.total_wait += wait
+            budget.max_wait = max(budget.max_wait, wait)
+            return max(0.0, wait)
+
+    def acquire(self, provider: str, model: str, estimated_tokens: int = 0) -> float:
+        """Block until the budget allows the request and return the queue wait in seconds."""
+        wait = self.reserve(provider, model, estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, provider: str, model: str, estimated_tokens: int = 0) -> float:
+        wait = self.reserve(provider, model, estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_throttle(self, provider: str, model: str, delay: float):
+        """Pause the model's queue for `delay` seconds and slow its refill rate."""
+        with self._lock:
+            budget = self._budget(provider, model)
+            budget.throttled += 1
+            budget.blocked_until = max(budget.blocked_until, time.monotonic() + delay)
+            for bucket in (budget.requests, budget.tokens):
+                bucket.rate_scale = max(0.1, bucket.rate_scale * 0.8)
+
+    def record_success(self, provider: str, model: str):
+        with self._lock:
+            budget = self._budget(provider, model)
+            for bucket in (budget.requests, budget.tokens):
+                bucket.rate_scale = min(1.0, bucket.rate_scale * 1.01)
+
+    def _retry_delay(self, provider: str, model: str, error: Exception, attempt: int) -> float:
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        if status_code_of(error) == 429:
+            retry_after = retry_after_seconds(error)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self.record_throttle(provider, model, delay)
+        with self._lock:
+            self._budget(provider, model).total_backoff += delay
+        return delay
+
+    def call(self, provider: str, model: str, fn: Callable[[], Any],
+             estimated_tokens: int = 0) -> Tuple[Any, float]:
+        """Run `fn` under the model's budget, retrying retryable errors.
+
+        Returns the result and the total seconds spent waiting in the queue.
+        """
+        queue_wait = 0.0
+        for attempt in range(self.max_retries + 1):
+            queue_wait += self.acquire(provider, model, estimated_tokens)
+            try:
+                result = fn()
+                self.record_success(provider, model)
+                return result, queue_wait
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._retry_delay(provider, model, e, attempt)
+                logger.warning(f"Retry {attempt+1}/{self.max_retries} for {model} in {delay:.1f}s after error: {str(e)}")
+                time.sleep(delay)
+                queue_wait += delay
+
+    async def call_async(self, provider: str, model: str, fn: Callable[[], Awaitable[Any]],
+                         estimated_tokens: int = 0) -> Tuple[Any, float]:
+        """Async counterpart of `call`; `fn` returns a fresh awaitable on each attempt."""
+        queue_wait = 0.0
+        for attempt in range(self.max_retries + 1):
+            queue_wait += await self.acquire_async(provider, model, estimated_tokens)
+            try:
+                result = await fn()
+                self.record_success(provider, model)
+                return result, queue_wait
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._retry_delay(provider, model, e, attempt)
+                logger.warning(f"Retry {attempt+1}/{self.max_retries} for {model} in {delay:.1f}s after error: {str(e)}")
+                await asyncio.sleep(delay)
+                queue_wait += delay
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Queue wait and throttling counters per provider:model."""
+        with self._lock:
+            return {
+                f"{provider}:{model}": {
+                    "calls": budget.calls,
+                    "throttled": budget.throttled,
+                    "total_wait_seconds": round(budget.total_wait, 3),
+                    "mean_wait_seconds": round(budget.total_wait / budget.calls, 3) if budget.calls else 0.0,
+                    "max_wait_seconds": round(budget.max_wait, 3),
+                    "total_backoff_seconds": round(budget.total_backoff, 3)
+                }
+                for (provider, model), budget in self._budgets.items()
+            }
+
+
+def parse_rate_limits(values: Optional[List[str]]) -> Dict[str, Dict[str, float]]:
+    """Parse `provider[:model]=RPM/TPM` command-line values."""
+    limits = {}
+    for value in values or []:
+        key, _, budget = value.partition("=")
+        rpm, _, tpm = budget.partition("/")
+        if not rpm:
+            raise ValueError(f"Expected provider[:model]=RPM/TPM, got: {value}")
+        limits[key.strip()] = {"rpm": float(rpm)}
+        if tpm:
+            limits[key.strip()]["tpm"] = float(tpm)
+    return limits
+
+
+def add_rate_limit_arguments(parser):
+    """Add the shared rate limiting flags to an argparse parser."""
+    group = parser.add_argument_group("rate limiting")
+    group.add_argument("--rate-limit", action="append", metavar="PROVIDER[:MODEL]=RPM/TPM",
+                       help="Requests and tokens per minute for a provider or model, e.g. openai:gpt-4=500/30000")
+    group.add_argument("--max-retries", type=int, default=5,
+                       help="Retries for throttled or failed requests (default: 5)")
+    return group
+
+
+def scheduler_from_args(args) -> RateLimitScheduler:
+    return RateLimitScheduler(parse_rate_limits(args.rate_limit), max_retries=args.max_retries)
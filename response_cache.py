@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(".benchmark_cache", "responses.sqlite3")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a request has no cached response."""
+
+
+def request_key(provider: str, model: str, messages: List[Dict[str, Any]], **params) -> str:
+    """Return a stable content hash for a completion request.
+
+    `model` should be the resolved model name sent to the API so aliased labels share entries.
+    """
+    payload = {
+        "provider": provider,
+        "model": model,
+        "messages": messages,
+        "params": params
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of model responses backed by SQLite.
+
+    Modes:
+        readwrite: serve hits and store new responses (default)
+        replay:    serve hits only; a miss raises CacheMiss instead of calling the API
+        off:       bypass the cache entirely
+    """
+
+    MODES = ("readwrite", "replay", "off")
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, mode: str = "readwrite",
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 3600 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if mode != "off":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+            self._conn.commit()
+            if mode == "readwrite":
+                self.evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for a key, or None on a miss.
+
+        In replay mode a miss raises CacheMiss.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age_seconds and now - row[1] > self.max_age_seconds:
+                row = None
+            if row is not None:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        if row is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise CacheMiss(f"No cached response for request {key[:12]}")
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        """Store a JSON-serializable value under a key (no-op unless mode is readwrite)."""
+        if self.mode != "readwrite":
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+        self.writes += 1
+        # Keep the size bound without scanning the table on every write
+        if self.writes % 100 == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used entries until under max_bytes."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.max_age_seconds:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if self.max_bytes and total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                stale_keys = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                    stale_keys.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+                logger.info(f"Evicted {len(stale_keys)} cached responses ({freed} bytes)")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @classmethod
+    def from_args(cls, args) -> "ResponseCache":
+        """Build a cache from the flags added by add_cache_arguments."""
+        mode = "off" if args.no_cache else ("replay" if args.replay else "readwrite")
+        return cls(
+            path=args.cache_path,
+            mode=mode,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            max_age_days=args.cache_max_age_days
+        )
+
+
+def add_cache_arguments(parser):
+    """Add the shared response cache flags to an argparse parser."""
+    group = parser.add_argument_group("response cache")
+    group.add_argument("--cache-path", default=DEFAULT_CACHE_PATH,
+                       help=f"SQLite file for cached responses (default: {DEFAULT_CACHE_PATH})")
+    group.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024),
+                       help="Evict least recently used responses above this size")
+    group.add_argument("--cache-max-age-days", type=float, default=DEFAULT_MAX_AGE_DAYS,
+                       help="Ignore and evict responses older than this many days (0 disables)")
+    mode = group.add_mutually_exclusive_group()
+    mode.add_argument("--replay", action="store_true",
+                      help="Serve responses from the cache only and never call the API")
+    mode.add_argument("--no-cache", action="store_true",
+                      help="Bypass the response cache for this run")
+    return group
@@ -0,0 +1,125 @@
+import os
+import uuid
+import logging
+from typing import Any, Dict, List, Optional
+
+from profiling import timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.path.join("evaluation_results", "store")
+
+METRIC_COLUMNS = ["f1_score", "bleu_score", "rouge1", "rouge2", "rougeL"]
+
+# (name, arrow type) for every column; a missing value is stored as null
+COLUMNS = [
+    ("run_id", "string"),
+    ("model", "string"),
+    ("resolved_model", "string"),
+    ("task", "string"),
+    ("technique", "string"),
+    ("item_index", "int32"),
+    ("reference", "string"),
+    ("response", "string"),
+    ("error", "bool_"),
+    *[(metric, "float64") for metric in METRIC_COLUMNS],
+    ("latency_seconds", "float64"),
+    ("queue_wait_seconds", "float64"),
+    ("prompt_tokens", "int64"),
+    ("completion_tokens", "int64"),
+    ("cached_input_tokens", "int64"),
+    ("cache_write_tokens", "int64"),
+    ("votes", "int32"),
+    ("vote_agreement", "float64"),
+    ("latency_per_vote_seconds", "float64"),
+    ("completion_tokens_per_vote", "float64"),
+    ("cached", "bool_"),
+    ("coalesced", "bool_"),
+    ("resumed", "bool_")
+]
+
+GROUP_COLUMNS = ["run_id", "model", "task", "technique"]
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in COLUMNS])
+
+
+class ResultsStore:
+    """Per-item results as a directory of Parquet files, one row per work unit.
+
+    Rows are keyed by (run_id, model, task, technique, item_index). Each append
+    writes a new file, so appends never rewrite earlier data and concurrent
+    writers cannot clobber each other. Reads scan the directory as one Arrow
+    dataset, filtered to the requested runs.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_DIR):
+        self.path = path
+
+    @timed("store.append")
+    def append(self, rows: List[Dict[str, Any]]) -> Optional[str]:
+        """Write rows as a new Parquet file and return its path."""
+        if not rows:
+            return None
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = _schema()
+        table = pa.Table.from_pylist([{name: row.get(name) for name in schema.names} for row in rows], schema=schema)
+        os.makedirs(self.path, exist_ok=True)
+        file_path = os.path.join(self.path, f"{rows[0]['run_id']}-{uuid.uuid4().hex[:8]}.parquet")
+        pq.write_table(table, file_path)
+        logger.info(f"Appended {len(rows)} rows to {file_path}")
+        return file_path
+
+    def load(self, run_ids: Optional[List[str]] = None, columns: Optional[List[str]] = None):
+        """Return the stored rows (optionally for some runs only) as a pandas DataFrame."""
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(self.path, format="parquet", schema=_schema())
+        row_filter = ds.field("run_id").isin(run_ids) if run_ids else None
+        return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+    def runs(self) -> List[str]:
+        """Stored run ids, oldest first."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(self.load(columns=["run_id"])["run_id"].unique())
+
+    def aggregate(self, run_ids: Optional[List[str]] = None):
+        """Mean of each metric per run/model/task/technique plus attempted and successful counts.
+
+        Failed items have null metrics, so they count as attempted but not in
+        the means; groups with no successful item score 0, as in the sweeps.
+        """
+        frame = self.load(run_ids, columns=GROUP_COLUMNS + METRIC_COLUMNS)
+        grouped = frame.groupby(GROUP_COLUMNS, sort=False)
+        summary = grouped[METRIC_COLUMNS].mean().fillna(0.0)
+        summary["attempted"] = grouped.size()
+        summary["successful"] = grouped["f1_score"].count()
+        return summary.reset_index()
+
+    def nested_results(self, run_id: str) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        """One run's aggregates in the model -> task -> technique -> metric shape the plots use."""
+        results = {}
+        for row in self.aggregate([run_id]).itertuples(index=False):
+            results.setdefault(row.model, {}).setdefault(row.task, {})[row.technique] = {
+                metric: float(getattr(row, metric)) for metric in METRIC_COLUMNS
+            }
+        return results
+
+
+def add_results_store_arguments(parser):
+    """Add the results store flags to an argparse parser."""
+    group = parser.add_argument_group("results store")
+    group.add_argument("--results-store", default=DEFAULT_STORE_DIR, metavar="DIR",
+                       help=f"Directory of per-item Parquet results (default: {DEFAULT_STORE_DIR})")
+    group.add_argument("--no-results-store", action="store_true",
+                       help="Do not write per-item results")
+    return group
+
+
+def store_from_args(args) -> Optional[ResultsStore]:
+    return None if args.no_results_store else ResultsStore(args.results_store)
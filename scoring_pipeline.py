@@ -0,0 +1,194 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_CHUNK_SIZE = 16
+
+# Per-process scorer, built once by the pool initializer
+_worker_scorer = None
+
+
+def _init_worker(normalize: Optional[Callable[[str], str]]):
+    global _worker_scorer
+    from batch_scoring import BatchScorer
+    _worker_scorer = BatchScorer(normalize=normalize)
+
+
+def _score_chunk(references: List[str], responses: List[str]) -> Tuple[List[Optional[Dict[str, float]]], float]:
+    start = time.perf_counter()
+    metrics = _worker_scorer.score_responses(references, responses)
+    return metrics, time.perf_counter() - start
+
+
+class ScoringPipeline:
+    """Scores responses in worker processes while generation continues.
+
+    Producers submit (key, reference, response) as each response arrives; a
+    bounded queue applies backpressure when scoring falls behind. A feeder
+    thread groups queued items into chunks for a process pool whose workers
+    each hold their own BatchScorer, so stemming and LCS run across cores
+    instead of on the thread waiting for HTTP responses. `drain()` waits for
+    everything submitted so far and returns the metrics by key.
+    """
+
+    def __init__(self, normalize: Optional[Callable[[str], str]] = None, workers: Optional[int] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Spawned workers avoid forking a process that already runs threads and an event loop
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(normalize,)
+        )
+        # Chunks in flight are capped so the bounded queue is what absorbs bursts
+        self._in_flight = threading.Semaphore(self.workers * 2)
+        self._results = {}
+        self._condition = threading.Condition()
+        self._submitted = 0
+        self._completed = 0
+        self._started_at = None
+        self._last_submit_at = None
+        self._last_scored_at = None
+        self._blocked_seconds = 0.0
+        self._busy_seconds = 0.0
+        self._chunks = 0
+        self._failed_chunks = 0
+        self._max_queue_depth = 0
+        self._feeder = threading.Thread(target=self._feed, name="scoring-feeder", daemon=True)
+        self._feeder.start()
+
+    def _note_submit(self):
+        now = time.monotonic()
+        with self._condition:
+            if self._started_at is None:
+                self._started_at = now
+            self._last_submit_at = now
+            self._submitted += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+
+    def submit(self, key: Hashable, reference: str, response: str):
+        """Queue one response for scoring, blocking while the queue is full."""
+        item = (key, reference, response)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.monotonic()
+            self._queue.put(item)
+            with self._condition:
+                self._blocked_seconds += time.monotonic() - start
+        self._note_submit()
+
+    async def submit_async(self, key: Hashable, reference: str, response: str):
+        """Like `submit`, but waits for queue space off the event loop."""
+        item = (key, reference, response)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            start = time.monotonic()
+            await asyncio.to_thread(self._queue.put, item)
+            with self._condition:
+                self._blocked_seconds += time.monotonic() - start
+        self._note_submit()
+
+    def _feed(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            chunk = [item]
+            while len(chunk) < self.chunk_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._dispatch(chunk)
+                    return
+                chunk.append(item)
+            self._dispatch(chunk)
+
+    def _dispatch(self, chunk: List[Tuple[Hashable, str, str]]):
+        self._in_flight.acquire()
+        keys = [key for key, _, _ in chunk]
+        future = self._pool.submit(_score_chunk, [r for _, r, _ in chunk], [p for _, _, p in chunk])
+        future.add_done_callback(lambda f: self._collect(keys, f))
+
+    def _collect(self, keys: List[Hashable], future):
+        try:
+            metrics, busy = future.result()
+            failed = False
+        except Exception as e:
+            logger.error(f"Scoring worker failed on a chunk of {len(keys)} responses: {str(e)}")
+            metrics, busy, failed = [None] * len(keys), 0.0, True
+        finally:
+            self._in_flight.release()
+        with self._condition:
+            self._results.update(zip(keys, metrics))
+            self._completed += len(keys)
+            self._busy_seconds += busy
+            self._chunks += 1
+            self._failed_chunks += failed
+            self._last_scored_at = time.monotonic()
+            self._condition.notify_all()
+
+    def drain(self) -> Dict[Hashable, Optional[Dict[str, float]]]:
+        """Wait for every submitted response to be scored and return (and forget) the metrics."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._completed >= self._submitted)
+            results, self._results = self._results, {}
+        return results
+
+    def close(self):
+        self._queue.put(None)
+        self._feeder.join()
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput of the generation (submit) and scoring stages."""
+        with self._condition:
+            generation_span = (self._last_submit_at or 0.0) - (self._started_at or 0.0)
+            scoring_span = (self._last_scored_at or 0.0) - (self._started_at or 0.0)
+            return {
+                "workers": self.workers,
+                "generation": {
+                    "responses": self._submitted,
+                    "responses_per_second": round(self._submitted / generation_span, 3) if generation_span > 0 else None,
+                    "blocked_on_queue_seconds": round(self._blocked_seconds, 3),
+                    "max_queue_depth": self._max_queue_depth
+                },
+                "scoring": {
+                    "scored": self._completed,
+                    "chunks": self._chunks,
+                    "failed_chunks": self._failed_chunks,
+                    "scored_per_second": round(self._completed / scoring_span, 3) if scoring_span > 0 else None,
+                    "worker_busy_seconds": round(self._busy_seconds, 3)
+                }
+            }
+
+
+def add_scoring_arguments(parser):
+    """Add the scoring pipeline flags to an argparse parser."""
+    group = parser.add_argument_group("scoring")
+    group.add_argument("--scoring-workers", type=int, default=None,
+                       help="Scorer processes running alongside generation (default: up to 4; 0 scores inline)")
+    group.add_argument("--scoring-queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                       help=f"Responses buffered ahead of the scorers (default: {DEFAULT_QUEUE_SIZE})")
+    return group
+
+
+def pipeline_from_args(args, normalize: Optional[Callable[[str], str]] = None) -> Optional[ScoringPipeline]:
+    if args.scoring_workers == 0:
+        return None
+    return ScoringPipeline(normalize, workers=args.scoring_workers, queue_size=args.scoring_queue_size)
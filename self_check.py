@@ -0,0 +1,133 @@
+import os
+import sys
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+from mock_llm_server import MockConfig, start_mock_server, point_clients_at
+
+logger = logging.getLogger(__name__)
+
+# Failure injection for the stand-in server: high enough that a few dozen requests hit every outcome
+ERROR_RATE = 0.15
+THROTTLE_RATE = 0.15
+
+
+def check_load_test(rate: float = 8.0, stage_duration: float = 1.5) -> List[str]:
+    """Run the open-loop load generator against the mock server and check what it recorded.
+
+    Returns the failed expectations; empty when the check passes.
+    """
+    from http_clients import ProviderClients
+    from load_test import LoadGenerator, stage_curve
+
+    clients = ProviderClients()
+    generator = LoadGenerator(clients, max_tokens=16)
+    prompts = [[{"role": "user", "content": f"Load test prompt {i}"}] for i in range(50)]
+    stages = [(rate, stage_duration), (2 * rate, stage_duration)]
+
+    async def run_all():
+        return {model: await generator.run(model, prompts, stages)
+                for model in ("gpt-3.5-turbo", "claude-3-haiku-20240307")}
+
+    failures = []
+    for model, records in asyncio.run(run_all()).items():
+        curve = stage_curve(records, stages)
+        statuses = [record["status"] for record in records]
+        logger.info(f"Load test {model}: {len(records)} requests, {statuses.count('ok')} ok, "
+                    f"{statuses.count('error')} errors, {statuses.count('throttled')} throttled")
+        if len(curve) != len(stages):
+            failures.append(f"{model}: {len(curve)} curve points for {len(stages)} stages")
+        for point in curve:
+            if point["latency_seconds"]["p50"] is None or point["achieved_qps"] <= 0:
+                failures.append(f"{model}: no latency or throughput recorded at {point['offered_qps']:g} req/s")
+        if "error" not in statuses:
+            failures.append(f"{model}: injected server errors were not counted")
+        if "throttled" not in statuses:
+            failures.append(f"{model}: injected 429s were not counted as throttles")
+        if not any(point["error_rate"] > 0 for point in curve) or not any(point["throttle_rate"] > 0 for point in curve):
+            failures.append(f"{model}: error and throttle rates missing from the curve")
+    clients.close()
+    return failures
+
+
+def check_batch(requests: int = 20) -> List[str]:
+    """Submit a batch to the mock server's files/batches endpoints and check every request comes back.
+
+    Returns the failed expectations; empty when the check passes.
+    """
+    from http_clients import ProviderClients
+    from batch_backend import BatchRunner
+
+    clients = ProviderClients()
+    failures = []
+    with tempfile.TemporaryDirectory() as batch_dir:
+        runner = BatchRunner(clients.openai(), batch_dir=batch_dir, poll_interval=0.1)
+        bodies = [(f"item-{i}", {"model": "gpt-3.5-turbo", "max_tokens": 16,
+                                 "messages": [{"role": "user", "content": f"Batch prompt {i}"}]})
+                  for i in range(requests)]
+        results = runner.run(bodies)
+        leftover = [name for name in os.listdir(batch_dir) if name.endswith(".json")]
+    clients.close()
+
+    succeeded = [result for result in results.values() if "error" not in result]
+    failed = [result for result in results.values() if "error" in result]
+    logger.info(f"Batch: {len(succeeded)} succeeded, {len(failed)} failed of {requests}")
+    if set(results) != {custom_id for custom_id, _ in bodies}:
+        failures.append(f"batch returned {len(results)} results for {requests} requests")
+    if not succeeded or not all(result.get("choices") for result in succeeded):
+        failures.append("batch returned no completions")
+    if not failed:
+        failures.append("injected batch line errors were not reported")
+    if leftover:
+        failures.append(f"batch job state left behind: {leftover}")
+    return failures
+
+
+# Each check talks to the mock server the clients were pointed at
+CHECKS: Dict[str, Callable[[], List[str]]] = {
+    "load-test": check_load_test,
+    "batch": check_batch
+}
+
+
+def run_checks(names: List[str]) -> Dict[str, List[str]]:
+    """Run the named checks against one mock server with failure injection; failures per check."""
+    server = start_mock_server(MockConfig(latency_dist="exponential", latency_mean=0.02, token_latency=0.001,
+                                          error_rate=ERROR_RATE, throttle_rate=THROTTLE_RATE,
+                                          retry_after=0.1, batch_delay=0.2))
+    point_clients_at(server.url)
+    try:
+        return {name: CHECKS[name]() for name in names}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv: Optional[List[str]] = None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Exercise the load generator and the batch backend "
+                                                 "against a local mock server")
+    parser.add_argument("checks", nargs="*", metavar="CHECK",
+                        help=f"Checks to run: {', '.join(sorted(CHECKS))} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+
+    results = run_checks(args.checks or sorted(CHECKS))
+    for name, failures in results.items():
+        for failure in failures:
+            logger.error(f"{name}: {failure}")
+        logger.info(f"{name}: {'FAILED' if failures else 'ok'}")
+    if any(results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import re
+import json
+import time
+import asyncio
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from response_cache import ResponseCache, request_key
+from rate_limiter import RateLimitScheduler, estimate_request_tokens, status_code_of
+
+logger = logging.getLogger(__name__)
+
+# Marker the self-consistency prompts ask the model to put before its answer
+_FINAL_ANSWER = re.compile(r"final answer\s*[:\-]\s*(.+)", re.IGNORECASE | re.DOTALL)
+
+
+def extract_answer(text: str) -> str:
+    """The text after the last "Final answer:" marker, or the whole reply without one."""
+    matches = list(_FINAL_ANSWER.finditer(text))
+    if not matches:
+        return text.strip()
+    return matches[-1].group(1).strip().splitlines()[0].strip()
+
+
+def normalize_vote(answer: str) -> str:
+    """Lowercase, drop punctuation and articles, collapse whitespace."""
+    answer = re.sub(r"[^\w\s]", " ", answer.lower())
+    answer = re.sub(r"\b(a|an|the)\b", " ", answer)
+    return " ".join(answer.split())
+
+
+def majority_vote(samples: List[str]) -> Tuple[str, Dict[str, Any]]:
+    """Pick the most common normalized answer; ties go to the answer seen first.
+
+    Returns the winning answer as the model wrote it and the vote breakdown.
+    """
+    answers = [extract_answer(sample) for sample in samples]
+    votes = Counter(normalize_vote(answer) for answer in answers)
+    # Counter keeps insertion order, so most_common breaks ties by first occurrence
+    winner, count = votes.most_common(1)[0]
+    chosen = next(answer for answer in answers if normalize_vote(answer) == winner)
+    return chosen, {
+        "votes": len(samples),
+        "distinct_answers": len(votes),
+        "vote_agreement": count / len(samples)
+    }
+
+
+class SelfConsistencySampler:
+    """Draws k samples for a prompt and reduces them to one answer by majority vote.
+
+    Samples come from a single request with `n=k` where the endpoint accepts
+    it, otherwise from k concurrent single requests. Models that reject `n`
+    are remembered and go straight to parallel requests afterwards. The full
+    sample set is cached under a key that includes k and the temperature.
+    """
+
+    def __init__(self, samples: int = 5, temperature: float = 0.7, use_n: bool = True, max_tokens: int = 1000):
+        self.samples = samples
+        self.temperature = temperature
+        self.use_n = use_n
+        self.max_tokens = max_tokens
+        self._no_n = set()
+
+    def _params(self, n: int) -> Dict[str, Any]:
+        return {"temperature": self.temperature, "max_tokens": self.max_tokens, "n": n}
+
+    @staticmethod
+    def _texts(response) -> List[str]:
+        return [choice.message.content.strip() for choice in response.choices if choice.message.content]
+
+    @staticmethod
+    def _usage(response) -> Tuple[int, int]:
+        usage = getattr(response, "usage", None)
+        return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+    def _rejects_n(self, model: str, error: Exception) -> bool:
+        if status_code_of(error) != 400:
+            return False
+        logger.warning(f"{model} rejected n={self.samples}; drawing self-consistency samples in parallel")
+        self._no_n.add(model)
+        return True
+
+    def _summary(self, samples: List[str], started: float, queue_wait: float, prompt_tokens: int,
+                 completion_tokens: int, sampling: str) -> Tuple[str, Dict[str, Any]]:
+        answer, votes = majority_vote(samples)
+        latency = time.perf_counter() - started - queue_wait
+        return answer, {
+            **votes,
+            "sampling": sampling,
+            "latency_seconds": latency,
+            "latency_per_vote_seconds": latency / len(samples),
+            "queue_wait_seconds": queue_wait,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "completion_tokens_per_vote": completion_tokens / len(samples)
+        }
+
+    def batch_request(self, model: str, messages: List[Dict[str, str]]) -> Tuple[str, Dict[str, Any]]:
+        """Cache key and batch-API request body drawing all k samples with n=k."""
+        params = self._params(self.samples)
+        return request_key("openai", model, messages, **params), {"model": model, "messages": messages, **params}
+
+    def from_batch(self, cache: ResponseCache, cache_key: str, body: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Vote over a batch-API completion body; caches the samples like `sample` does."""
+        samples = [choice["message"]["content"].strip() for choice in body.get("choices", [])
+                   if choice["message"].get("content")]
+        if not samples:
+            return "", {"votes": 0}
+        cache.put(cache_key, json.dumps(samples))
+        answer, votes = majority_vote(samples)
+        usage = body.get("usage") or {}
+        completion_tokens = usage.get("completion_tokens") or 0
+        return answer, {
+            **votes,
+            "sampling": "batch",
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": completion_tokens,
+            "completion_tokens_per_vote": completion_tokens / len(samples)
+        }
+
+    def lookup(self, cache: ResponseCache, model: str,
+               messages: List[Dict[str, str]]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """The voted answer from a cached sample set, or None on a miss (CacheMiss in replay mode)."""
+        cached = cache.get(request_key("openai", model, messages, **self._params(self.samples)))
+        if cached is None:
+            return None
+        answer, votes = majority_vote(json.loads(cached))
+        return answer, {**votes, "cached": True}
+
+    def sample(self, client, rate_limiter: RateLimitScheduler, cache: ResponseCache,
+               model: str, messages: List[Dict[str, str]]) -> Tuple[str, Dict[str, Any]]:
+        """Return the voted answer and its vote/latency/token record."""
+        cache_key = request_key("openai", model, messages, **self._params(self.samples))
+        cached = self.lookup(cache, model, messages)
+        if cached is not None:
+            return cached
+
+        def create(n: int):
+            return rate_limiter.call(
+                "openai", model,
+                lambda: client.chat.completions.create(model=model, messages=messages, **self._params(n)),
+                estimate_request_tokens(messages, self.max_tokens * n)
+            )
+
+        started = time.perf_counter()
+        samples, queue_wait, prompt_tokens, completion_tokens = [], 0.0, 0, 0
+        sampling = "parallel"
+        if self.use_n and model not in self._no_n:
+            try:
+                response, queue_wait = create(self.samples)
+                samples = self._texts(response)
+                prompt_tokens, completion_tokens = self._usage(response)
+                sampling = "n"
+            except Exception as e:
+                if not self._rejects_n(model, e):
+                    raise
+
+        missing = self.samples - len(samples)
+        if missing > 0:
+            with ThreadPoolExecutor(max_workers=missing) as pool:
+                for response, wait in pool.map(lambda _: create(1), range(missing)):
+                    samples.extend(self._texts(response))
+                    queue_wait = max(queue_wait, wait)
+                    prompt, completion = self._usage(response)
+                    prompt_tokens += prompt
+                    completion_tokens += completion
+
+        if not samples:
+            return "", {"votes": 0}
+        cache.put(cache_key, json.dumps(samples))
+        return self._summary(samples, started, queue_wait, prompt_tokens, completion_tokens, sampling)
+
+    async def sample_async(self, client, rate_limiter: RateLimitScheduler, cache: ResponseCache,
+                           model: str, messages: List[Dict[str, str]],
+                           check_cache: bool = True) -> Tuple[str, Dict[str, Any]]:
+        """Async counterpart of `sample` for an AsyncOpenAI client.
+
+        Pass `check_cache=False` when the caller has already done the `lookup`.
+        """
+        cache_key = request_key("openai", model, messages, **self._params(self.samples))
+        cached = self.lookup(cache, model, messages) if check_cache else None
+        if cached is not None:
+            return cached
+
+        def create(n: int):
+            return rate_limiter.call_async(
+                "openai", model,
+                lambda: client.chat.completions.create(model=model, messages=messages, **self._params(n)),
+                estimate_request_tokens(messages, self.max_tokens * n)
+            )
+
+        started = time.perf_counter()
+        samples, queue_wait, prompt_tokens, completion_tokens = [], 0.0, 0, 0
+        sampling = "parallel"
+        if self.use_n and model not in self._no_n:
+            try:
+                response, queue_wait = await create(self.samples)
+                samples = self._texts(response)
+                prompt_tokens, completion_tokens = self._usage(response)
+                sampling = "n"
+            except Exception as e:
+                if not self._rejects_n(model, e):
+                    raise
+
+        missing = self.samples - len(samples)
+        if missing > 0:
+            for response, wait in await asyncio.gather(*(create(1) for _ in range(missing))):
+                samples.extend(self._texts(response))
+                queue_wait = max(queue_wait, wait)
+                prompt, completion = self._usage(response)
+                prompt_tokens += prompt
+                completion_tokens += completion
+
+        if not samples:
+            return "", {"votes": 0}
+        cache.put(cache_key, json.dumps(samples))
+        return self._summary(samples, started, queue_wait, prompt_tokens, completion_tokens, sampling)
+
+
+def add_self_consistency_arguments(parser):
+    """Add the self-consistency sampling flags to an argparse parser."""
+    group = parser.add_argument_group("self-consistency")
+    group.add_argument("--sc-samples", type=int, default=5,
+                       help="Samples drawn and voted on for the self_consistency technique (default: 5; 1 disables voting)")
+    group.add_argument("--sc-temperature", type=float, default=0.7,
+                       help="Sampling temperature for self-consistency votes (default: 0.7)")
+    group.add_argument("--sc-parallel", action="store_true",
+                       help="Always draw votes as parallel requests instead of one request with n>1")
+    return group
+
+
+def sampler_from_args(args) -> Optional[SelfConsistencySampler]:
+    if args.sc_samples <= 1:
+        return None
+    return SelfConsistencySampler(args.sc_samples, temperature=args.sc_temperature, use_n=not args.sc_parallel)
@@ -0,0 +1,112 @@
+import os
+import json
+import glob
+import logging
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+from sweep_engine import WorkUnit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_DIR = os.path.join("evaluation_results", "shards")
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse an `i/N` shard argument (1-based) into a 0-based (index, count)."""
+    try:
+        number, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected SHARD/COUNT, e.g. 1/4, got {value!r}")
+    if not 1 <= number <= count:
+        raise argparse.ArgumentTypeError(f"Shard {value!r} is out of range; shards are numbered 1 to N")
+    return number - 1, count
+
+
+def shard_label(index: int, count: int) -> str:
+    return f"{index + 1}-of-{count}"
+
+
+def shard_path(shard_dir: str, sweep_id: str, index: int, count: int) -> str:
+    return os.path.join(shard_dir, sweep_id, f"shard-{shard_label(index, count)}.json")
+
+
+def write_shard(path: str, sweep_id: str, index: int, count: int, models: List[str], tasks: List[str],
+                techniques: List[str], units: List[WorkUnit], item_metrics: List[Optional[Dict[str, float]]]) -> str:
+    """Write one shard's per-item metrics; the merge step aggregates them."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = {
+        "sweep_id": sweep_id,
+        "shard": index,
+        "shards": count,
+        "models": models,
+        "tasks": tasks,
+        "techniques": techniques,
+        "items": [
+            {"model": unit.model, "task": unit.task, "technique": unit.technique,
+             "item_index": unit.item_index, "metrics": metrics}
+            for unit, metrics in zip(units, item_metrics)
+        ]
+    }
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(partial, f)
+    os.replace(f"{path}.tmp", path)
+    logger.info(f"Wrote shard {index + 1}/{count} of sweep {sweep_id} ({len(units)} units) to {path}")
+    return path
+
+
+def load_shards(paths: List[str]) -> Dict[str, Any]:
+    """Read shard files (or directories of them) from one sweep and check the set is complete.
+
+    Returns the sweep's models, tasks and techniques plus every unit and its
+    metrics. Raises ValueError if the files come from different sweeps or a
+    shard is missing.
+    """
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "shard-*.json"))) if os.path.isdir(path) else [path])
+    if not files:
+        raise ValueError(f"No shard files found in {', '.join(paths)}")
+
+    partials = []
+    for file in files:
+        with open(file) as f:
+            partials.append(json.load(f))
+    first = partials[0]
+    for partial in partials[1:]:
+        if (partial["sweep_id"], partial["shards"]) != (first["sweep_id"], first["shards"]):
+            raise ValueError(f"Shard files belong to different sweeps: {first['sweep_id']} "
+                             f"({first['shards']} shards) and {partial['sweep_id']} ({partial['shards']} shards)")
+    count = first["shards"]
+    indices = [partial["shard"] for partial in partials]
+    if len(indices) != len(set(indices)):
+        raise ValueError(f"Sweep {first['sweep_id']} has duplicate shard files: {', '.join(files)}")
+    missing = sorted(set(range(count)) - set(indices))
+    if missing:
+        raise ValueError(f"Sweep {first['sweep_id']} is missing shards "
+                         f"{', '.join(f'{index + 1}/{count}' for index in missing)}")
+
+    units, item_metrics = [], []
+    for partial in partials:
+        for item in partial["items"]:
+            units.append(WorkUnit(item["model"], item["task"], item["technique"], item["item_index"]))
+            item_metrics.append(item["metrics"])
+    return {
+        "sweep_id": first["sweep_id"],
+        "models": first["models"],
+        "tasks": first["tasks"],
+        "techniques": first["techniques"],
+        "units": units,
+        "item_metrics": item_metrics
+    }
+
+
+def add_shard_arguments(parser):
+    """Add the sharded-execution flags to an argparse parser."""
+    group = parser.add_argument_group("sharding")
+    group.add_argument("--shard", type=parse_shard, metavar="I/N",
+                       help="Run only shard I of N of the sweep (1-based, e.g. 2/4) and write its partial results; "
+                            "combine the shards with `cli.py merge`")
+    group.add_argument("--shard-dir", default=DEFAULT_SHARD_DIR, metavar="DIR",
+                       help=f"Where shard results are written (default: {DEFAULT_SHARD_DIR})")
+    return group
@@ -1,14 +1,22 @@
 import os
 import json
 import logging
-import time
+import argparse
 from datetime import datetime
-from typing import List, Dict, Any
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from openai import OpenAI
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from response_cache import ResponseCache, CacheMiss, request_key, add_cache_arguments
+from checkpoint import CheckpointLog, add_checkpoint_arguments
+from sweep_engine import WorkUnit
+from work_plan import WorkPlan
+from mock_llm_server import add_mock_server_arguments, point_clients_at
+from plotting import FigureRenderer, bar_figure, heatmap_figure, heatmap_panel, matrix, add_plot_arguments, renderer_from_args
+from self_consistency import SelfConsistencySampler, add_self_consistency_arguments, sampler_from_args
+from http_clients import ProviderClients, add_http_arguments, clients_from_args
+from rate_limiter import RateLimitScheduler, estimate_request_tokens, add_rate_limit_arguments, scheduler_from_args
+from event_log import EventLog, add_event_log_arguments
+from prompt_caching import PromptCaching, add_prompt_caching_arguments, prompt_caching_from_args
+from hedging import HedgingPolicy, add_hedging_arguments, hedging_from_args
 
 # Load environment variables
 load_dotenv()
@@ -20,9 +28,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Map model names to actual OpenAI model names
+MODEL_MAPPING = {
+    "gpt-3.5-turbo": "gpt-3.5-turbo",
+    "gpt-4o-mini": "gpt-4o-mini",
+    "o1-mini": "gpt-3.5-turbo",  # Fallback
+    "o3-mini": "gpt-4"           # Fallback
+}
+
+# Tasks included in a full evaluation run
+EVALUATED_TASKS = ["factual_qa", "reasoning", "summarization"]
+
+# Tasks with a short answer that self-consistency samples can vote on
+VOTED_TASKS = {"factual_qa", "reasoning"}
+
 class SimpleModelEvaluator:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    def __init__(self, cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimitScheduler] = None,
+                 checkpoint: Optional[CheckpointLog] = None,
+                 clients: Optional[ProviderClients] = None,
+                 voting: Optional[SelfConsistencySampler] = None,
+                 events: Optional[EventLog] = None,
+                 prompt_caching: Optional[PromptCaching] = None,
+                 hedging: Optional[HedgingPolicy] = None):
+        # Shared, pooled SDK clients; SDK retries are disabled since the rate limiter owns retries
+        self.clients = clients or ProviderClients()
+        self.openai_client = self.clients.openai()
+        self.cache = cache or ResponseCache(mode="off")
+        self.rate_limiter = rate_limiter or RateLimitScheduler()
+        self.checkpoint = checkpoint or CheckpointLog()
+        # Optional sampled self-consistency; without one, the technique is a single completion
+        self.voting = voting
+        # Structured per-item events; without one, nothing is logged per item
+        self.events = events or EventLog()
+        # Cached-token accounting; with caching enabled, requests carry a prompt_cache_key for their prefix
+        self.prompt_caching = prompt_caching or PromptCaching()
+        # Optional hedging of slow requests; disabled, every request is sent once
+        self.hedging = hedging or HedgingPolicy()
         
         # Verify API key
         if not os.getenv('OPENAI_API_KEY'):
@@ -106,51 +148,99 @@ class SimpleModelEvaluator:
             ]
         }
 
+        self.prompt_generators = {
+            "standard": lambda task_type, q: [
+                {"role": "system", "content": "You are a helpful assistant."}, 
+                {"role": "user", "content": q}
+            ],
+            "few_shot": self.get_few_shot_prompt,
+            "chain_of_thought": self.get_chain_of_thought_prompt,
+            "self_consistency": self.get_self_consistency_prompt,
+            "role": self.get_role_prompt,
+            "react": self.get_react_prompt
+        }
+        # Rendered prompts are identical across models, so render each one once
+        self._few_shot_prefixes = {}
+        self._renderings = {}
+
+    def resolve_model(self, model: str) -> str:
+        return MODEL_MAPPING.get(model, model)
+
     def get_model_response(self, model: str, messages: List[Dict[str, str]]) -> str:
         """Get response from a model with retry logic."""
         try:
-            # Map model names to actual OpenAI model names
-            model_mapping = {
-                "gpt-3.5-turbo": "gpt-3.5-turbo",
-                "gpt-4o-mini": "gpt-4o-mini",
-                "o1-mini": "gpt-3.5-turbo",  # Fallback
-                "o3-mini": "gpt-4"           # Fallback
-            }
+            actual_model = self.resolve_model(model)
+            logger.debug("Using model: %s", actual_model)
+
+            cache_key = request_key("openai", actual_model, messages, temperature=0, max_tokens=1000)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            actual_model = model_mapping.get(model, model)
-            logger.info(f"Using model: {actual_model}")
+            # Rate limiting, Retry-After handling and jittered backoff; a hedge reserves its own slot
+            estimated_tokens = estimate_request_tokens(messages, 1000)
+            response, queue_wait = self.rate_limiter.call(
+                "openai", actual_model,
+                lambda: self.hedging.call(actual_model, lambda: self.openai_client.chat.completions.create(
+                    model=actual_model,
+                    messages=messages,
+                    temperature=0,
+                    max_tokens=1000,
+                    **self.prompt_caching.openai_params(messages)
+                ), lambda: self.rate_limiter.acquire("openai", actual_model, estimated_tokens)),
+                estimated_tokens
+            )
+            if queue_wait > 0:
+                logger.debug(f"Waited {queue_wait:.2f}s in queue for {actual_model}")
+            self.prompt_caching.record(actual_model, getattr(response, "usage", None))
             
-            # Add retry logic with backoff
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = self.openai_client.chat.completions.create(
-                        model=actual_model,
-                        messages=messages,
-                        temperature=0,
-                        max_tokens=1000
-                    )
-                    
-                    if response.choices:
-                        result = response.choices[0].message.content.strip()
-                        return result
-                    else:
-                        logger.warning(f"No response choices from {actual_model}")
-                        return ""
-                except Exception as e:
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Retry {attempt+1}/{max_retries} after error: {str(e)}")
-                        time.sleep(2 * (attempt + 1))  # Exponential backoff
-                        continue
-                    else:
-                        raise
+            if response.choices:
+                result = response.choices[0].message.content.strip()
+                if result:
+                    self.cache.put(cache_key, result)
+                return result
+            else:
+                logger.warning(f"No response choices from {actual_model}")
+                return ""
                 
+        except CacheMiss as e:
+            logger.warning(f"Replay mode: {str(e)} for {model}")
+            return f"ERROR: No cached response for {model}"
         except Exception as e:
             logger.error(f"Error getting response from {model}: {str(e)}")
             return f"ERROR: Failed to get response from {model}"
 
-    def get_few_shot_prompt(self, task_type: str, question: str) -> List[Dict[str, str]]:
-        """Generate few-shot prompt with examples."""
+    def get_unit_response(self, unit: WorkUnit, messages: List[Dict[str, str]]) -> str:
+        """Return a work unit's response from the checkpoint log, or request and log it."""
+        response = self.checkpoint.get(unit)
+        if response is None:
+            if self.voting and unit.technique == "self_consistency" and unit.task in VOTED_TASKS:
+                response = self.get_voted_response(unit.model, messages)
+            else:
+                response = self.get_model_response(unit.model, messages)
+            self.checkpoint.record(unit, response)
+        return response
+
+    def get_voted_response(self, model: str, messages: List[Dict[str, str]]) -> str:
+        """Majority-voted answer over self-consistency samples."""
+        try:
+            answer, votes = self.voting.sample(self.openai_client, self.rate_limiter, self.cache,
+                                               self.resolve_model(model), messages)
+            logger.debug("Self-consistency votes for %s: %s", model, votes)
+            return answer
+        except CacheMiss as e:
+            logger.warning(f"Replay mode: {str(e)} for {model}")
+            return f"ERROR: No cached response for {model}"
+        except Exception as e:
+            logger.error(f"Error sampling self-consistency votes from {model}: {str(e)}")
+            return f"ERROR: Failed to get response from {model}"
+
+    def get_few_shot_prefix(self, task_type: str) -> List[Dict[str, str]]:
+        """Return the system message and worked examples shared by every few-shot prompt of a task."""
+        prefix = self._few_shot_prefixes.get(task_type)
+        if prefix is not None:
+            return prefix
+
         messages = [
             {"role": "system", "content": "You are a helpful assistant that answers questions accurately."}
         ]
@@ -171,11 +261,15 @@ class SimpleModelEvaluator:
                     {"role": "user", "content": example["question"]},
                     {"role": "assistant", "content": example["answer"]}
                 ])
-        
-        # Add the actual question
-        messages.append({"role": "user", "content": question})
+
+        self._few_shot_prefixes[task_type] = messages
         return messages
 
+    def get_few_shot_prompt(self, task_type: str, question: str) -> List[Dict[str, str]]:
+        """Generate few-shot prompt with examples."""
+        # Add the actual question after the shared examples
+        return self.get_few_shot_prefix(task_type) + [{"role": "user", "content": question}]
+
     def get_chain_of_thought_prompt(self, task_type: str, question: str) -> List[Dict[str, str]]:
         """Generate chain-of-thought prompt."""
         return [
@@ -187,9 +281,9 @@ class SimpleModelEvaluator:
     def get_self_consistency_prompt(self, task_type: str, question: str) -> List[Dict[str, str]]:
         """Generate self-consistency prompt."""
         return [
-            {"role": "system", "content": "You are a helpful assistant that solves problems multiple ways. "
-                                        "Provide three different approaches to solve the problem, then give your final answer."},
-            {"role": "user", "content": f"Solve this problem using three different approaches:\n\n{question}"}
+            {"role": "system", "content": "You are a helpful assistant that solves problems carefully. "
+                                        "Reason briefly, then end with a line of the form \"Final answer: <answer>\"."},
+            {"role": "user", "content": f"Solve this problem:\n\n{question}"}
         ]
 
     def get_role_prompt(self, task_type: str, question: str) -> List[Dict[str, str]]:
@@ -215,67 +309,90 @@ class SimpleModelEvaluator:
             {"role": "user", "content": question}
         ]
 
+    def item_prompt(self, task_type: str, item: Dict[str, Any]) -> str:
+        """The user-facing text for one task item."""
+        if task_type == "summarization":
+            return f"Please summarize the following text:\n\n{item['text']}"
+        return item["question"]
+
+    def render_messages(self, task_type: str, technique: str, index: int) -> List[Dict[str, str]]:
+        """Render (and memoize) the messages for one task item under a technique."""
+        key = (task_type, technique, index)
+        messages = self._renderings.get(key)
+        if messages is None:
+            item = self.tasks[task_type][index]
+            messages = self._renderings[key] = self.prompt_generators[technique](task_type, self.item_prompt(task_type, item))
+        return messages
+
+    def build_plan(self, models: List[str]) -> WorkPlan:
+        """Expand the sweep into a rendered work plan."""
+        return WorkPlan.build(
+            (WorkUnit(model, task_type, technique, index), "openai", self.resolve_model(model),
+             self.render_messages(task_type, technique, index), 1000)
+            for model in models
+            for task_type in EVALUATED_TASKS
+            for technique in self.prompting_techniques
+            for index in range(len(self.tasks[task_type]))
+        )
+
+    @staticmethod
+    def event_key(unit: WorkUnit) -> str:
+        return f"{unit.model}|{unit.task}|{unit.technique}|{unit.item_index}"
+
+    def unit_fields(self, unit: WorkUnit) -> Dict[str, Any]:
+        """A work unit's identity fields for event log entries."""
+        return {"model": unit.model, "resolved_model": self.resolve_model(unit.model), "task": unit.task,
+                "technique": unit.technique, "item_index": unit.item_index}
+
     def evaluate_with_technique(self, model: str, task_type: str, technique: str) -> Dict[str, float]:
         """Evaluate model using a specific prompting technique."""
         correct = 0
         total = len(self.tasks[task_type])
-        
-        prompt_generators = {
-            "standard": lambda task_type, q: [
-                {"role": "system", "content": "You are a helpful assistant."}, 
-                {"role": "user", "content": q}
-            ],
-            "few_shot": self.get_few_shot_prompt,
-            "chain_of_thought": self.get_chain_of_thought_prompt,
-            "self_consistency": self.get_self_consistency_prompt,
-            "role": self.get_role_prompt,
-            "react": self.get_react_prompt
-        }
 
-        for item in self.tasks[task_type]:
+        for index, item in enumerate(self.tasks[task_type]):
+            unit = WorkUnit(model, task_type, technique, index)
             try:
                 if task_type == "summarization":
                     text = item["text"]
                     expected_elements = item["expected_elements"]
                     
-                    messages = prompt_generators[technique](task_type, f"Please summarize the following text:\n\n{text}")
-                    response = self.get_model_response(model, messages)
+                    messages = self.render_messages(task_type, technique, index)
+                    response = self.get_unit_response(unit, messages)
                     
                     if response.startswith("ERROR:"):
                         logger.warning(f"API error for {model} using {technique} on {task_type}: {response}")
+                        self.events.emit("item", **self.unit_fields(unit), text=text, response=response, error=True)
                         continue
                     
                     # Count how many expected elements are present in the response
                     normalized_response = response.lower().strip()
                     elements_found = sum(1 for element in expected_elements if element.lower() in normalized_response)
                     accuracy = elements_found / len(expected_elements)
-                    
-                    logger.info(f"\nTechnique: {technique}")
-                    logger.info(f"Text: {text[:100]}...")
-                    logger.info(f"Expected elements: {expected_elements}")
-                    logger.info(f"Response: {normalized_response[:200]}...")
-                    logger.info(f"Elements found: {elements_found}/{len(expected_elements)}")
+
+                    if self.events.should_log(self.event_key(unit)):
+                        self.events.emit("item", **self.unit_fields(unit), text=text,
+                                         expected_elements=expected_elements, response=normalized_response,
+                                         elements_found=elements_found, accuracy=accuracy)
                     
                     correct += accuracy
                 else:
                     question = item["question"]
                     expected_answer = item["answer"].lower()
                     
-                    messages = prompt_generators[technique](task_type, question)
-                    response = self.get_model_response(model, messages)
+                    messages = self.render_messages(task_type, technique, index)
+                    response = self.get_unit_response(unit, messages)
                     
                     if response.startswith("ERROR:"):
                         logger.warning(f"API error for {model} using {technique} on {task_type}: {response}")
+                        self.events.emit("item", **self.unit_fields(unit), question=question, response=response, error=True)
                         continue
                     
                     normalized_response = response.lower().strip()
                     is_correct = expected_answer in normalized_response
-                    
-                    logger.info(f"\nTechnique: {technique}")
-                    logger.info(f"Question: {question}")
-                    logger.info(f"Expected: {expected_answer}")
-                    logger.info(f"Response: {normalized_response[:200]}...")
-                    logger.info(f"Correct: {is_correct}")
+
+                    if self.events.should_log(self.event_key(unit)):
+                        self.events.emit("item", **self.unit_fields(unit), question=question, expected=expected_answer,
+                                         response=normalized_response, correct=is_correct)
                     
                     if is_correct:
                         correct += 1
@@ -292,7 +409,7 @@ class SimpleModelEvaluator:
         """Evaluate a model on all tasks using different prompting techniques."""
         results = {}
         
-        for task_type in ["factual_qa", "reasoning", "summarization"]:
+        for task_type in EVALUATED_TASKS:
             task_results = {}
             logger.info(f"\nEvaluating {model} on {task_type}...")
             
@@ -305,10 +422,79 @@ class SimpleModelEvaluator:
         
         return results
 
-def main():
+def plot_results(all_results: Dict[str, Dict[str, Dict[str, float]]], output_path: str, timestamp: str,
+                 renderer: Optional[FigureRenderer] = None) -> Dict[str, float]:
+    """Render the task heatmap and overall bar chart; return each model's average score."""
+    renderer = renderer or FigureRenderer()
+
+    # 1. Task-specific scores
+    task_scores = {}
+    for model, results in all_results.items():
+        model_scores = {}
+        for task, metrics in results.items():
+            for metric, score in metrics.items():
+                model_scores[f"{task}_{metric}"] = score
+        task_scores[model] = model_scores
+    models = list(task_scores)
+    columns = list(dict.fromkeys(column for scores in task_scores.values() for column in scores))
+    heatmap = heatmap_figure(
+        f"simple_comparison_{timestamp}",
+        [heatmap_panel('Model Performance by Task', models, columns, matrix(task_scores, models, columns),
+                       cmap='YlGnBu', vmin=0, vmax=1)],
+        [15, 10]
+    )
+    
+    # 2. Overall performance: average score per model
+    avg_scores = {}
+    for model, results in all_results.items():
+        scores = []
+        for task, metrics in results.items():
+            scores.extend(metrics.values())
+        avg_scores[model] = sum(scores) / len(scores) if scores else 0
+    
+    bars = bar_figure(f"simple_overall_{timestamp}", 'Overall Model Performance', list(avg_scores),
+                      list(avg_scores.values()), 'Average Score', [12, 8], ylim=[0, 1])
+
+    for path in renderer.render([heatmap, bars], output_path)["rendered"]:
+        logger.info(f"Saved figure to: {path}")
+
+    return avg_scores
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Evaluate OpenAI models on small hand-written tasks")
+    parser.add_argument("--plan-only", action="store_true",
+                        help="Build and print the work plan (counts, estimated tokens) without sending requests")
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_checkpoint_arguments(parser)
+    add_plot_arguments(parser)
+    add_http_arguments(parser)
+    add_self_consistency_arguments(parser)
+    add_event_log_arguments(parser)
+    add_prompt_caching_arguments(parser)
+    add_hedging_arguments(parser)
+    add_mock_server_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.mock_server:
+        point_clients_at(args.mock_server)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
     # Initialize evaluator
     try:
-        evaluator = SimpleModelEvaluator()
+        evaluator = SimpleModelEvaluator(
+            cache=ResponseCache.from_args(args),
+            rate_limiter=scheduler_from_args(args),
+            checkpoint=CheckpointLog.from_args(args, "simple.jsonl"),
+            clients=clients_from_args(args),
+            voting=sampler_from_args(args),
+            events=EventLog.from_args(args, f"simple_{timestamp}"),
+            prompt_caching=prompt_caching_from_args(args),
+            hedging=hedging_from_args(args)
+        )
     except ValueError as e:
         logger.error(f"Failed to initialize evaluator: {str(e)}")
         return
@@ -320,6 +506,10 @@ def main():
         "o1-mini",
         "o3-mini"
     ]
+
+    if args.plan_only:
+        print(json.dumps(evaluator.build_plan(models).summary(), indent=2))
+        return
     
     # Store results
     all_results = {}
@@ -335,10 +525,21 @@ def main():
         except Exception as e:
             logger.error(f"Error evaluating {model}: {str(e)}")
             continue
+
+    evaluator.checkpoint.close()
+    logger.info(f"Connection pools: {json.dumps(evaluator.clients.stats(), indent=2)}")
+    evaluator.clients.close()
+    logger.info(f"Response cache: {evaluator.cache.stats()}")
+    logger.info(f"Prompt caching: {json.dumps(evaluator.prompt_caching.stats(), indent=2)}")
+    if evaluator.hedging.enabled:
+        logger.info(f"Hedged requests: {json.dumps(evaluator.hedging.stats(), indent=2)}")
+        evaluator.hedging.close()
+    logger.info(f"Rate limiter queue waits: {json.dumps(evaluator.rate_limiter.stats(), indent=2)}")
+    evaluator.events.close()
+    logger.info(f"Event log: {evaluator.events.stats()}")
     
     if all_results:
         # Save results
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = "evaluation_results"
         os.makedirs(output_path, exist_ok=True)
         
@@ -348,56 +549,7 @@ def main():
             json.dump(all_results, f, indent=2)
         logger.info(f"Saved raw results to: {results_file}")
         
-        # Create visualizations
-        # 1. Task-specific scores
-        plt.figure(figsize=(15, 10))
-        
-        # Prepare data for visualization
-        task_scores = {}
-        for model, results in all_results.items():
-            model_scores = {}
-            for task, metrics in results.items():
-                for metric, score in metrics.items():
-                    model_scores[f"{task}_{metric}"] = score
-            task_scores[model] = model_scores
-        
-        # Create DataFrame
-        df = pd.DataFrame.from_dict(task_scores, orient='index')
-        
-        # Create heatmap
-        sns.heatmap(df, annot=True, cmap='YlGnBu', fmt='.3f', vmin=0, vmax=1)
-        plt.title('Model Performance by Task')
-        plt.tight_layout()
-        
-        heatmap_file = f"{output_path}/simple_comparison_{timestamp}.png"
-        plt.savefig(heatmap_file, dpi=300, bbox_inches='tight')
-        plt.close()
-        logger.info(f"Saved heatmap to: {heatmap_file}")
-        
-        # 2. Overall performance
-        plt.figure(figsize=(12, 8))
-        
-        # Calculate average score per model
-        avg_scores = {}
-        for model, results in all_results.items():
-            scores = []
-            for task, metrics in results.items():
-                scores.extend(metrics.values())
-            avg_scores[model] = sum(scores) / len(scores) if scores else 0
-        
-        # Create bar chart
-        plt.bar(avg_scores.keys(), avg_scores.values())
-        plt.title('Overall Model Performance')
-        plt.ylabel('Average Score')
-        plt.ylim(0, 1)
-        
-        for i, (model, score) in enumerate(avg_scores.items()):
-            plt.text(i, score + 0.02, f'{score:.3f}', ha='center')
-        
-        barplot_file = f"{output_path}/simple_overall_{timestamp}.png"
-        plt.savefig(barplot_file, dpi=300, bbox_inches='tight')
-        plt.close()
-        logger.info(f"Saved bar plot to: {barplot_file}")
+        avg_scores = plot_results(all_results, output_path, timestamp, renderer_from_args(args))
         
         # Print results in a formatted way
         logger.info("\n=== Final Evaluation Results ===")
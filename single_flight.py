@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls: the first caller for a key runs it, the rest share its outcome.
+
+    Keys should identify the request as sent (resolved model plus payload),
+    so aliased model labels that map to the same model share one call. Only
+    calls that overlap in time are merged; a key is forgotten as soon as
+    its call finishes, and repeats after that are the response cache's job.
+    Exceptions are shared like results.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def _count(self, group: str, shared: bool):
+        with self._lock:
+            counts = self._counts.setdefault(group, {"calls": 0, "coalesced": 0})
+            counts["coalesced" if shared else "calls"] += 1
+
+    def do(self, key: Hashable, fn: Callable[[], Any], group: str = "") -> Tuple[Any, bool]:
+        """Run `fn` once per concurrent `key`; returns its result and whether it was shared from another caller."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        self._count(group, not leader)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]], group: str = "") -> Tuple[Any, bool]:
+        """Async counterpart of `do`; callers on the same event loop share one task per key."""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if not shared:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        self._count(group, shared)
+        # Shielded, so a cancelled caller does not cancel the call the others are waiting on
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls made and calls saved by coalescing, per group (resolved model)."""
+        with self._lock:
+            groups = {group: dict(counts) for group, counts in self._counts.items()}
+        for counts in groups.values():
+            total = counts["calls"] + counts["coalesced"]
+            counts["saved_fraction"] = round(counts["coalesced"] / total, 4) if total else 0.0
+        return {
+            "calls": sum(counts["calls"] for counts in groups.values()),
+            "calls_saved": sum(counts["coalesced"] for counts in groups.values()),
+            "by_model": groups
+        }
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default number of requests allowed in flight at once for each provider
+DEFAULT_IN_FLIGHT_LIMITS = {
+    "openai": 8,
+    "anthropic": 4
+}
+
+
+def provider_for_model(model: str) -> str:
+    """Return the API provider that serves a model name."""
+    return "anthropic" if model.startswith("claude") else "openai"
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+    """One (model, task, technique, item) cell of a benchmark sweep."""
+    model: str
+    task: str
+    technique: str
+    item_index: int
+
+    @property
+    def provider(self) -> str:
+        return provider_for_model(self.model)
+
+
+class AsyncSweepEngine:
+    """Run work units concurrently with a separate in-flight limit per provider."""
+
+    def __init__(self, in_flight_limits: Optional[Dict[str, int]] = None, default_limit: int = 4):
+        self.in_flight_limits = dict(DEFAULT_IN_FLIGHT_LIMITS)
+        if in_flight_limits:
+            self.in_flight_limits.update(in_flight_limits)
+        self.default_limit = default_limit
+        self.completed = 0
+        self.failed = 0
+
+    def _semaphores(self, units: List[WorkUnit]) -> Dict[str, asyncio.Semaphore]:
+        # Semaphores must be created inside the running event loop
+        providers = {unit.provider for unit in units}
+        return {
+            provider: asyncio.Semaphore(max(1, self.in_flight_limits.get(provider, self.default_limit)))
+            for provider in providers
+        }
+
+    async def run(self, units: List[WorkUnit],
+                  worker: Callable[[WorkUnit], Awaitable[Any]]) -> List[Any]:
+        """Run `worker` over every unit and return the results in unit order.
+
+        A unit whose worker raises yields None so one failure does not cancel the sweep.
+        """
+        semaphores = self._semaphores(units)
+
+        async def run_unit(unit: WorkUnit) -> Any:
+            async with semaphores[unit.provider]:
+                try:
+                    result = await worker(unit)
+                    self.completed += 1
+                    return result
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Error running {unit}: {str(e)}", exc_info=True)
+                    return None
+
+        return await asyncio.gather(*(run_unit(unit) for unit in units))
+
+    def run_sync(self, units: List[WorkUnit],
+                 worker: Callable[[WorkUnit], Awaitable[Any]]) -> List[Any]:
+        """Blocking wrapper around `run` for callers outside an event loop."""
+        return asyncio.run(self.run(units, worker))
+
+
+def parse_in_flight_limits(values: Optional[List[str]]) -> Dict[str, int]:
+    """Parse `provider=N` command-line values into an in-flight limit mapping."""
+    limits = {}
+    for value in values or []:
+        provider, _, limit = value.partition("=")
+        if not limit:
+            raise ValueError(f"Expected provider=N, got: {value}")
+        limits[provider.strip()] = int(limit)
+    return limits
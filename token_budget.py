@@ -0,0 +1,236 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_CACHE_PATH = os.path.join(".benchmark_cache", "token_counts.json")
+
+TRUNCATION_POLICIES = ["none", "head", "head_tail"]
+
+# Approximate list prices in USD per million (input, output) tokens; override with --price
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4": (30.00, 60.00)
+}
+
+# Chat formatting adds a few tokens per message and per reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+_ELISION = "\n...\n"
+
+
+class TokenCounter:
+    """Local prompt token counts, memoized by text hash and persisted between runs.
+
+    Uses tiktoken when it is installed and falls back to ~4 characters per
+    token otherwise. Cached counts are keyed by tokenizer, so switching
+    between the two never mixes counts.
+    """
+
+    def __init__(self, cache_path: Optional[str] = DEFAULT_TOKEN_CACHE_PATH, encoding: str = "cl100k_base"):
+        self.cache_path = cache_path
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding)
+            self.tokenizer = f"tiktoken:{encoding}"
+        except ImportError:
+            self.tokenizer = "chars/4"
+        self._counts = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self._counts = json.load(f).get(self.tokenizer, {})
+            except (OSError, ValueError):
+                logger.warning(f"Ignoring unreadable token count cache {cache_path}")
+
+    def _encode(self, text: str) -> List[int]:
+        return self._encoding.encode(text, disallowed_special=())
+
+    def count(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+        count = self._counts.get(key)
+        if count is None:
+            count = len(self._encode(text)) if self._encoding else len(text) // 4
+            with self._lock:
+                self._counts[key] = count
+                self._dirty = True
+        return count
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """Prompt tokens of a chat request, including the per-message formatting overhead."""
+        return sum(self.count(str(m.get("content", ""))) + TOKENS_PER_MESSAGE for m in messages) + TOKENS_PER_REPLY
+
+    def truncate(self, text: str, max_tokens: int, policy: str) -> str:
+        """Cut `text` to about `max_tokens`, keeping the start ("head") or both ends ("head_tail")."""
+        if policy == "none" or self.count(text) <= max_tokens:
+            return text
+        if self._encoding:
+            tokens = self._encode(text)
+            if policy == "head":
+                return self._encoding.decode(tokens[:max_tokens])
+            half = max_tokens // 2
+            return self._encoding.decode(tokens[:half]) + _ELISION + self._encoding.decode(tokens[-half:])
+        # Character fallback: cut on whitespace so no word is split
+        limit = max_tokens * 4
+        if policy == "head":
+            return text[:limit].rsplit(None, 1)[0]
+        half = limit // 2
+        return text[:half].rsplit(None, 1)[0] + _ELISION + text[-half:].split(None, 1)[-1]
+
+    def save(self):
+        """Write new counts back to the cache file."""
+        if not self.cache_path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        try:
+            with open(self.cache_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = {}
+        with self._lock:
+            stored.setdefault(self.tokenizer, {}).update(self._counts)
+            self._dirty = False
+        with open(f"{self.cache_path}.tmp", "w") as f:
+            json.dump(stored, f)
+        os.replace(f"{self.cache_path}.tmp", self.cache_path)
+
+
+class TokenBudget:
+    """Per-request prompt budgeting: context truncation plus a pre-flight spend and runtime estimate."""
+
+    def __init__(self, counter: Optional[TokenCounter] = None, max_context_tokens: Optional[int] = None,
+                 policy: str = "head", prices: Optional[Dict[str, Tuple[float, float]]] = None,
+                 expected_output_tokens: int = 150, base_latency: float = 1.0, output_tokens_per_second: float = 50.0):
+        if policy not in TRUNCATION_POLICIES:
+            raise ValueError(f"Unknown truncation policy: {policy}")
+        self.counter = counter or TokenCounter()
+        self.max_context_tokens = max_context_tokens
+        self.policy = policy
+        self.prices = dict(MODEL_PRICES)
+        self.prices.update(prices or {})
+        self.expected_output_tokens = expected_output_tokens
+        self.base_latency = base_latency
+        self.output_tokens_per_second = output_tokens_per_second
+        self.truncated = 0
+        self.tokens_removed = 0
+
+    def fit(self, text: str) -> str:
+        """Apply the truncation policy to one context."""
+        if not self.max_context_tokens or self.policy == "none":
+            return text
+        before = self.counter.count(text)
+        if before <= self.max_context_tokens:
+            return text
+        fitted = self.counter.truncate(text, self.max_context_tokens, self.policy)
+        self.truncated += 1
+        self.tokens_removed += before - self.counter.count(fitted)
+        return fitted
+
+    def estimate(self, plan, rate_limiter, in_flight_limits: Dict[str, int],
+                 fan_out: Optional[Callable[[Any], Tuple[int, int]]] = None) -> Dict[str, Any]:
+        """Estimate the spend and wall time of a work plan before sending it.
+
+        Only distinct requests are counted, since the response cache serves
+        repeats. `fan_out(request)` gives (completions, requests sent) for a
+        planned request that draws several completions, such as a
+        self-consistency vote: output tokens, cost and latency scale with the
+        completions, input tokens and the request count with the requests
+        sent. Output cost is given both at `expected_output_tokens` per
+        completion and at the max_tokens ceiling. Runtime is the slower of
+        the concurrency bound (requests x latency / in-flight limit per
+        provider) and each model's requests- and tokens-per-minute budget.
+        """
+        unique = {}
+        for request in plan:
+            counts = fan_out(request) if fan_out else (1, 1)
+            unique.setdefault((request.request_hash, counts), (request, counts))
+
+        by_model = {}
+        latency_by_provider = {}
+        for request, (completions, sent) in unique.values():
+            output_tokens = min(self.expected_output_tokens, request.max_tokens)
+            entry = by_model.setdefault((request.provider, request.resolved_model), {
+                "requests": 0, "input_tokens": 0, "expected_output_tokens": 0, "max_output_tokens": 0
+            })
+            entry["requests"] += sent
+            entry["input_tokens"] += request.estimated_input_tokens * sent
+            entry["expected_output_tokens"] += output_tokens * completions
+            entry["max_output_tokens"] += request.max_tokens * completions
+            latency_by_provider[request.provider] = latency_by_provider.get(request.provider, 0.0) + completions * (
+                self.base_latency + output_tokens / self.output_tokens_per_second
+            )
+
+        models, unpriced = {}, []
+        runtime = max((seconds / max(1, in_flight_limits.get(provider, 1))
+                       for provider, seconds in latency_by_provider.items()), default=0.0)
+        total = {"requests": 0, "input_tokens": 0, "expected_cost_usd": 0.0, "max_cost_usd": 0.0}
+        for (provider, model), entry in by_model.items():
+            input_price, output_price = self.prices.get(model, (None, None))
+            if input_price is None:
+                unpriced.append(model)
+                input_price = output_price = 0.0
+            entry["expected_cost_usd"] = round((entry["input_tokens"] * input_price
+                                                + entry["expected_output_tokens"] * output_price) / 1e6, 4)
+            entry["max_cost_usd"] = round((entry["input_tokens"] * input_price
+                                           + entry["max_output_tokens"] * output_price) / 1e6, 4)
+            limits = rate_limiter.limits_for(provider, model)
+            rate_bound = 60 * max(entry["requests"] / limits["rpm"],
+                                  (entry["input_tokens"] + entry["expected_output_tokens"]) / limits["tpm"])
+            runtime = max(runtime, rate_bound)
+            models[model] = entry
+            for key in total:
+                total[key] += entry[key]
+
+        return {
+            "tokenizer": self.counter.tokenizer,
+            "by_model": models,
+            "total": {**total, "expected_cost_usd": round(total["expected_cost_usd"], 4),
+                      "max_cost_usd": round(total["max_cost_usd"], 4)},
+            "estimated_runtime_seconds": round(runtime, 1),
+            "unpriced_models": unpriced,
+            "truncated_contexts": self.truncated,
+            "truncated_tokens": self.tokens_removed
+        }
+
+
+def parse_prices(values: Optional[List[str]]) -> Dict[str, Tuple[float, float]]:
+    """Parse `model=INPUT/OUTPUT` USD-per-million-token values."""
+    prices = {}
+    for value in values or []:
+        model, _, price = value.partition("=")
+        input_price, _, output_price = price.partition("/")
+        if not input_price or not output_price:
+            raise ValueError(f"Expected model=INPUT/OUTPUT, got: {value}")
+        prices[model.strip()] = (float(input_price), float(output_price))
+    return prices
+
+
+def add_token_budget_arguments(parser):
+    """Add the prompt budgeting and spend estimate flags to an argparse parser."""
+    group = parser.add_argument_group("token budget")
+    group.add_argument("--max-context-tokens", type=int, default=None,
+                       help="Truncate task contexts (articles, passages) longer than this many tokens")
+    group.add_argument("--truncation", choices=TRUNCATION_POLICIES, default="head",
+                       help="Keep the start of an over-long context (head, default) or its start and end (head_tail)")
+    group.add_argument("--max-spend", type=float, default=None, metavar="USD",
+                       help="Do not start a sweep whose estimated cost exceeds this many dollars")
+    group.add_argument("--price", action="append", metavar="MODEL=INPUT/OUTPUT",
+                       help="USD per million input/output tokens for a model (repeatable)")
+    group.add_argument("--expected-output-tokens", type=int, default=150,
+                       help="Typical completion length used for cost and runtime estimates (default: 150)")
+    return group
+
+
+def budget_from_args(args) -> TokenBudget:
+    return TokenBudget(max_context_tokens=args.max_context_tokens, policy=args.truncation,
+                       prices=parse_prices(args.price), expected_output_tokens=args.expected_output_tokens)
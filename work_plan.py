@@ -0,0 +1,132 @@
+import json
+import hashlib
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+from response_cache import request_key
+from sweep_engine import WorkUnit
+
+logger = logging.getLogger(__name__)
+
+
+def _freeze_messages(messages: List[Dict[str, Any]]) -> Tuple[Tuple[Tuple[str, Any], ...], ...]:
+    return tuple(tuple(sorted(message.items())) for message in messages)
+
+
+def prompt_hash(messages: List[Dict[str, Any]]) -> str:
+    """Stable hash of the rendered messages alone."""
+    canonical = json.dumps(messages, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class PlannedRequest:
+    """A fully rendered request for one work unit."""
+    unit: WorkUnit
+    provider: str
+    resolved_model: str
+    frozen_messages: Tuple[Tuple[Tuple[str, Any], ...], ...]
+    max_tokens: int
+    prompt_hash: str
+    request_hash: str
+    estimated_input_tokens: int
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        """The messages as the mutable list of dicts the SDKs expect."""
+        return [dict(message) for message in self.frozen_messages]
+
+
+class WorkPlan:
+    """Immutable, pre-rendered list of every request in a sweep.
+
+    Renderings are interned by prompt hash, so identical prompts across models
+    and techniques share one frozen message tuple. The request hash matches
+    the response cache key, so requests that resolve to the same model and
+    payload (e.g. aliased model labels) are visible before anything is sent.
+    """
+
+    def __init__(self, requests: Iterable[PlannedRequest]):
+        self.requests = tuple(requests)
+        self._by_unit = {request.unit: request for request in self.requests}
+
+    @classmethod
+    def build(cls, entries: Iterable[Tuple[WorkUnit, str, str, List[Dict[str, Any]], int]],
+              token_counter=None) -> "WorkPlan":
+        """Build a plan from (unit, provider, resolved_model, messages, max_tokens) entries.
+
+        `token_counter(messages)` estimates prompt tokens; defaults to ~4 characters per token.
+        """
+        if token_counter is None:
+            token_counter = lambda messages: sum(len(str(m.get("content", ""))) for m in messages) // 4
+        renderings = {}
+        token_counts = {}
+        requests = []
+        for unit, provider, resolved_model, messages, max_tokens in entries:
+            digest = prompt_hash(messages)
+            frozen = renderings.get(digest)
+            if frozen is None:
+                frozen = renderings[digest] = _freeze_messages(messages)
+                token_counts[digest] = token_counter(messages)
+            requests.append(PlannedRequest(
+                unit=unit,
+                provider=provider,
+                resolved_model=resolved_model,
+                frozen_messages=frozen,
+                max_tokens=max_tokens,
+                prompt_hash=digest,
+                request_hash=request_key(provider, resolved_model, messages, temperature=0, max_tokens=max_tokens),
+                estimated_input_tokens=token_counts[digest]
+            ))
+        return cls(requests)
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def __iter__(self):
+        return iter(self.requests)
+
+    def get(self, unit: WorkUnit) -> PlannedRequest:
+        return self._by_unit[unit]
+
+    def units(self) -> List[WorkUnit]:
+        return [request.unit for request in self.requests]
+
+    def fingerprint(self) -> str:
+        """Hash of every unit and its request; equal on any machine that builds the same sweep."""
+        digest = hashlib.sha256()
+        for request in sorted(self.requests, key=lambda r: (r.unit.model, r.unit.task, r.unit.technique, r.unit.item_index)):
+            unit = request.unit
+            digest.update(f"{unit.model}|{unit.task}|{unit.technique}|{unit.item_index}|{request.request_hash}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def shard(self, index: int, count: int) -> "WorkPlan":
+        """The requests of shard `index` (0-based) out of `count`.
+
+        Requests are assigned by request hash, so the split is the same on
+        every machine and units sharing a request (aliased models) land in
+        the same shard, where the response cache still deduplicates them.
+        """
+        return WorkPlan(r for r in self.requests if int(r.request_hash[:16], 16) % count == index)
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts and estimated token volume, for inspection before a run."""
+        unique_requests = {}
+        for request in self.requests:
+            unique_requests.setdefault(request.request_hash, request)
+        return {
+            "work_units": len(self.requests),
+            "unique_prompts": len({request.prompt_hash for request in self.requests}),
+            "unique_requests": len(unique_requests),
+            "estimated_input_tokens": sum(r.estimated_input_tokens for r in self.requests),
+            "estimated_unique_input_tokens": sum(r.estimated_input_tokens for r in unique_requests.values()),
+            "max_output_tokens": sum(r.max_tokens for r in self.requests),
+            "by_model": dict(Counter(r.unit.model for r in self.requests)),
+            "by_task": dict(Counter(r.unit.task for r in self.requests)),
+            "by_technique": dict(Counter(r.unit.technique for r in self.requests))
+        }
+
+    def log_summary(self):
+        logger.info(f"Work plan: {json.dumps(self.summary(), indent=2)}")